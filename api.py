@@ -0,0 +1,207 @@
+"""HTTP API for the query generator and the Query Library.
+
+Example:
+    python api.py --backend stub --port 8000
+
+Endpoints (JSON in, JSON out):
+    POST   /generate         {"description"} -> {"query", "explanation"}
+    POST   /generate/stream  {"description"} -> newline-delimited JSON events:
+                             {"query": ...}, then {"explanation": <chunk>}...
+    GET    /queries          ?q=<search>&limit=&offset=  or  ?before_id=&limit=
+    POST   /queries          {"description", "query", "explanation"} -> {"id"}
+    DELETE /queries/{id}
+
+The service uses the same generation, cache, validation and storage code as
+the Streamlit app.  Model and SQLite calls are blocking, so they run on a
+thread pool and the event loop stays free to serve other requests.
+"""
+import argparse
+import json
+import os
+import sqlite3
+import sys
+
+from starlette.applications import Starlette
+from starlette.concurrency import iterate_in_threadpool, run_in_threadpool
+from starlette.responses import JSONResponse, Response, StreamingResponse
+from starlette.routing import Route
+
+import db
+from backends import create_backend, GEMINI_MODEL
+from cache import ResponseCache, CACHE_FILE
+from coalesce import CoalescingBackend, ModelGate, ModelBusyError
+from generator import (
+    build_prompt, generate_query_and_explanation, stream_query_and_explanation, EXPLAIN_QUERY_TEMPLATE,
+    TEMPLATE_VERSION, PROMPT_TOKEN_BUDGET
+)
+from validation import repair_query
+
+MAX_PAGE_SIZE = 100
+
+
+class ApiError(Exception):
+    def __init__(self, status, message):
+        super().__init__(message)
+        self.status = status
+
+
+def create_app(backend, db_path=db.DB_FILE, cache=None, prompt_budget=PROMPT_TOKEN_BUDGET):
+    """Build the API around a model backend, a queries database and an optional response cache.
+
+    prompt_budget caps the tokens of user input each prompt carries.
+    """
+
+    def generate_pair(description):
+        def generate():
+            query, explanation = generate_query_and_explanation(backend.generate, description, budget=prompt_budget)
+            query, _ = repair_query(query, backend.generate, None, description, prompt_budget)
+            return json.dumps([query, explanation])
+        if cache is None:
+            return json.loads(generate())
+        return json.loads(
+            cache.get_or_generate(description, backend.model_name, f"pair-{TEMPLATE_VERSION}", generate)
+        )
+
+    async def generate(request):
+        description = await read_description(request)
+        query, explanation = await run_in_threadpool(generate_pair, description)
+        return JSONResponse({"query": query, "explanation": explanation})
+
+    async def generate_stream(request):
+        description = await read_description(request)
+
+        def events():
+            query, explanation = stream_query_and_explanation(backend.stream, description, budget=prompt_budget)
+            repaired, _ = repair_query(query, backend.generate, None, description, prompt_budget)
+            if repaired != query:
+                # The streamed explanation describes the broken query; explain the fix instead
+                query, explanation = repaired, backend.stream(
+                    build_prompt(EXPLAIN_QUERY_TEMPLATE, prompt_budget, query=repaired)
+                )
+            yield json.dumps({"query": query}) + "\n"
+            for chunk in explanation:
+                yield json.dumps({"explanation": chunk}) + "\n"
+
+        return StreamingResponse(iterate_in_threadpool(events()), media_type="application/x-ndjson")
+
+    async def list_queries(request):
+        params = request.query_params
+        limit = min(int_param(params, "limit", 20), MAX_PAGE_SIZE)
+        if params.get("q", "").strip():
+            rows = await run_in_threadpool(
+                db.search_queries, params["q"], limit, int_param(params, "offset", 0), db_path
+            )
+        else:
+            before_id = int_param(params, "before_id", None)
+            rows = await run_in_threadpool(db.list_queries, before_id, limit, db_path)
+        return JSONResponse({"queries": [
+            {"id": query_id, "description": description, "query": query, "timestamp": timestamp}
+            for query_id, description, query, timestamp in rows
+        ]})
+
+    async def save_query(request):
+        body = await read_json(request)
+        if not isinstance(body.get("query"), str) or not body["query"].strip():
+            raise ApiError(400, '"query" is required.')
+        query_id = await run_in_threadpool(
+            db.save_query,
+            str(body.get("description", "")), body["query"], str(body.get("explanation", "")), db_path
+        )
+        return JSONResponse({"id": query_id}, status_code=201)
+
+    async def delete_query(request):
+        try:
+            query_id = int(request.path_params["query_id"])
+        except ValueError:
+            raise ApiError(404, "No such query.") from None
+        if not await run_in_threadpool(db.delete_query, query_id, db_path):
+            raise ApiError(404, "No such query.")
+        return Response(status_code=204)
+
+    async def handle_error(request, exc):
+        if isinstance(exc, ApiError):
+            return JSONResponse({"error": str(exc)}, status_code=exc.status)
+        if isinstance(exc, ModelBusyError):
+            return JSONResponse({"error": str(exc)}, status_code=503, headers={"Retry-After": "5"})
+        if isinstance(exc, sqlite3.Error):
+            return JSONResponse({"error": f"Database error: {exc}"}, status_code=500)
+        return JSONResponse({"error": f"An error occurred: {exc}"}, status_code=500)
+
+    db.init_db(db_path)
+    return Starlette(
+        routes=[
+            Route("/generate", generate, methods=["POST"]),
+            Route("/generate/stream", generate_stream, methods=["POST"]),
+            Route("/queries", list_queries, methods=["GET"]),
+            Route("/queries", save_query, methods=["POST"]),
+            Route("/queries/{query_id}", delete_query, methods=["DELETE"]),
+        ],
+        exception_handlers={Exception: handle_error, ApiError: handle_error, ModelBusyError: handle_error},
+    )
+
+
+async def read_json(request):
+    try:
+        body = await request.json()
+    except ValueError:
+        raise ApiError(400, "The request body must be JSON.") from None
+    if not isinstance(body, dict):
+        raise ApiError(400, "The request body must be a JSON object.")
+    return body
+
+
+async def read_description(request):
+    description = (await read_json(request)).get("description")
+    if not isinstance(description, str) or not description.strip():
+        raise ApiError(400, '"description" is required.')
+    return description
+
+
+def int_param(params, name, default):
+    value = params.get(name)
+    if value is None or value == "":
+        return default
+    try:
+        return int(value)
+    except ValueError:
+        raise ApiError(400, f'"{name}" must be an integer.') from None
+
+
+def main(argv=None):
+    import uvicorn
+
+    parser = argparse.ArgumentParser(description="Serve the SQL query generator over HTTP.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8000)
+    parser.add_argument("--db", default=db.DB_FILE, help="database to read and save queries")
+    parser.add_argument("--backend", choices=["gemini", "http", "stub"], default="gemini",
+                        help="model backend to generate with")
+    parser.add_argument("--model", default=GEMINI_MODEL, help="Gemini model name")
+    parser.add_argument("--endpoint", help="endpoint URL for the http backend")
+    parser.add_argument("--stub-latency", type=float, default=0.0, help="seconds per stub response")
+    parser.add_argument("--rate", type=float, default=1.0, help="maximum model calls per second")
+    parser.add_argument("--max-concurrent", type=int, default=4, help="maximum model calls in flight")
+    parser.add_argument("--no-cache", action="store_true", help="bypass the response cache")
+    parser.add_argument("--prompt-budget", type=int, default=PROMPT_TOKEN_BUDGET,
+                        help="maximum tokens of user input per prompt; longer input is shortened")
+    args = parser.parse_args(argv)
+
+    # GOOGLE_API_KEY for Gemini, MODEL_API_KEY for a custom HTTP endpoint
+    api_key = os.environ.get("GOOGLE_API_KEY" if args.backend == "gemini" else "MODEL_API_KEY")
+    if args.backend == "gemini" and not api_key:
+        parser.error("set GOOGLE_API_KEY to your Google API key")
+    if args.backend == "http" and not args.endpoint:
+        parser.error("--endpoint is required with --backend http")
+    backend = create_backend(
+        args.backend, model_name=args.model, api_key=api_key, endpoint=args.endpoint, latency=args.stub_latency
+    )
+    if args.backend != "stub":
+        backend = CoalescingBackend(backend, ModelGate(rate=args.rate, max_concurrent=args.max_concurrent))
+
+    app = create_app(backend, args.db, None if args.no_cache else ResponseCache(CACHE_FILE), args.prompt_budget)
+    uvicorn.run(app, host=args.host, port=args.port, log_level="warning")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
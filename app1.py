@@ -1,8 +1,25 @@
 import streamlit as st
 import sqlite3
 from datetime import datetime
-import google.generativeai as genai
-import os
+import json
+import time
+import db
+import executor
+import maintenance
+import metrics
+import schema_digest
+import transpile
+from backends import create_backend
+from cache import ResponseCache, CACHE_FILE
+from coalesce import CoalescingBackend, ModelGate, ModelBusyError
+from library_cache import LibraryCache
+from similarity import build_index
+from generator import (
+    stream_query_and_explanation, generate_candidates, ExplanationPrefetcher, QUERY_TEMPLATE, EXPLAIN_QUERY_TEMPLATE,
+    with_schema, TEMPLATE_VERSION, PROMPT_TOKEN_BUDGET, build_prompt as format_prompt
+)
+from ranking import rank_queries
+from validation import validate_sql, repair_query, extract_sql
 
 # Configure Streamlit page 
 st.set_page_config(
@@ -95,67 +112,718 @@ st.markdown("""
 </style>
 """, unsafe_allow_html=True)
 
-# Configure API Key
-api_key = st.secrets["general"]["google_api_key"]
-genai.configure(api_key=api_key)
-model = genai.GenerativeModel("models/gemini-1.5-pro")
+# Models offered on the Settings page and the backend kind and model name behind each
+MODEL_CHOICES = {
+    "Gemini Pro": ("gemini", "models/gemini-1.5-pro"),
+    "Gemini Pro Vision": ("gemini", "models/gemini-pro-vision"),
+    "Custom Model": ("http", None),
+    "Offline Stub": ("stub", None),
+}
+
+# Limits shared by every session of the process
+MODEL_CALLS_PER_SECOND = 1.0
+MAX_CONCURRENT_MODEL_CALLS = 4
+
+@st.cache_resource
+def load_backend(model_type, custom_endpoint, custom_api_key, stub_latency, max_output_tokens=None):
+    """Build (once per process and configuration) the backend for a Settings model choice."""
+    kind, model_name = MODEL_CHOICES[model_type]
+    # Secrets are only read, and the model SDK only imported, once a model is actually used
+    api_key = None
+    if kind == "gemini":
+        api_key = st.secrets["general"]["google_api_key"]
+    elif kind == "http":
+        api_key = custom_api_key
+    backend = create_backend(
+        kind,
+        model_name=model_name,
+        api_key=api_key,
+        endpoint=custom_endpoint,
+        latency=stub_latency,
+        max_output_tokens=max_output_tokens
+    )
+    backend = metrics.InstrumentedBackend(backend, metrics.get_recorder())
+    if kind == "stub":
+        return backend
+    # Sessions share in-flight identical prompts and one rate limit per process
+    return CoalescingBackend(backend, get_model_gate())
+
+@st.cache_resource
+def get_model_gate():
+    """Process-wide concurrency bound, rate limit and retry policy for real model calls."""
+    return ModelGate(rate=MODEL_CALLS_PER_SECOND, max_concurrent=MAX_CONCURRENT_MODEL_CALLS)
+
+def get_backend(capped=True):
+    """Return the model backend selected on the Settings page.
+
+    Responses are capped at the Settings response length unless capped is
+    False, for structured (JSON) responses that are useless when cut off.
+    """
+    settings = st.session_state["settings"]
+    return load_backend(
+        settings["model_type"], settings["custom_endpoint"], settings["custom_api_key"], settings["stub_latency"],
+        settings["max_output_tokens"] if capped else None
+    )
+
+@st.cache_resource
+def get_response_cache():
+    """Process-wide prompt/response cache shared by all sessions."""
+    recorder = metrics.get_recorder()
+    return ResponseCache(
+        CACHE_FILE,
+        on_lookup=lambda hit, duration_ms: recorder.record("cache.lookup", duration_ms, "hit" if hit else "miss")
+    )
+
+def timed(name):
+    """Record the enclosed block as a timing span on the Performance page."""
+    return metrics.get_recorder().span(name)
+
+def record_render(name, started):
+    """Record how long a page or fragment took to render."""
+    metrics.get_recorder().record(f"render.{name}", (time.perf_counter() - started) * 1000)
+
+def prompt_budget():
+    """Tokens of user input a prompt may carry, from the Settings page."""
+    return st.session_state["settings"]["prompt_token_budget"]
+
+def build_prompt(template, budget, **values):
+    """Format a prompt template within a token budget, timed as a prompt.build span with its size."""
+    with timed("prompt.build") as span:
+        span.prompt = format_prompt(template, budget, **values)
+        return span.prompt
+
+def get_schema():
+    """The schema digest loaded on the generator page, or None."""
+    return st.session_state.get("schema_digest")
+
+def schema_for(description):
+    """Digest text of the loaded schema, trimmed to the tables relevant to a description."""
+    digest = get_schema()
+    return digest.render(description) if digest else ""
+
+def cache_version(kind):
+    """Response cache version for a prompt kind; answers grounded in a schema are cached per schema."""
+    digest = get_schema()
+    version = f"{kind}-{TEMPLATE_VERSION}"
+    return f"{version}-{digest.schema_hash[:16]}" if digest else version
+
+def get_cached_pair(backend, description):
+    """Return a cached (query, explanation) pair for a description, or None."""
+    cached = get_response_cache().get(description, backend.model_name, cache_version("pair"))
+    return tuple(json.loads(cached)) if cached else None
+
+def cache_pair(backend, description, query, explanation):
+    """Store a generated (query, explanation) pair in the response cache."""
+    get_response_cache().put(
+        description, backend.model_name, cache_version("pair"), json.dumps([query, explanation])
+    )
+
+def generate_query_only(backend, description):
+    """Generate just the SQL for a description, served from the response cache when possible."""
+    budget = prompt_budget()
+    def generate():
+        prompt = build_prompt(QUERY_TEMPLATE, budget, description=description)
+        return checked_query(
+            backend, description, backend.generate(with_schema(prompt, schema_for(description))), budget
+        )
+    return get_response_cache().get_or_generate(
+        description, backend.model_name, cache_version("query"), generate
+    )
+
+def generate_ranked_query(backend, description):
+    """Generate candidate queries in one model call and rank them by their plans on the loaded schema.
+
+    Returns the best candidate (repaired when none validates) and the ranking, best first.
+    """
+    count = st.session_state["settings"]["query_candidates"]
+    budget = prompt_budget()
+    # Several queries in one JSON object outgrow the response cap, and a cut-off object parses to nothing
+    structured = get_backend(capped=False)
+    def generate():
+        return json.dumps(generate_candidates(structured.generate, description, count, schema_for(description), budget))
+    candidates = json.loads(get_response_cache().get_or_generate(
+        description, structured.model_name, cache_version(f"candidates{count}"), generate
+    ))
+    if not candidates:
+        return generate_query_only(backend, description), []
+    with timed("rank"):
+        ranking = rank_queries(candidates, get_schema())
+    return checked_query(backend, description, ranking[0]["query"], budget), ranking
+
+def show_ranking(ranking, chosen):
+    """Table of candidate queries ranked by their local query plans, marking the one shown."""
+    st.subheader("Candidate Ranking")
+    st.dataframe(
+        [{"Rank": rank, "Chosen": "✓" if entry["query"] == chosen else "",
+          "Query": " ".join(entry["query"].split()),
+          "Full Scans": entry["full_scans"], "Est. Cost": entry["cost"],
+          "Plan": f"Invalid: {entry['error']}" if entry["error"] else "; ".join(entry["plan"])}
+         for rank, entry in enumerate(ranking, 1)],
+        hide_index=True
+    )
+    if all(entry["query"] != chosen for entry in ranking):
+        st.caption("No candidate passed validation, so the best one was repaired.")
+    st.caption("Planned with EXPLAIN QUERY PLAN on the loaded schema; the cost is estimated from the plan's shape.")
+
+def checked_query(backend, description, response, budget):
+    """Extract the SQL from a response and validate it, asking the model once to repair it on failure."""
+    with timed("validate"):
+        query, _ = repair_query(response, backend.generate, get_schema(), description, budget)
+    return query
+
+def validation_error(query):
+    """Why a query fails validation against the loaded schema, or None (results are cached)."""
+    with timed("validate"):
+        return validate_sql(query, get_schema())
+
+def explain_query(query, backend, budget=PROMPT_TOKEN_BUDGET):
+    """Explain a generated query, served from the response cache when possible."""
+    return get_response_cache().get_or_generate(
+        query,
+        backend.model_name,
+        f"explain-{TEMPLATE_VERSION}",
+        lambda: backend.generate(build_prompt(EXPLAIN_QUERY_TEMPLATE, budget, query=query))
+    )
+
+@st.cache_resource
+def get_explanations():
+    """Process-wide memo of explanations, generated lazily on a bounded thread pool."""
+    return ExplanationPrefetcher(explain_query)
+
+# Explanation modes offered on the Settings page
+EXPLANATION_ON_DEMAND = "On demand"
+EXPLANATION_PREFETCH = "Background prefetch"
+EXPLANATION_STREAMED = "Streamed with query"
+EXPLANATION_MODES = [EXPLANATION_ON_DEMAND, EXPLANATION_PREFETCH, EXPLANATION_STREAMED]
+
+DEFAULT_SETTINGS = {
+    "explanation_mode": EXPLANATION_ON_DEMAND,
+    "model_type": "Gemini Pro",
+    "custom_api_key": "",
+    "custom_endpoint": "",
+    "stub_latency": 0.0,
+    "run_database": "",
+    "run_max_rows": executor.MAX_ROWS,
+    "run_timeout": executor.TIMEOUT_SECONDS,
+    "max_output_tokens": 500,
+    "prompt_token_budget": PROMPT_TOKEN_BUDGET,
+    "query_candidates": 1,
+}
+
+# Minimum similarity for reusing a saved query instead of calling the model
+SIMILARITY_THRESHOLD = 0.8
+
+# Number of saved queries shown per Query Library page
+LIBRARY_PAGE_SIZE = 20
+LIBRARY_SORTS = ("Newest", "Most used")
+
+# Queries are shown as generated or rewritten locally for one of these dialects
+AS_GENERATED = "As generated"
+DIALECT_CHOICES = [AS_GENERATED, *transpile.DIALECTS]
 
-# Initialize the database
-DB_FILE = "queries.db"
+# Rows per page of a query result preview
+RESULT_PAGE_SIZE = 50
+
+# Time windows offered on the Performance page, in seconds
+PERFORMANCE_WINDOWS = {
+    "Last hour": 3600,
+    "Last 24 hours": 24 * 3600,
+    "Last 7 days": 7 * 24 * 3600,
+    "Last 30 days": 30 * 24 * 3600,
+}
 
 def init_db():
     """Initialize the database and create a table if it doesn't exist."""
     try:
-        with sqlite3.connect(DB_FILE) as conn:
-            conn.execute("""
-            CREATE TABLE IF NOT EXISTS queries (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                description TEXT NOT NULL,
-                query TEXT NOT NULL,
-                explanation TEXT NOT NULL,
-                timestamp TEXT NOT NULL
-            )
-            """)
-            conn.commit()
+        db.init_db()
     except Exception as e:
         st.error(f"Error initializing database: {e}")
 
+@st.cache_resource
+def get_library_cache():
+    """Process-wide cache of Query Library reads, invalidated by the writes below."""
+    return LibraryCache()
+
+@st.cache_resource
+def get_built_indexes():
+    """Similarity indexes built so far in this process (see get_similarity_index)."""
+    return []
+
+@st.cache_resource
+def get_maintainer():
+    """Process-wide background retention and compaction of queries.db."""
+    library = get_library_cache()
+    # Started on every page, so it must not build the similarity index; one built later reads no deleted rows
+    indexes = get_built_indexes()
+    def forget(query_ids):
+        # Deleted queries must not be reused or listed; a pass can delete thousands, so drop every cached page
+        for index in list(indexes):
+            for query_id in query_ids:
+                index.remove(query_id)
+        library.clear()
+    return maintenance.Maintainer(on_delete=forget).start()
+
 def save_query(description, query, explanation):
     """Save a query, its description, and explanation to the database."""
     try:
-        with sqlite3.connect(DB_FILE) as conn:
-            conn.execute(
-                "INSERT INTO queries (description, query, explanation, timestamp) VALUES (?, ?, ?, ?)", 
-                (description, query, explanation, datetime.now())
-            )
-            conn.commit()
+        with timed("db.save"):
+            query_id, existed = db.upsert_query(description, query, explanation)
+        get_similarity_index().add(query_id, description)
+        get_library_cache().saved(query_id)
+        if existed:
+            # Saving again may have filled in an explanation that was cached as missing
+            get_library_cache().explanation_updated(query_id)
+        return query_id
     except Exception as e:
         st.error(f"Error saving query: {e}")
 
-def get_saved_queries():
-    """Retrieve all saved queries from the database."""
+def save_explanation_when_ready(query_id, query, backend):
+    """Store the explanation of a saved query once its background generation finishes."""
+    library = get_library_cache()
+    def on_done(future):
+        if future.exception() is None:
+            with timed("db.update_explanation"):
+                db.update_explanation(query_id, future.result())
+            library.explanation_updated(query_id)
+    get_explanations().submit(query, backend, prompt_budget()).add_done_callback(on_done)
+
+def list_library(before_id, limit):
+    """Retrieve one page of saved queries, newest first."""
+    def load():
+        with timed("db.list"):
+            return db.list_queries(before_id, limit)
+    try:
+        return get_library_cache().list_page(before_id, limit, load)
+    except sqlite3.OperationalError as e:
+        st.error(f"Database error: {e}")
+        return []
+
+def list_popular_library(cursor, limit):
+    """Retrieve one page of saved queries, most used first."""
+    def load():
+        with timed("db.list_popular"):
+            return db.list_popular_queries(cursor, limit)
+    try:
+        return get_library_cache().popular_page(cursor, limit, load)
+    except sqlite3.OperationalError as e:
+        st.error(f"Database error: {e}")
+        return []
+
+def record_use(query_id):
+    """Count a reuse of a saved query towards its popularity."""
+    try:
+        with timed("db.record_use"):
+            db.record_use(query_id)
+        get_library_cache().used(query_id)
+    except sqlite3.Error as e:
+        st.warning(f"Could not update the query's use count: {e}")
+
+def dialect_selector(key):
+    """SQL dialect picker; the choice carries over between pages."""
+    current = st.session_state.get("sql_dialect", AS_GENERATED)
+    dialect = st.selectbox(
+        "SQL Dialect", DIALECT_CHOICES, index=DIALECT_CHOICES.index(current), key=key,
+        help="Queries are rewritten locally for the chosen database, without asking the model again"
+    )
+    st.session_state["sql_dialect"] = dialect
+    return dialect
+
+def rewrite_query(query, dialect):
+    """The query rewritten for a dialect, timed as a transpile span; raises TranspileError."""
+    with timed("transpile"):
+        return transpile.transpile(query, dialect)
+
+def untranslated(query, dialect, error):
+    """Fall back to the query as generated, saying why it was not rewritten."""
+    st.warning(f"Shown as generated, not in {dialect}: {error}")
+    return query
+
+def in_dialect(query, dialect):
+    """The query rewritten for a dialect, or as generated with a warning when it cannot be."""
+    if dialect == AS_GENERATED:
+        return query
+    try:
+        return rewrite_query(query, dialect)
+    except transpile.TranspileError as e:
+        return untranslated(query, dialect, e)
+
+def library_variant(query_id, query, dialect):
+    """A saved query in a dialect, cached per saved query."""
+    if dialect == AS_GENERATED:
+        return query
+    try:
+        return get_library_cache().variant(query_id, dialect, lambda: rewrite_query(query, dialect))
+    except transpile.TranspileError as e:
+        return untranslated(query, dialect, e)
+
+def search_library(text, limit, offset):
+    """Full-text search over the saved queries, best matches first."""
+    def load():
+        with timed("db.search"):
+            return db.search_queries(text, limit, offset)
     try:
-        if not os.path.exists(DB_FILE):
-            return []
-
-        with sqlite3.connect(DB_FILE) as conn:
-            queries = conn.execute(
-                "SELECT id, description, query, explanation, timestamp FROM queries"
-            ).fetchall()
-            return queries
+        return get_library_cache().search_page(text, limit, offset, load)
     except sqlite3.OperationalError as e:
         st.error(f"Database error: {e}")
         return []
 
+def get_explanation(query_id):
+    """Retrieve the explanation of a saved query."""
+    def load():
+        with timed("db.read_explanation"):
+            return db.get_explanation(query_id)
+    try:
+        return get_library_cache().explanation(query_id, load)
+    except sqlite3.OperationalError as e:
+        st.error(f"Database error: {e}")
+        return None
+
+def get_query(query_id):
+    """Retrieve a single saved query by ID."""
+    try:
+        with timed("db.read_query"):
+            return db.get_query(query_id)
+    except sqlite3.OperationalError as e:
+        st.error(f"Database error: {e}")
+        return None
+
+@st.cache_resource
+def get_similarity_index():
+    """Process-wide similarity index over saved query descriptions."""
+    init_db()
+    index = build_index(db.get_descriptions())
+    get_built_indexes().append(index)
+    return index
+
+def find_similar_query(description):
+    """Return (saved query row, score) for a near-duplicate description, or None."""
+    with timed("similarity.lookup"):
+        match = get_similarity_index().lookup(description, threshold=SIMILARITY_THRESHOLD)
+    if match is None:
+        return None
+    row = get_query(match[0])
+    return (row, match[1]) if row else None
+
 def delete_query(query_id):
-    """Delete a query from the database by ID."""
+    """Delete a query from the database by ID.
+
+    Runs as a button callback, so the outcome is shown by the next library
+    render rather than from inside the callback.
+    """
     try:
-        with sqlite3.connect(DB_FILE) as conn:
-            conn.execute("DELETE FROM queries WHERE id = ?", (query_id,))
-            conn.commit()
-            st.success("Query deleted successfully!")
+        with timed("db.delete"):
+            db.delete_query(query_id)
+        get_similarity_index().remove(query_id)
+        get_library_cache().deleted(query_id)
+        st.session_state["library_notice"] = ("success", "Query deleted successfully!")
     except Exception as e:
-        st.error(f"Error deleting query: {e}")
+        st.session_state["library_notice"] = ("error", f"Error deleting query: {e}")
+
+def execute_query(query):
+    """Run a query read-only against the database configured in Settings."""
+    settings = st.session_state["settings"]
+    if not settings["run_database"]:
+        st.warning("Set the database to run queries against on the Settings page.")
+        return None
+    try:
+        with timed("db.run_query"):
+            return executor.run_query(
+                settings["run_database"], query, settings["run_max_rows"], settings["run_timeout"]
+            )
+    except (sqlite3.Error, TimeoutError) as e:
+        st.error(f"Error running query: {e}")
+        return None
+
+def show_result(result, key):
+    """Display a query result preview one page at a time."""
+    if not result.columns:
+        st.caption(f"Statement ran in {result.elapsed * 1000:.0f} ms and returned no rows.")
+        return
+    summary = f"{result.row_count} rows in {result.elapsed * 1000:.0f} ms"
+    if result.truncated:
+        summary += f" (stopped at the {result.row_count}-row limit)"
+    pages = max(1, -(-result.row_count // RESULT_PAGE_SIZE))
+    page = 1
+    if pages > 1:
+        page = st.number_input("Result page", min_value=1, max_value=pages, value=1, key=f"{key}_page")
+    st.dataframe(result.page(page - 1, RESULT_PAGE_SIZE))
+    st.caption(summary)
+
+@st.fragment
+def generator_page(settings):
+    """Query Generator page; its widgets rerun only this fragment."""
+    fragment_started = time.perf_counter()
+    st.title("🤖 SQL Query Generator")
+
+    # Optional schema the generated queries must use
+    digest = get_schema()
+    with st.expander(f"🗄️ Database Schema ({len(digest)} tables loaded)" if digest else "🗄️ Database Schema"):
+        schema_path = st.text_input("SQLite database path", placeholder="e.g., data/shop.db")
+        schema_upload = st.file_uploader(
+            "Or upload a DDL file or SQLite database",
+            type=["sql", "ddl", "txt", "db", "sqlite", "sqlite3"]
+        )
+        col_load, col_clear = st.columns(2)
+        if col_load.button("Load Schema"):
+            try:
+                with timed("schema.load"):
+                    if schema_upload is not None:
+                        digest = schema_digest.digest_from_bytes(schema_upload.getvalue())
+                    elif schema_path.strip():
+                        digest = schema_digest.load_digest(schema_path.strip())
+                    else:
+                        digest = None
+                if digest is None:
+                    st.warning("Enter a database path or upload a schema file.")
+                else:
+                    st.session_state["schema_digest"] = digest
+                    st.success(f"Loaded a schema with {len(digest)} tables.")
+            except (OSError, UnicodeDecodeError, ValueError, sqlite3.Error) as e:
+                st.error(f"Could not read the schema: {e}")
+        if digest and col_clear.button("Clear Schema"):
+            st.session_state["schema_digest"] = digest = None
+        if digest:
+            st.code(digest.render(), language="text")
+
+    # Input for query description
+    text_input = st.text_input(
+        "Describe your desired SQL query:", 
+        placeholder="e.g., Select top 5 customers with highest total purchase amount"
+    )
+    if metrics.estimate_tokens(text_input) > prompt_budget():
+        st.caption(
+            f"This description is about {metrics.estimate_tokens(text_input)} tokens; it will be shortened to "
+            f"the prompt budget of {prompt_budget()} tokens set on the Settings page."
+        )
+
+    dialect = dialect_selector("generator_dialect")
+
+    # Generate Query Button
+    streamed = False
+    generate_anyway = st.session_state.pop("generate_anyway", False)
+    if st.button("Generate SQL Query") or generate_anyway:
+        if text_input.strip():
+            try:
+                st.session_state["query_ranking"] = None
+                st.session_state["reused_from"] = None
+                # Reuse a saved query when the description is a near-duplicate
+                # Saved queries are not tied to a schema, so only reuse them without one
+                similar = None if get_schema() or generate_anyway else find_similar_query(text_input)
+                if similar:
+                    (saved_id, saved_description, saved_query, saved_explanation, _), score = similar
+                    st.session_state["generated_query"] = saved_query
+                    st.session_state["query_explanation"] = saved_explanation
+                    st.session_state["reused_from"] = (saved_id, saved_description, score)
+                    record_use(saved_id)
+                elif settings["query_candidates"] > 1 and get_schema():
+                    # Pick the candidate with the best query plan; explanations cannot stream alongside
+                    with st.spinner("Generating candidate queries..."):
+                        query, ranking = generate_ranked_query(get_backend(), text_input)
+                    st.session_state["generated_query"] = query
+                    st.session_state["query_ranking"] = ranking
+                    st.session_state["query_explanation"] = get_explanations().get(query)
+                    if settings["explanation_mode"] != EXPLANATION_ON_DEMAND:
+                        get_explanations().submit(query, get_backend(), prompt_budget())
+                elif settings["explanation_mode"] != EXPLANATION_STREAMED:
+                    # Generate only the SQL; the explanation is produced lazily
+                    with st.spinner("Generating your query..."):
+                        query = generate_query_only(get_backend(), text_input)
+                    st.session_state["generated_query"] = query
+                    st.session_state["query_explanation"] = get_explanations().get(query)
+                    if settings["explanation_mode"] == EXPLANATION_PREFETCH:
+                        get_explanations().submit(query, get_backend(), prompt_budget())
+                elif cached := get_cached_pair(get_backend(), text_input):
+                    st.session_state["generated_query"], st.session_state["query_explanation"] = cached
+                else:
+                    # Show the SQL as soon as it arrives, then stream the explanation
+                    with st.spinner("Generating your query..."):
+                        query, explanation_chunks = stream_query_and_explanation(
+                            get_backend().stream, text_input, schema_for(text_input), prompt_budget()
+                        )
+                    repaired = checked_query(get_backend(), text_input, query, prompt_budget())
+                    if repaired != query:
+                        # The streamed explanation describes the broken query; explain the fix instead
+                        query = repaired
+                        explanation_chunks = get_backend().stream(
+                            build_prompt(EXPLAIN_QUERY_TEMPLATE, prompt_budget(), query=query)
+                        )
+                    st.session_state["generated_query"] = query
+                    st.session_state["query_explanation"] = None
+                    st.session_state["validation_error"] = validation_error(query)
+                    streamed = True
+
+                    st.subheader("Generated SQL Query")
+                    st.code(in_dialect(query, dialect), language='sql')
+                    if st.session_state["validation_error"]:
+                        st.warning(f"This query failed validation: {st.session_state['validation_error']}")
+                    st.subheader("Query Explanation")
+                    explanation = st.write_stream(explanation_chunks)
+                    st.session_state["query_explanation"] = explanation
+                    cache_pair(get_backend(), text_input, query, explanation)
+
+                if not streamed:
+                    st.session_state["validation_error"] = validation_error(st.session_state["generated_query"])
+
+            except ModelBusyError as e:
+                st.warning(str(e))
+            except Exception as e:
+                st.error(f"An error occurred: {e}")
+        else:
+            st.warning("Please enter a description for the SQL query.")
+
+    # Display Results
+    if st.session_state["generated_query"] and not streamed:
+        ranking = st.session_state["query_ranking"]
+        query_column, ranking_column = st.columns([3, 2]) if ranking else (st.container(), None)
+        with query_column:
+            st.subheader("Generated SQL Query")
+            st.code(in_dialect(st.session_state["generated_query"], dialect), language='sql')
+            if st.session_state["validation_error"]:
+                st.warning(f"This query failed validation: {st.session_state['validation_error']}")
+            if st.session_state["reused_from"]:
+                saved_id, saved_description, score = st.session_state["reused_from"]
+                st.info(f'Reused saved query #{saved_id}, saved for "{saved_description}" (similarity {score:.2f}).')
+                # The callback runs before the rerun, so the generate step above picks the flag up
+                st.button(
+                    "Generate Anyway", help="Ask the model for a new query instead",
+                    on_click=lambda: st.session_state.update(generate_anyway=True)
+                )
+        if ranking_column:
+            with ranking_column:
+                show_ranking(ranking, st.session_state["generated_query"])
+
+    # Pick up an explanation that finished in the background
+    if st.session_state["generated_query"] and not st.session_state["query_explanation"]:
+        st.session_state["query_explanation"] = get_explanations().get(st.session_state["generated_query"])
+
+    if st.session_state["query_explanation"] and not streamed:
+        st.subheader("Query Explanation")
+        st.write(st.session_state["query_explanation"])
+    elif st.session_state["generated_query"] and not streamed:
+        query = st.session_state["generated_query"]
+        if get_explanations().pending(query):
+            st.caption("The explanation is being generated in the background.")
+        if st.button("Explain Query"):
+            try:
+                st.subheader("Query Explanation")
+                if get_explanations().pending(query):
+                    with st.spinner("Waiting for the explanation..."):
+                        explanation = get_explanations().submit(query, get_backend(), prompt_budget()).result()
+                    st.write(explanation)
+                else:
+                    backend = get_backend()
+                    explain_version = f"explain-{TEMPLATE_VERSION}"
+                    explanation = get_response_cache().get(query, backend.model_name, explain_version)
+                    if explanation:
+                        st.write(explanation)
+                    else:
+                        explanation = st.write_stream(backend.stream(build_prompt(EXPLAIN_QUERY_TEMPLATE, prompt_budget(), query=query)))
+                        get_response_cache().put(query, backend.model_name, explain_version, explanation)
+                    get_explanations().put(query, explanation)
+                st.session_state["query_explanation"] = explanation
+            except ModelBusyError as e:
+                st.warning(str(e))
+            except Exception as e:
+                st.error(f"An error occurred: {e}")
+
+    # Run the query against the configured database
+    if st.session_state["generated_query"]:
+        if st.button("Run Query"):
+            query = st.session_state["generated_query"]
+            st.session_state["query_result"] = (query, execute_query(query))
+        ran_query, result = st.session_state.get("query_result") or (None, None)
+        if result and ran_query == st.session_state["generated_query"]:
+            show_result(result, "generated_result")
+
+    # Save Query Button
+    if st.session_state["generated_query"]:
+        if st.button("Save Query"):
+            try:
+                query_id = save_query(
+                    description=text_input,
+                    query=st.session_state["generated_query"],
+                    explanation=st.session_state["query_explanation"] or ""
+                )
+                if query_id and not st.session_state["query_explanation"]:
+                    save_explanation_when_ready(query_id, st.session_state["generated_query"], get_backend())
+                st.success("Query saved successfully!")
+            except Exception as e:
+                st.error(f"An error occurred: {e}")
+    else:
+        st.warning("Please enter a description for the SQL query.")
+
+    record_render("fragment.Query Generator", fragment_started)
+
+@st.fragment
+def library_page():
+    """Query Library page; searching, paging and deleting rerun only this fragment."""
+    fragment_started = time.perf_counter()
+    st.title("📚 Query Library")
+
+    notice = st.session_state.pop("library_notice", None)
+    if notice:
+        kind, message = notice
+        if kind == "error":
+            st.error(message)
+        else:
+            st.success(message)
+
+    search = st.text_input("Search saved queries:", placeholder="e.g., customers total purchase")
+    sort = st.radio("Sort by", LIBRARY_SORTS, horizontal=True, disabled=bool(search.strip()),
+                    help="Search results are always ordered by relevance.")
+    dialect = dialect_selector("library_dialect")
+
+    # Keyset cursors of the pages visited so far; a new search or order starts over
+    if (search, sort) != st.session_state.get("library_search"):
+        st.session_state["library_search"] = (search, sort)
+        st.session_state["library_cursors"] = [None]
+    cursors = st.session_state["library_cursors"]
+    page = len(cursors) - 1
+
+    popular = False
+    if search.strip():
+        saved_queries = search_library(search, LIBRARY_PAGE_SIZE + 1, page * LIBRARY_PAGE_SIZE)
+    elif sort == "Most used":
+        popular = True
+        saved_queries = list_popular_library(cursors[-1], LIBRARY_PAGE_SIZE + 1)
+    else:
+        saved_queries = list_library(cursors[-1], LIBRARY_PAGE_SIZE + 1)
+    has_next_page = len(saved_queries) > LIBRARY_PAGE_SIZE
+    saved_queries = saved_queries[:LIBRARY_PAGE_SIZE]
+
+    if saved_queries:
+        for query_id, description, query, timestamp, *use_count in saved_queries:
+            st.markdown(f"**Query ID:** {query_id}")
+            st.markdown(f"**Description:** {description}")
+            st.code(library_variant(query_id, query, dialect), language='sql')
+            # Explanations are only loaded when asked for
+            if st.toggle("Show explanation", key=f"explanation_{query_id}"):
+                st.markdown(f"**Explanation:** {get_explanation(query_id)}")
+            used = f" · Used {use_count[0]} time{'s' if use_count[0] != 1 else ''}" if use_count else ""
+            st.caption(f"Saved on: {datetime.fromtimestamp(timestamp):%Y-%m-%d %H:%M:%S}{used}")
+
+            if st.button("Run", key=f"run_{query_id}"):
+                # Older saved queries and imports may still be wrapped in markdown fences
+                st.session_state["library_result"] = (query_id, execute_query(extract_sql(query)))
+            ran_id, result = st.session_state.get("library_result") or (None, None)
+            if result and ran_id == query_id:
+                show_result(result, f"library_result_{query_id}")
+
+            # Delete Query Button; the callback runs before the fragment reruns without the query
+            st.button(f"Delete Query {query_id}", key=f"delete_{query_id}", on_click=delete_query, args=(query_id,))
+
+        # Pagination
+        col_previous, col_page, col_next = st.columns(3)
+        if page > 0:
+            col_previous.button("Previous Page", on_click=cursors.pop)
+        col_page.caption(f"Page {page + 1}")
+        if has_next_page:
+            last = saved_queries[-1]
+            col_next.button("Next Page", on_click=cursors.append, args=((last[4], last[0]) if popular else last[0],))
+    else:
+        st.write("No saved queries found.")
+
+    record_render("fragment.Query Library", fragment_started)
 
 def create_sidebar():
     # Dictionary of menu options and their icons
@@ -164,6 +832,7 @@ def create_sidebar():
         "Query Library": "📚",
         "Help & Documentation": "📖",
         "Settings": "⚙️",
+        "Performance": "📈",
         "About": "ℹ️",
         "Privacy Policy": "🔒",
         "Contact": "📞"
@@ -210,89 +879,27 @@ def main():
         st.session_state["generated_query"] = None
     if "query_explanation" not in st.session_state:
         st.session_state["query_explanation"] = None
+    if "validation_error" not in st.session_state:
+        st.session_state["validation_error"] = None
+    if "query_ranking" not in st.session_state:
+        st.session_state["query_ranking"] = None
+    if "reused_from" not in st.session_state:
+        st.session_state["reused_from"] = None
+    if "settings" not in st.session_state:
+        st.session_state["settings"] = dict(DEFAULT_SETTINGS)
+    settings = st.session_state["settings"]
 
     # Initialize Database
     init_db()
+    get_maintainer()
+    render_started = time.perf_counter()
 
     # Main Content Area
     if selected_menu == "Query Generator":
-        st.title("🤖 SQL Query Generator")
-
-        # Input for query description
-        text_input = st.text_input(
-            "Describe your desired SQL query:", 
-            placeholder="e.g., Select top 5 customers with highest total purchase amount"
-        )
-
-        # Generate Query Button
-        if st.button("Generate SQL Query"):
-            if text_input.strip():
-                with st.spinner("Generating your query..."):
-                    query_template = f"""
-                    Create an SQL query snippet based on the following description:
-                    '{text_input}'
-                    Please provide only the SQL query without additional explanations.
-                    """
-                    explanation_template = f"""
-                    Provide a detailed explanation of an SQL query for the following description:
-                    '{text_input}'
-                    """
-                    try:
-                        # Generate SQL query
-                        query_response = model.generate_content(query_template)
-                        st.session_state["generated_query"] = query_response.text
-
-                        # Generate explanation
-                        explanation_response = model.generate_content(explanation_template)
-                        st.session_state["query_explanation"] = explanation_response.text
-
-                    except Exception as e:
-                        st.error(f"An error occurred: {e}")
-            else:
-                st.warning("Please enter a description for the SQL query.")
-
-        # Display Results
-        if st.session_state["generated_query"]:
-            st.subheader("Generated SQL Query")
-            st.code(st.session_state["generated_query"], language='sql')
-
-        if st.session_state["query_explanation"]:
-            st.subheader("Query Explanation")
-            st.write(st.session_state["query_explanation"])
-
-        # Save Query Button
-        if st.session_state["generated_query"] and st.session_state["query_explanation"]:
-            if st.button("Save Query"):
-                try:
-                    save_query(
-                        description=text_input,
-                        query=st.session_state["generated_query"],
-                        explanation=st.session_state["query_explanation"]
-                    )
-                    st.success("Query saved successfully!")
-                except Exception as e:
-                    st.error(f"An error occurred: {e}")
-        else:
-            st.warning("Please enter a description for the SQL query.")
+        generator_page(settings)
 
     elif selected_menu == "Query Library":
-        st.title("📚 Query Library")
-        saved_queries = get_saved_queries()
-
-        if saved_queries:
-            for query_id, description, query, explanation, timestamp in saved_queries:
-                st.markdown(f"**Query ID:** {query_id}")
-                st.markdown(f"**Description:** {description}")
-                st.code(query, language='sql')
-                st.markdown(f"**Explanation:** {explanation}")
-                st.caption(f"Saved on: {timestamp}")
-
-                # Delete Query Button
-                if st.button(f"Delete Query {query_id}", key=f"delete_{query_id}"):
-                    delete_query(query_id)
-                    st.experimental_rerun()  # Refresh the app after deletion
-        else:
-            st.write("No saved queries found.")
+        library_page()
 
     elif selected_menu == "Help & Documentation":
         st.title("🛠️ Help & Documentation")
@@ -372,13 +979,25 @@ def main():
         st.header("🤖 AI Model Configuration")
         model_type = st.selectbox(
             "Select AI Model",
-            ["Gemini Pro", "Gemini Pro Vision", "Custom Model"],
+            list(MODEL_CHOICES),
+            index=list(MODEL_CHOICES).index(settings["model_type"]),
             help="Choose the AI model for query generation"
         )
         
+        custom_api_key = settings["custom_api_key"]
+        custom_endpoint = settings["custom_endpoint"]
+        stub_latency = settings["stub_latency"]
         if model_type == "Custom Model":
-            st.text_input("Custom Model API Key", type="password")
-            st.text_input("Custom Model Endpoint URL")
+            custom_api_key = st.text_input("Custom Model API Key", value=custom_api_key, type="password")
+            custom_endpoint = st.text_input("Custom Model Endpoint URL", value=custom_endpoint)
+        elif model_type == "Offline Stub":
+            stub_latency = st.number_input(
+                "Simulated Latency (seconds)",
+                min_value=0.0,
+                max_value=30.0,
+                value=stub_latency,
+                help="Deterministic offline responses for testing and benchmarking, without using API quota"
+            )
         
         # UI Theme Settings
         st.header("🎨 User Interface")
@@ -401,22 +1020,182 @@ def main():
             value=True,
             help="Show comprehensive explanations for generated SQL queries"
         )
+
+        explanation_mode = st.selectbox(
+            "Explanation Mode",
+            EXPLANATION_MODES,
+            index=EXPLANATION_MODES.index(settings["explanation_mode"]),
+            help="Generate explanations only when requested, prefetch them in the background, "
+                 "or stream them together with every query"
+        )
         
+        query_candidates = st.number_input(
+            "Candidates per Query",
+            min_value=1,
+            max_value=5,
+            value=settings["query_candidates"],
+            help="With a database schema loaded, ask for this many alternative queries in one call and keep "
+                 "the one with the best local query plan (no full table scans, lowest estimated cost)"
+        )
+
         # Advanced Settings
         st.header("🔧 Advanced Settings")
         max_tokens = st.slider(
             "Maximum Response Length",
             min_value=100,
             max_value=1000,
-            value=500,
-            help="Set the maximum length for query explanations"
+            value=settings["max_output_tokens"],
+            help="Maximum tokens the model may generate per response; longer explanations are cut off. "
+                 "Candidate queries are not capped."
         )
-        
+        prompt_token_budget = st.number_input(
+            "Prompt Token Budget",
+            min_value=50,
+            max_value=100000,
+            value=settings["prompt_token_budget"],
+            help="Longest description or query sent to the model, in tokens (about four characters each); "
+                 "longer input keeps its beginning and end"
+        )
+
+        # Response Cache
+        cache_stats = get_response_cache().stats()
+        st.caption(
+            f"Response cache: {cache_stats['entries']} entries, "
+            f"{cache_stats['hits']} hits, {cache_stats['misses']} misses "
+            f"({cache_stats['hit_rate']:.0%} hit rate)"
+        )
+        if st.button("Clear Response Cache"):
+            get_response_cache().clear()
+            st.success("Response cache cleared!")
+
+        # Query Execution
+        st.header("▶️ Query Execution")
+        run_database = st.text_input(
+            "SQLite Database for Running Queries",
+            value=settings["run_database"],
+            placeholder="e.g., data/shop.db",
+            help="Run Query opens this database read-only"
+        )
+        run_max_rows = st.number_input(
+            "Maximum Rows per Result", min_value=1, max_value=100000, value=settings["run_max_rows"]
+        )
+        run_timeout = st.number_input(
+            "Query Timeout (seconds)", min_value=0.1, max_value=300.0, value=float(settings["run_timeout"])
+        )
+
+        # Storage
+        st.header("🧹 Storage & Retention")
+        try:
+            stored_days, stored_max_rows = db.get_retention_policy()
+        except sqlite3.Error as e:
+            st.error(f"Database error: {e}")
+            stored_days, stored_max_rows = 0, 0
+        retention_days = st.number_input(
+            "Delete Queries Unused for (days)", min_value=0, max_value=36500, value=int(stored_days),
+            help="Saved queries not saved again or reused for this long are deleted. 0 keeps them forever."
+        )
+        retention_max_rows = st.number_input(
+            "Maximum Saved Queries", min_value=0, value=stored_max_rows,
+            help="Beyond this, the least recently used queries are deleted. 0 means no limit."
+        )
+        maintainer = get_maintainer()
+        try:
+            storage = maintenance.storage_stats()
+            st.caption(
+                f"Database: {storage['file_bytes'] / 1e6:.1f} MB "
+                f"({storage['free_bytes'] / 1e6:.1f} MB free, write-ahead log {storage['wal_bytes'] / 1e6:.1f} MB)"
+            )
+        except sqlite3.Error as e:
+            st.error(f"Database error: {e}")
+        if maintainer.last_report:
+            report = maintainer.last_report
+            st.caption(
+                f"Last compaction {datetime.fromtimestamp(report['finished_at']):%Y-%m-%d %H:%M}: "
+                f"{len(report['deleted'])} queries deleted, "
+                f"{(report['bytes_before'] - report['bytes_after']) / 1e6:.1f} MB reclaimed"
+            )
+        if maintainer.last_error:
+            st.warning(f"Last compaction failed: {maintainer.last_error}")
+        if st.button(
+            "Compact Now",
+            help="Runs in the background; the app stays usable. A database created before incremental "
+                 "vacuum is rewritten once, which takes longer."
+        ):
+            maintainer.run_soon(convert=True)
+            st.info("Compaction started.")
+
         # Save Settings Button
         if st.button("Save Settings"):
-            st.success("Settings saved successfully!")
+            settings.update(
+                explanation_mode=explanation_mode,
+                model_type=model_type,
+                custom_api_key=custom_api_key,
+                custom_endpoint=custom_endpoint,
+                stub_latency=stub_latency,
+                run_database=run_database.strip(),
+                run_max_rows=int(run_max_rows),
+                run_timeout=run_timeout,
+                max_output_tokens=max_tokens,
+                prompt_token_budget=int(prompt_token_budget),
+                query_candidates=int(query_candidates)
+            )
+            try:
+                # Retention applies to the shared database, so the last saved policy wins
+                maintainer.configure(int(retention_days), int(retention_max_rows))
+                st.success("Settings saved successfully!")
+            except sqlite3.Error as e:
+                st.error(f"Error saving the retention policy: {e}")
             # Here you would typically save these settings to a configuration file or database
 
+    elif selected_menu == "Performance":
+        st.title("📈 Performance")
+        import pandas as pd  # only this page needs it; keeps it off the startup path
+
+        window = st.selectbox("Time Window", list(PERFORMANCE_WINDOWS), index=1)
+        since = int(time.time()) - PERFORMANCE_WINDOWS[window]
+        recorder = metrics.get_recorder()
+        try:
+            recorder.rollup()
+            summary = recorder.summary(since)
+            series = recorder.timeseries(since)
+        except sqlite3.OperationalError as e:
+            st.error(f"Database error: {e}")
+            summary, series = [], []
+
+        if summary:
+            lookups = sum(row["count"] for row in summary if row["name"] == "cache.lookup")
+            hits = sum(row["hits"] for row in summary if row["name"] == "cache.lookup")
+            model_calls = [row for row in summary if row["name"] in ("model.generate", "model.stream")]
+            col_calls, col_hit_rate, col_errors = st.columns(3)
+            col_calls.metric("Model Calls", sum(row["count"] for row in model_calls))
+            col_hit_rate.metric("Cache Hit Rate", f"{hits / lookups:.0%}" if lookups else "n/a")
+            col_errors.metric("Errors", sum(row["errors"] for row in summary))
+
+            st.subheader("Latency by Operation (ms)")
+            st.dataframe(
+                [{"Operation": row["name"], "Count": row["count"], "Errors": row["errors"],
+                  "p50": round(row["p50_ms"], 1), "p95": round(row["p95_ms"], 1), "p99": round(row["p99_ms"], 1)}
+                 for row in summary]
+            )
+
+            # Pivot the hourly rows into one column per operation
+            p95_by_hour, errors_by_hour, hit_rate_by_hour = {}, {}, {}
+            for bucket, name, count, errors, hits, p95_ms in series:
+                hour = datetime.fromtimestamp(bucket)
+                p95_by_hour.setdefault(hour, {})[name] = p95_ms
+                errors_by_hour[hour] = errors_by_hour.get(hour, 0) + errors
+                if name == "cache.lookup" and count:
+                    hit_rate_by_hour[hour] = hits / count
+            st.subheader("p95 Latency Over Time (ms)")
+            st.line_chart(pd.DataFrame.from_dict(p95_by_hour, orient="index").sort_index())
+            st.subheader("Errors Over Time")
+            st.bar_chart(pd.Series(errors_by_hour, name="errors").sort_index())
+            if hit_rate_by_hour:
+                st.subheader("Cache Hit Rate Over Time")
+                st.line_chart(pd.Series(hit_rate_by_hour, name="hit rate").sort_index())
+        else:
+            st.write("No performance data recorded yet.")
+
     elif selected_menu == "About":
         st.title("ℹ️ About")
         
@@ -534,5 +1313,7 @@ def main():
         Feel free to schedule a call or send an email. I'll get back to you within 24 hours.
         """)
 
+    record_render(selected_menu, render_started)
+
 if __name__ == "__main__":
     main()
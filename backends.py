@@ -0,0 +1,206 @@
+"""Model backends used for query generation.
+
+Every backend exposes the same small API, so the generator page, the batch
+CLI and the response cache do not care which model answers:
+
+    backend.model_name         -> identifier used in cache keys
+    backend.generate(prompt)   -> full response text
+    backend.stream(prompt)     -> iterator over response text chunks
+
+Backends built with max_output_tokens ask the model to stop after that many
+tokens; the cap is part of model_name, so capped responses are cached apart.
+"""
+import hashlib
+import json
+import re
+import time
+
+GEMINI_MODEL = "models/gemini-1.5-pro"
+
+
+def capped_name(model_name, max_output_tokens):
+    """Cache identifier of a model whose responses are capped at max_output_tokens."""
+    return f"{model_name}:max{max_output_tokens}" if max_output_tokens else model_name
+
+
+class ModelBackend:
+    """Base class for model backends."""
+
+    model_name = "base"
+    max_output_tokens = None
+
+    def generate(self, prompt):
+        raise NotImplementedError
+
+    def stream(self, prompt):
+        # Backends without native streaming return the whole response as one chunk
+        yield self.generate(prompt)
+
+
+class GeminiBackend(ModelBackend):
+    """Google Gemini through the google-generativeai SDK."""
+
+    def __init__(self, model_name=GEMINI_MODEL, api_key=None, max_output_tokens=None):
+        import google.generativeai as genai
+
+        if api_key:
+            genai.configure(api_key=api_key)
+        self.model_name = capped_name(model_name, max_output_tokens)
+        self.max_output_tokens = max_output_tokens
+        generation_config = {"max_output_tokens": max_output_tokens} if max_output_tokens else None
+        self._model = genai.GenerativeModel(model_name, generation_config=generation_config)
+
+    def generate(self, prompt):
+        return self._model.generate_content(prompt).text
+
+    def stream(self, prompt):
+        for chunk in self._model.generate_content(prompt, stream=True):
+            yield chunk.text
+
+
+class HttpBackend(ModelBackend):
+    """Any model served over HTTP, configured by the Custom Model settings.
+
+    The prompt is POSTed as JSON ({"prompt": ..., "stream": ...}, plus
+    "max_tokens" when capped) with the API key as a bearer token.  Responses may be plain text or JSON carrying the
+    text under "text", "response", "output" or an OpenAI-style "choices"
+    list; streamed responses are read line by line, with or without the
+    server-sent events "data:" prefix.
+    """
+
+    def __init__(self, endpoint, api_key=None, timeout=60, max_output_tokens=None):
+        import requests
+
+        if not endpoint:
+            raise ValueError("The custom model endpoint URL is not set.")
+        self.endpoint = endpoint
+        self.model_name = capped_name(f"http:{endpoint}", max_output_tokens)
+        self.max_output_tokens = max_output_tokens
+        self.timeout = timeout
+        self._session = requests.Session()
+        if api_key:
+            self._session.headers["Authorization"] = f"Bearer {api_key}"
+
+    def _payload(self, prompt, stream):
+        payload = {"prompt": prompt, "stream": stream}
+        if self.max_output_tokens:
+            payload["max_tokens"] = self.max_output_tokens
+        return payload
+
+    def generate(self, prompt):
+        response = self._session.post(self.endpoint, json=self._payload(prompt, False), timeout=self.timeout)
+        response.raise_for_status()
+        try:
+            return extract_text(response.json())
+        except ValueError:
+            return response.text
+
+    def stream(self, prompt):
+        with self._session.post(
+            self.endpoint, json=self._payload(prompt, True), timeout=self.timeout, stream=True
+        ) as response:
+            response.raise_for_status()
+            for line in response.iter_lines(decode_unicode=True):
+                if not line:
+                    continue
+                if line.startswith("data:"):
+                    line = line[len("data:"):].strip()
+                    if line == "[DONE]":
+                        break
+                try:
+                    yield extract_text(json.loads(line))
+                except ValueError:
+                    yield line
+
+
+def extract_text(data):
+    """Pull the generated text out of a JSON response body."""
+    if isinstance(data, str):
+        return data
+    if isinstance(data, dict):
+        for key in ("text", "response", "output", "content"):
+            if isinstance(data.get(key), str):
+                return data[key]
+        choices = data.get("choices")
+        if choices:
+            choice = choices[0]
+            if isinstance(choice.get("text"), str):
+                return choice["text"]
+            for key in ("message", "delta"):
+                if isinstance(choice.get(key), dict):
+                    return choice[key].get("content") or ""
+    raise ValueError("No text found in the model response.")
+
+
+class StubBackend(ModelBackend):
+    """Deterministic offline backend for benchmarks and load tests.
+
+    Responses depend only on the prompt, follow the shape each prompt asks
+    for, and take `latency` seconds (spread across chunks when streaming).
+    A max_output_tokens cap cuts them off at about four characters per token.
+    """
+
+    model_name = "stub"
+
+    def __init__(self, latency=0.0, chunks=8, max_output_tokens=None):
+        self.latency = latency
+        self.chunks = chunks
+        self.model_name = capped_name("stub", max_output_tokens)
+        self.max_output_tokens = max_output_tokens
+
+    def _respond(self, prompt):
+        # Prompts about an existing query name its table; otherwise guess from the description,
+        # preferring a table of the schema when one is given
+        match = re.search(r"\bFROM\s+(\w+)", prompt) or re.search(r"'(.*)'", prompt, re.S)
+        words = re.findall(r"[a-z_]+", match.group(1).lower() if match else "")
+        tables = re.findall(r"^(\w+)\(", prompt, re.M)
+        mentioned = [name for name in tables if name.lower().rstrip("s") in words or name.lower() in words]
+        if mentioned or tables:
+            table = (mentioned or tables)[0]
+        else:
+            table = max(words, key=len) if words else "items"
+        digest = int(hashlib.sha256(prompt.encode("utf-8")).hexdigest(), 16)
+        query = f"SELECT * FROM {table} ORDER BY id LIMIT {digest % 50 + 1};"
+        explanation = f"This query returns up to {digest % 50 + 1} rows from the {table} table, ordered by id."
+        if '"queries"' in prompt:
+            # Alternatives that differ in their plans: a full scan, a key range and a sort
+            limit = digest % 50 + 1
+            text = json.dumps({"queries": [
+                query,
+                f"SELECT * FROM {table} WHERE id > 0 ORDER BY id LIMIT {limit};",
+                f"SELECT * FROM {table} ORDER BY 2 LIMIT {limit};",
+            ]})
+        elif '"query"' in prompt:
+            text = json.dumps({"query": query, "explanation": explanation})
+        elif "---EXPLANATION---" in prompt:
+            text = f"{query}\n---EXPLANATION---\n{explanation}"
+        elif "detailed explanation" in prompt.lower():
+            text = explanation
+        else:
+            text = query
+        return text[:self.max_output_tokens * 4] if self.max_output_tokens else text
+
+    def generate(self, prompt):
+        if self.latency:
+            time.sleep(self.latency)
+        return self._respond(prompt)
+
+    def stream(self, prompt):
+        text = self._respond(prompt)
+        size = max(1, -(-len(text) // self.chunks))
+        for start in range(0, len(text), size):
+            if self.latency:
+                time.sleep(self.latency / self.chunks)
+            yield text[start:start + size]
+
+
+def create_backend(kind="gemini", model_name=GEMINI_MODEL, api_key=None, endpoint=None, latency=0.0,
+                   max_output_tokens=None):
+    """Build a backend by kind: "gemini", "http" or "stub"."""
+    if kind == "gemini":
+        return GeminiBackend(model_name, api_key, max_output_tokens=max_output_tokens)
+    if kind == "http":
+        return HttpBackend(endpoint, api_key, max_output_tokens=max_output_tokens)
+    if kind == "stub":
+        return StubBackend(latency, max_output_tokens=max_output_tokens)
+    raise ValueError(f"Unknown model backend: {kind}")
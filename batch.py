@@ -0,0 +1,182 @@
+"""Headless batch generation of SQL queries from a CSV or JSONL file.
+
+Example:
+    python batch.py descriptions.csv --concurrency 8 --rate 4
+
+Every generated query and explanation is saved to the queries table.
+Progress is checkpointed next to the input file, so an interrupted run
+picks up where it stopped when started again with the same arguments.
+"""
+import argparse
+import csv
+import json
+import os
+import sqlite3
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+import db
+from backends import create_backend, GEMINI_MODEL
+from cache import ResponseCache, CACHE_FILE
+from generator import generate_query_and_explanation, TEMPLATE_VERSION
+from coalesce import ModelGate
+from schema_digest import load_digest
+from validation import repair_query
+
+
+def read_descriptions(path, column="description"):
+    """Yield (row number, description) pairs from a CSV or JSONL file."""
+    with open(path, newline="", encoding="utf-8") as f:
+        if path.endswith(".jsonl"):
+            rows = (json.loads(line) for line in f if line.strip())
+        else:
+            rows = csv.DictReader(f)
+        for number, row in enumerate(rows):
+            description = (row.get(column) or "").strip()
+            if description:
+                yield number, description
+
+
+def load_checkpoint(path):
+    """Return the row numbers already completed by a previous run."""
+    if not os.path.exists(path):
+        return set()
+    with open(path, encoding="utf-8") as f:
+        return {int(line) for line in f if line.strip()}
+
+
+def run_batch(items, generate, db_path=db.DB_FILE, checkpoint_path=None, concurrency=4, rate=2.0,
+              retries=3, batch_size=50, cache=None, model_name="custom", schema=None):
+    """Generate and save queries for (row number, description) items; return run statistics.
+
+    generate is any callable taking a prompt and returning the response text,
+    normally a backend's generate method; model_name keys its cached responses.
+    schema is an optional SchemaDigest the generated queries are grounded in.
+    """
+    done = load_checkpoint(checkpoint_path) if checkpoint_path else set()
+    pending = [(number, description) for number, description in items if number not in done]
+    # Retries only rate limits and transient errors, each model call on its own
+    gate = ModelGate(rate, max_concurrent=concurrency, retries=retries)
+    stats = {"total": len(pending), "skipped": len(done), "succeeded": 0, "failed": 0, "errors": {}}
+    buffer = []
+    cache_version = f"pair-{TEMPLATE_VERSION}"
+    if schema is not None:
+        cache_version += f"-{schema.schema_hash[:16]}"
+
+    def limited_generate(prompt):
+        return gate.call(lambda: generate(prompt))
+
+    def generate_one(description):
+        def call():
+            schema_text = schema.render(description) if schema is not None else ""
+            query, explanation = generate_query_and_explanation(limited_generate, description, schema_text)
+            query, _ = repair_query(query, limited_generate, schema, description)
+            return json.dumps([query, explanation])
+        if cache is None:
+            return json.loads(call())
+        return json.loads(cache.get_or_generate(description, model_name, cache_version, call))
+
+    def flush():
+        if not buffer:
+            return
+        db.save_queries([row for _, row in buffer], path=db_path)
+        # Only checkpoint rows once they are committed to the database
+        if checkpoint_path:
+            with open(checkpoint_path, "a", encoding="utf-8") as f:
+                f.writelines(f"{number}\n" for number, _ in buffer)
+        buffer.clear()
+
+    db.init_db(db_path)
+    started = time.perf_counter()
+    # Twice the model slots, so workers backing off from a rate limit leave none idle
+    with ThreadPoolExecutor(max_workers=concurrency * 2) as pool:
+        futures = {pool.submit(generate_one, description): (number, description)
+                   for number, description in pending}
+        for future in as_completed(futures):
+            number, description = futures[future]
+            try:
+                query, explanation = future.result()
+            except Exception as e:
+                stats["failed"] += 1
+                name = type(e).__name__
+                stats["errors"][name] = stats["errors"].get(name, 0) + 1
+                continue
+            stats["succeeded"] += 1
+            buffer.append((number, (description, query, explanation)))
+            if len(buffer) >= batch_size:
+                flush()
+    flush()
+
+    stats["elapsed"] = time.perf_counter() - started
+    stats["throughput"] = stats["succeeded"] / stats["elapsed"] if stats["elapsed"] else 0.0
+    stats["error_rate"] = stats["failed"] / stats["total"] if stats["total"] else 0.0
+    return stats
+
+
+def format_report(stats):
+    """Render run statistics as a short human-readable report."""
+    lines = [
+        f"Processed {stats['total']} descriptions ({stats['skipped']} already done) "
+        f"in {stats['elapsed']:.1f}s",
+        f"Succeeded: {stats['succeeded']}  Failed: {stats['failed']}  "
+        f"Error rate: {stats['error_rate']:.1%}",
+        f"Throughput: {stats['throughput']:.2f} queries/s",
+    ]
+    for name, count in sorted(stats["errors"].items()):
+        lines.append(f"  {name}: {count}")
+    return "\n".join(lines)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Generate SQL queries for a file of descriptions.")
+    parser.add_argument("input", help="CSV or JSONL file with one description per row")
+    parser.add_argument("--column", default="description", help="CSV column / JSON field to read")
+    parser.add_argument("--db", default=db.DB_FILE, help="database to save the queries to")
+    parser.add_argument("--concurrency", type=int, default=4, help="maximum requests in flight")
+    parser.add_argument("--rate", type=float, default=2.0, help="maximum model calls per second")
+    parser.add_argument("--retries", type=int, default=3, help="retries per model call on rate limits and transient errors")
+    parser.add_argument("--batch-size", type=int, default=50, help="rows per database insert")
+    parser.add_argument("--checkpoint", help="checkpoint file (default: <input>.checkpoint)")
+    parser.add_argument("--backend", choices=["gemini", "http", "stub"], default="gemini",
+                        help="model backend to generate with")
+    parser.add_argument("--model", default=GEMINI_MODEL, help="Gemini model name")
+    parser.add_argument("--endpoint", help="endpoint URL for the http backend")
+    parser.add_argument("--stub-latency", type=float, default=0.0, help="seconds per stub response")
+    parser.add_argument("--no-cache", action="store_true", help="bypass the response cache")
+    parser.add_argument("--schema", help="SQLite database or DDL file the queries should target")
+    args = parser.parse_args(argv)
+
+    # GOOGLE_API_KEY for Gemini, MODEL_API_KEY for a custom HTTP endpoint
+    api_key = os.environ.get("GOOGLE_API_KEY" if args.backend == "gemini" else "MODEL_API_KEY")
+    if args.backend == "gemini" and not api_key:
+        parser.error("set GOOGLE_API_KEY to your Google API key")
+    if args.backend == "http" and not args.endpoint:
+        parser.error("--endpoint is required with --backend http")
+    try:
+        schema = load_digest(args.schema) if args.schema else None
+    except (OSError, ValueError, sqlite3.Error) as e:
+        parser.error(f"could not read --schema: {e}")
+    backend = create_backend(
+        args.backend, model_name=args.model, api_key=api_key, endpoint=args.endpoint, latency=args.stub_latency
+    )
+
+    stats = run_batch(
+        read_descriptions(args.input, args.column),
+        backend.generate,
+        db_path=args.db,
+        checkpoint_path=args.checkpoint or f"{args.input}.checkpoint",
+        concurrency=args.concurrency,
+        rate=args.rate,
+        retries=args.retries,
+        batch_size=args.batch_size,
+        cache=None if args.no_cache else ResponseCache(CACHE_FILE),
+        model_name=backend.model_name,
+        schema=schema,
+    )
+    print(format_report(stats))
+    return 1 if stats["failed"] else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
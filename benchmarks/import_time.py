@@ -0,0 +1,81 @@
+"""Startup benchmark: how long a fresh interpreter takes to import the app.
+
+Each run imports app1 in a new process, as a cold container start would,
+and checks that the model SDKs and other heavy dependencies stay out of the
+startup path.
+
+    python benchmarks/import_time.py
+    python benchmarks/import_time.py --runs 10 --max-ms 1500
+
+Exits with status 1 when a deferred module was imported at startup or the
+median import time exceeds --max-ms.
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Modules that must only be imported once a page actually needs them
+DEFERRED_MODULES = ("google.generativeai", "requests", "pandas", "pyarrow")
+
+PROBE = """
+import json, sys, time
+started = time.perf_counter()
+import streamlit
+streamlit_done = time.perf_counter()
+import app1
+finished = time.perf_counter()
+print(json.dumps({{
+    "streamlit_ms": (streamlit_done - started) * 1000,
+    "app_ms": (finished - streamlit_done) * 1000,
+    "total_ms": (finished - started) * 1000,
+    "deferred_loaded": [m for m in {modules!r} if m in sys.modules],
+}}))
+"""
+
+
+def measure_once():
+    """Import the app in a fresh interpreter and return its timings."""
+    result = subprocess.run(
+        [sys.executable, "-c", PROBE.format(modules=DEFERRED_MODULES)],
+        cwd=ROOT, capture_output=True, text=True, check=True,
+    )
+    return json.loads(result.stdout.strip().splitlines()[-1])
+
+
+def bench_startup(runs=5):
+    """Median cold-import timings over several runs, plus any deferred modules that were loaded."""
+    samples = [measure_once() for _ in range(runs)]
+    results = {
+        key: statistics.median(sample[key] for sample in samples)
+        for key in ("streamlit_ms", "app_ms", "total_ms")
+    }
+    results["deferred_loaded"] = sorted({m for sample in samples for m in sample["deferred_loaded"]})
+    return results
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Measure the app's cold import time.")
+    parser.add_argument("--runs", type=int, default=5, help="fresh interpreters to time")
+    parser.add_argument("--max-ms", type=float, help="fail when the median total import time exceeds this")
+    args = parser.parse_args(argv)
+
+    results = bench_startup(args.runs)
+    print(f"streamlit {results['streamlit_ms']:.0f} ms, app modules {results['app_ms']:.0f} ms, "
+          f"total {results['total_ms']:.0f} ms (median of {args.runs})")
+    failed = False
+    if results["deferred_loaded"]:
+        print(f"Imported at startup but should be deferred: {', '.join(results['deferred_loaded'])}")
+        failed = True
+    if args.max_ms is not None and results["total_ms"] > args.max_ms:
+        print(f"Total import time is above the {args.max_ms:g} ms limit")
+        failed = True
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,189 @@
+"""Load test for the HTTP API (api.py).
+
+By default it starts its own API server with the offline stub backend on a
+throwaway database, so it needs no API key:
+
+    python benchmarks/loadtest.py --concurrency 32 --duration 10
+    python benchmarks/loadtest.py --url http://127.0.0.1:8000 --mix generate=1,search=4
+
+Requests are spread over the endpoints by weight, and the report lists
+requests per second plus latency percentiles for each endpoint.
+"""
+import argparse
+import json
+import os
+import random
+import shutil
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from run_benchmarks import DESCRIPTIONS, summarize  # noqa: E402
+
+DEFAULT_MIX = "generate=2,stream=1,list=4,search=4,save=1,delete=1"
+# Distinct descriptions per run; repeats exercise the response cache and request coalescing
+DESCRIPTION_POOL = 200
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def start_server(workdir, latency):
+    """Run api.py with the stub backend in workdir (its database and cache live there)."""
+    port = free_port()
+    server = subprocess.Popen(
+        [sys.executable, os.path.join(ROOT, "api.py"), "--backend", "stub", "--port", str(port),
+         "--db", os.path.join(workdir, "queries.db"), "--stub-latency", str(latency)],
+        cwd=workdir,
+    )
+    url = f"http://127.0.0.1:{port}"
+    deadline = time.monotonic() + 30
+    while time.monotonic() < deadline:
+        try:
+            requests.get(f"{url}/queries", timeout=1)
+            return server, url
+        except requests.ConnectionError:
+            time.sleep(0.1)
+    server.terminate()
+    raise RuntimeError("The API server did not start.")
+
+
+class Client:
+    """One simulated user issuing weighted random requests."""
+
+    def __init__(self, url, seed):
+        self.url = url
+        self.session = requests.Session()
+        self.random = random.Random(seed)
+        self.saved = []
+
+    def description(self):
+        n = self.random.randrange(DESCRIPTION_POOL)
+        return f"{DESCRIPTIONS[n % len(DESCRIPTIONS)]} #{n}"
+
+    def request(self, operation):
+        if operation == "generate":
+            return self.session.post(f"{self.url}/generate", json={"description": self.description()})
+        if operation == "stream":
+            response = self.session.post(
+                f"{self.url}/generate/stream", json={"description": self.description()}, stream=True
+            )
+            for _ in response.iter_lines():
+                pass
+            return response
+        if operation == "list":
+            return self.session.get(f"{self.url}/queries", params={"limit": 20})
+        if operation == "search":
+            words = self.random.choice(DESCRIPTIONS).split()
+            return self.session.get(f"{self.url}/queries", params={"q": " ".join(words[:2]), "limit": 20})
+        if operation == "save":
+            response = self.session.post(f"{self.url}/queries", json={
+                "description": self.description(), "query": "SELECT 1;", "explanation": "Load test row."
+            })
+            if response.ok:
+                self.saved.append(response.json()["id"])
+            return response
+        if operation == "delete":
+            if not self.saved:
+                return self.request("save")
+            return self.session.delete(f"{self.url}/queries/{self.saved.pop()}")
+        raise ValueError(f"Unknown operation: {operation}")
+
+
+def run_load(url, concurrency, duration, mix):
+    """Drive the API from `concurrency` threads for `duration` seconds; return per-operation samples."""
+    operations, weights = zip(*mix.items())
+    samples = {operation: [] for operation in operations}
+    errors = {operation: 0 for operation in operations}
+    lock = threading.Lock()
+    deadline = time.monotonic() + duration
+
+    def worker(seed):
+        client = Client(url, seed)
+        while time.monotonic() < deadline:
+            operation = client.random.choices(operations, weights)[0]
+            started = time.perf_counter()
+            try:
+                ok = client.request(operation).ok
+            except requests.RequestException:
+                ok = False
+            elapsed = time.perf_counter() - started
+            with lock:
+                samples[operation].append(elapsed)
+                errors[operation] += not ok
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        list(pool.map(worker, range(concurrency)))
+    return samples, errors, time.perf_counter() - started
+
+
+def parse_mix(text):
+    mix = {}
+    for item in text.split(","):
+        operation, _, weight = item.partition("=")
+        mix[operation.strip()] = float(weight or 1)
+    return mix
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Load test the HTTP API.")
+    parser.add_argument("--url", help="API to test (default: start a local stub-backed server)")
+    parser.add_argument("--concurrency", type=int, default=16, help="simultaneous clients")
+    parser.add_argument("--duration", type=float, default=10.0, help="seconds to run")
+    parser.add_argument("--mix", default=DEFAULT_MIX, help="operation weights, e.g. generate=1,search=4")
+    parser.add_argument("--latency", type=float, default=0.0, help="stub model latency for a local server")
+    parser.add_argument("--output", help="write the report as JSON to this file")
+    args = parser.parse_args(argv)
+
+    server = workdir = None
+    url = args.url
+    if url is None:
+        workdir = tempfile.mkdtemp(prefix="sqlgen-load-")
+        server, url = start_server(workdir, args.latency)
+    try:
+        samples, errors, elapsed = run_load(url, args.concurrency, args.duration, parse_mix(args.mix))
+    finally:
+        if server is not None:
+            server.terminate()
+            server.wait()
+            shutil.rmtree(workdir, ignore_errors=True)
+
+    total = sum(len(values) for values in samples.values())
+    report = {
+        "url": url,
+        "concurrency": args.concurrency,
+        "elapsed": elapsed,
+        "requests": total,
+        "requests_per_sec": total / elapsed,
+        "errors": sum(errors.values()),
+        "operations": {
+            operation: {**summarize(values), "errors": errors[operation]}
+            for operation, values in samples.items() if values
+        },
+    }
+    print(f"{total} requests in {elapsed:.1f}s: {report['requests_per_sec']:.0f} req/s, "
+          f"{report['errors']} errors")
+    for operation, stats in report["operations"].items():
+        print(f"  {operation:<9} {stats['count']:>6}  p50 {stats['p50_ms']:7.1f} ms  "
+              f"p95 {stats['p95_ms']:7.1f} ms  p99 {stats['p99_ms']:7.1f} ms  errors {stats['errors']}")
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+    return 1 if report["errors"] else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
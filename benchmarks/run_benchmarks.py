@@ -0,0 +1,270 @@
+"""Offline benchmark suite for the generation path and queries.db storage.
+
+Runs entirely against the deterministic stub backend and throwaway
+databases, so it needs no API key and never touches the real queries.db.
+
+    python benchmarks/run_benchmarks.py
+    python benchmarks/run_benchmarks.py --sizes 10000 --compare benchmarks/results/<earlier>.json
+
+Results are written as JSON to benchmarks/results/, named after the time
+and the current git commit, so runs can be compared across commits.
+"""
+import argparse
+import json
+import os
+import platform
+import random
+import shutil
+import sqlite3
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import db  # noqa: E402
+from backends import StubBackend  # noqa: E402
+from generator import (  # noqa: E402
+    PROMPT_TOKEN_BUDGET, STREAM_TEMPLATE, build_prompt, stream_query_and_explanation, with_schema
+)
+from import_time import bench_startup  # noqa: E402
+from schema_digest import digest_from_ddl  # noqa: E402
+from similarity import build_index  # noqa: E402
+
+RESULTS_DIR = os.path.join(ROOT, "benchmarks", "results")
+# A similarity lookup runs before every generation, so it has to stay well below a model call
+SIMILARITY_BUDGET_MS = 5.0
+# A small vocabulary makes every term common, the slowest case for similarity lookups
+SIMILARITY_WORDS = [
+    "orders", "customers", "region", "total", "2020", "2021", "per", "month",
+    "products", "sales", "count", "average", "top", "employees", "department",
+]
+SIMILARITY_LOOKUPS = [
+    "orders in 2020 by region",
+    "total sales per month",
+    "average customers count",
+    "top products by sales",
+    "employees per department in 2021",
+]
+
+DESCRIPTIONS = [
+    "Select top 5 customers with highest total purchase amount",
+    "Count orders per region for the last month",
+    "List employees hired after 2020 with their department names",
+    "Average invoice total by product category",
+]
+
+# Schema the generation benchmark grounds its prompts in, as the app does with a loaded schema
+SCHEMA_DDL = """
+CREATE TABLE regions (id INTEGER PRIMARY KEY, name TEXT);
+CREATE TABLE customers (id INTEGER PRIMARY KEY, name TEXT, region_id INTEGER REFERENCES regions(id));
+CREATE TABLE departments (id INTEGER PRIMARY KEY, name TEXT);
+CREATE TABLE employees (id INTEGER PRIMARY KEY, name TEXT, hired DATE, department_id INTEGER REFERENCES departments(id));
+CREATE TABLE categories (id INTEGER PRIMARY KEY, name TEXT);
+CREATE TABLE products (id INTEGER PRIMARY KEY, name TEXT, category_id INTEGER REFERENCES categories(id));
+CREATE TABLE orders (id INTEGER PRIMARY KEY, customer_id INTEGER REFERENCES customers(id), ordered DATE, amount REAL);
+CREATE TABLE invoices (id INTEGER PRIMARY KEY, order_id INTEGER REFERENCES orders(id), product_id INTEGER REFERENCES products(id), total REAL);
+"""
+
+
+def summarize(samples):
+    """Latency summary (milliseconds) of a list of durations in seconds."""
+    ordered = sorted(samples)
+
+    def percentile(fraction):
+        return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))] * 1000
+
+    return {
+        "count": len(ordered),
+        "mean_ms": statistics.fmean(ordered) * 1000,
+        "p50_ms": percentile(0.50),
+        "p95_ms": percentile(0.95),
+        "p99_ms": percentile(0.99),
+    }
+
+
+def bench_generation(path, iterations, latency, budget=PROMPT_TOKEN_BUDGET):
+    """Time each stage of the generator page flow: prompt, model call, state update, save.
+
+    The prompt is built as the app builds it: compacted and fitted to the
+    prompt budget, with the schema digest trimmed to the description.
+    """
+    backend = StubBackend(latency=latency)
+    digest = digest_from_ddl(SCHEMA_DDL)
+    stages = {"prompt_build": [], "model_call": [], "session_state": [], "save_query": [], "total": []}
+    session_state = {}
+    for i in range(iterations):
+        description = f"{DESCRIPTIONS[i % len(DESCRIPTIONS)]} #{i}"
+        started = time.perf_counter()
+
+        prompt = with_schema(build_prompt(STREAM_TEMPLATE, budget, description=description), digest.render(description))
+        prompt_built = time.perf_counter()
+
+        query, chunks = stream_query_and_explanation(lambda _: backend.stream(prompt), description)
+        explanation = "".join(chunks)
+        model_done = time.perf_counter()
+
+        session_state["generated_query"] = query
+        session_state["query_explanation"] = explanation
+        state_done = time.perf_counter()
+
+        db.save_query(description, query, explanation, path=path)
+        saved = time.perf_counter()
+
+        stages["prompt_build"].append(prompt_built - started)
+        stages["model_call"].append(model_done - prompt_built)
+        stages["session_state"].append(state_done - model_done)
+        stages["save_query"].append(saved - state_done)
+        stages["total"].append(saved - started)
+    return {stage: summarize(samples) for stage, samples in stages.items()}
+
+
+def populate(path, rows, chunk=10000):
+    """Fill a fresh database with `rows` synthetic saved queries."""
+    db.init_db(path)
+    for start in range(0, rows, chunk):
+        count = min(chunk, rows - start)
+        db.save_queries(
+            [(f"{DESCRIPTIONS[n % len(DESCRIPTIONS)]} #{n}",
+              f"SELECT * FROM t{n % 97} WHERE id = {n};",
+              f"Returns row {n} of table t{n % 97}. " * 8)
+             for n in range(start, start + count)],
+            path=path,
+        )
+
+
+def timed_ops(operation, count):
+    """Run operation(i) count times; return operations per second and latency summary."""
+    samples = []
+    for i in range(count):
+        started = time.perf_counter()
+        operation(i)
+        samples.append(time.perf_counter() - started)
+    return {"ops_per_sec": count / sum(samples), **summarize(samples)}
+
+
+def bench_storage(workdir, size, operations):
+    """Measure save/read/delete throughput against a library of `size` rows."""
+    path = os.path.join(workdir, f"bench_{size}.db")
+    started = time.perf_counter()
+    populate(path, size)
+    results = {"populate_seconds": time.perf_counter() - started}
+
+    results["save_query"] = timed_ops(
+        lambda i: db.save_query(f"benchmark description {i}", "SELECT 1;", "Explanation.", path=path),
+        operations,
+    )
+    results["list_queries_page"] = timed_ops(lambda i: db.list_queries(None, 21, path=path), operations)
+    results["search_queries"] = timed_ops(
+        lambda i: db.search_queries("customers purchase", 21, 0, path=path), operations
+    )
+    results["get_saved_queries_full"] = timed_ops(lambda i: db.get_saved_queries(path=path), 1)
+    ids = [row[0] for row in db.list_queries(None, operations, path=path)]
+    results["delete_query"] = timed_ops(lambda i: db.delete_query(ids[i], path=path), len(ids))
+
+    db.get_pool(path).close()
+    return results
+
+
+def bench_similarity(rows, operations):
+    """Time similarity lookups against an index of `rows` descriptions drawn from a small vocabulary."""
+    rng = random.Random(0)
+    started = time.perf_counter()
+    index = build_index((n, " ".join(rng.sample(SIMILARITY_WORDS, 5))) for n in range(rows))
+    results = {"build_seconds": time.perf_counter() - started}
+    results["lookup"] = timed_ops(
+        lambda i: index.lookup(SIMILARITY_LOOKUPS[i % len(SIMILARITY_LOOKUPS)]), operations
+    )
+    return results
+
+
+def git_commit():
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=ROOT, capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+
+def compare(current, baseline, prefix=""):
+    """Print metrics that moved by more than 10% against a baseline result."""
+    for key, value in current.items():
+        old = baseline.get(key) if isinstance(baseline, dict) else None
+        name = f"{prefix}{key}"
+        if isinstance(value, dict):
+            compare(value, old or {}, f"{name}.")
+        elif isinstance(value, (int, float)) and isinstance(old, (int, float)) and old:
+            change = (value - old) / old
+            if abs(change) > 0.10 and key not in ("count", "timestamp"):
+                print(f"{name}: {old:.3f} -> {value:.3f} ({change:+.0%})")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Run the offline benchmark suite.")
+    parser.add_argument("--sizes", default="10000,100000,1000000",
+                        help="comma-separated library sizes for the storage benchmarks")
+    parser.add_argument("--operations", type=int, default=200, help="operations per storage benchmark")
+    parser.add_argument("--iterations", type=int, default=200, help="generation flow iterations")
+    parser.add_argument("--latency", type=float, default=0.0, help="simulated model latency in seconds")
+    parser.add_argument("--similarity-rows", type=int, default=100000,
+                        help="descriptions in the similarity lookup benchmark")
+    parser.add_argument("--prompt-budget", type=int, default=PROMPT_TOKEN_BUDGET,
+                        help="tokens of user input per prompt in the generation benchmark")
+    parser.add_argument("--output", help="result file (default: benchmarks/results/<time>-<commit>.json)")
+    parser.add_argument("--compare", help="earlier result file to compare against")
+    args = parser.parse_args(argv)
+
+    workdir = tempfile.mkdtemp(prefix="sqlgen-bench-")
+    try:
+        generation_db = os.path.join(workdir, "generation.db")
+        db.init_db(generation_db)
+        results = {
+            "commit": git_commit(),
+            "timestamp": int(time.time()),
+            "python": platform.python_version(),
+            "sqlite": sqlite3.sqlite_version,
+            "startup": bench_startup(),
+            "generation": bench_generation(generation_db, args.iterations, args.latency, args.prompt_budget),
+            "similarity": bench_similarity(args.similarity_rows, args.operations),
+            "storage": {},
+        }
+        for size in (int(size) for size in args.sizes.split(",") if size):
+            print(f"Storage benchmark at {size} rows...", flush=True)
+            results["storage"][str(size)] = bench_storage(workdir, size, args.operations)
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    output = args.output or os.path.join(
+        RESULTS_DIR, f"{time.strftime('%Y%m%d-%H%M%S')}-{results['commit']}.json"
+    )
+    os.makedirs(os.path.dirname(output) or ".", exist_ok=True)
+    with open(output, "w", encoding="utf-8") as f:
+        json.dump(results, f, indent=2)
+    print(f"Results written to {output}")
+
+    startup = results["startup"]
+    print(f"Startup: app import {startup['total_ms']:.0f} ms")
+    total = results["generation"]["total"]
+    print(f"Generation flow: p50 {total['p50_ms']:.2f} ms, p95 {total['p95_ms']:.2f} ms")
+    lookup = results["similarity"]["lookup"]
+    print(f"Similarity lookup at {args.similarity_rows} descriptions: "
+          f"p50 {lookup['p50_ms']:.2f} ms, p95 {lookup['p95_ms']:.2f} ms")
+    if lookup["p95_ms"] > SIMILARITY_BUDGET_MS:
+        print(f"  slower than the {SIMILARITY_BUDGET_MS:.0f} ms budget")
+    for size, storage in results["storage"].items():
+        print(f"{size} rows: save {storage['save_query']['ops_per_sec']:.0f}/s, "
+              f"page {storage['list_queries_page']['p50_ms']:.2f} ms, "
+              f"search {storage['search_queries']['p50_ms']:.2f} ms, "
+              f"delete {storage['delete_query']['ops_per_sec']:.0f}/s")
+
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as f:
+            compare(results, json.load(f))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,114 @@
+import hashlib
+import threading
+import time
+from db import get_pool
+
+CACHE_FILE = "response_cache.db"
+
+
+def normalize_description(description):
+    """Normalize a description so trivially different inputs share a cache key."""
+    return " ".join(description.lower().split()).rstrip(" .?!;")
+
+
+def make_key(description, model_name, template_version):
+    """Build the cache key from the normalized description, model and template version."""
+    raw = "\x1f".join([normalize_description(description), model_name, template_version])
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+
+class ResponseCache:
+    """SQLite-backed prompt/response cache with LRU + TTL eviction and a size cap."""
+
+    def __init__(self, path=CACHE_FILE, max_entries=5000, ttl_seconds=7 * 24 * 3600, on_lookup=None):
+        self.path = path
+        # Optional callback(hit, duration_ms) invoked after every lookup
+        self.on_lookup = on_lookup
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._pool = get_pool(path)
+        with self._pool.connection() as conn:
+            conn.execute("""
+            CREATE TABLE IF NOT EXISTS response_cache (
+                key TEXT PRIMARY KEY,
+                model TEXT NOT NULL,
+                template_version TEXT NOT NULL,
+                response TEXT NOT NULL,
+                created_at INTEGER NOT NULL,
+                last_access INTEGER NOT NULL
+            )
+            """)
+            conn.execute(
+                "CREATE INDEX IF NOT EXISTS idx_response_cache_last_access ON response_cache (last_access)"
+            )
+
+    def get(self, description, model_name, template_version):
+        """Return the cached response, or None on a miss or an expired entry."""
+        key = make_key(description, model_name, template_version)
+        now = int(time.time())
+        started = time.perf_counter()
+        with self._pool.connection() as conn:
+            row = conn.execute(
+                "SELECT response, created_at FROM response_cache WHERE key = ?", (key,)
+            ).fetchone()
+            if row is not None and now - row[1] > self.ttl_seconds:
+                conn.execute("DELETE FROM response_cache WHERE key = ?", (key,))
+                row = None
+            if row is not None:
+                conn.execute("UPDATE response_cache SET last_access = ? WHERE key = ?", (now, key))
+        with self._lock:
+            if row is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+        if self.on_lookup:
+            self.on_lookup(row is not None, (time.perf_counter() - started) * 1000)
+        return row[0] if row else None
+
+    def put(self, description, model_name, template_version, response):
+        """Store a response and evict expired and least recently used entries over the cap."""
+        key = make_key(description, model_name, template_version)
+        now = int(time.time())
+        with self._pool.connection() as conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO response_cache "
+                "(key, model, template_version, response, created_at, last_access) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                (key, model_name, template_version, response, now, now)
+            )
+            conn.execute(
+                "DELETE FROM response_cache WHERE created_at < ?", (now - self.ttl_seconds,)
+            )
+            conn.execute(
+                "DELETE FROM response_cache WHERE key IN ("
+                "SELECT key FROM response_cache ORDER BY last_access DESC LIMIT -1 OFFSET ?)",
+                (self.max_entries,)
+            )
+
+    def get_or_generate(self, description, model_name, template_version, generate):
+        """Return the cached response, calling generate() and storing its result on a miss."""
+        response = self.get(description, model_name, template_version)
+        if response is None:
+            response = generate()
+            self.put(description, model_name, template_version, response)
+        return response
+
+    def stats(self):
+        """Return hit/miss counters and the current number of entries."""
+        with self._pool.connection() as conn:
+            size = conn.execute("SELECT COUNT(*) FROM response_cache").fetchone()[0]
+        total = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / total if total else 0.0,
+            "entries": size,
+        }
+
+    def clear(self):
+        """Remove every cached response."""
+        with self._pool.connection() as conn:
+            conn.execute("DELETE FROM response_cache")
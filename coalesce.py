@@ -0,0 +1,147 @@
+"""Sharing model calls across the sessions of one process.
+
+Identical prompts that are already in flight are not sent again: later
+callers wait for the first call and receive its result (single-flight).
+All calls pass through one ModelGate, which bounds how many run at once,
+spaces them with a token bucket and retries rate limits and transient
+server errors with jittered exponential backoff.
+"""
+import threading
+import time
+from concurrent.futures import Future
+
+from ratelimit import TokenBucket, backoff_delay, is_retryable
+
+
+class ModelBusyError(Exception):
+    """The model kept rejecting requests (rate limit or outage) after all retries."""
+
+
+BUSY_MESSAGE = "The model is busy right now (too many requests). Please try again in a few seconds."
+
+
+class SingleFlight:
+    """Lets concurrent callers with the same key share one call."""
+
+    def __init__(self):
+        self._calls = {}
+        self._lock = threading.Lock()
+
+    def join(self, key):
+        """Return (future, leader): the leader makes the call, everyone else waits on the future."""
+        with self._lock:
+            future = self._calls.get(key)
+            if future is not None:
+                return future, False
+            future = self._calls[key] = Future()
+            return future, True
+
+    def finish(self, key, result=None, error=None):
+        """Publish the leader's result (or error) to the waiting callers."""
+        with self._lock:
+            future = self._calls.pop(key)
+        if error is not None:
+            future.set_exception(error)
+        else:
+            future.set_result(result)
+
+    def do(self, key, func):
+        """Call func() unless a call with the same key is in flight, then share its result."""
+        future, leader = self.join(key)
+        if not leader:
+            return future.result()
+        try:
+            result = func()
+        except BaseException as e:
+            self.finish(key, error=e)
+            raise
+        self.finish(key, result)
+        return result
+
+
+class ModelGate:
+    """Process-wide concurrency bound, rate limit and retry policy for model calls."""
+
+    def __init__(self, rate=1.0, capacity=None, max_concurrent=4, retries=3, base_delay=1.0, max_delay=30.0):
+        self._bucket = TokenBucket(rate, capacity)
+        self._semaphore = threading.BoundedSemaphore(max_concurrent)
+        self.retries = retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+
+    def call(self, func):
+        """Run func() within the limits, retrying retryable failures."""
+        for attempt in range(self.retries + 1):
+            with self._semaphore:
+                self._bucket.acquire()
+                try:
+                    return func()
+                except Exception as e:
+                    error = e
+            # Back off without holding a slot, so other calls run in the meantime
+            self._handle_failure(error, attempt)
+
+    def stream(self, open_stream):
+        """Iterate open_stream() within the limits; retries only before the first chunk arrives.
+
+        The slot is held until the first chunk arrives and not while the
+        caller consumes the rest: callers pause a stream to make other model
+        calls (e.g. a repair), which would otherwise wait on their own slot.
+        """
+        for attempt in range(self.retries + 1):
+            with self._semaphore:
+                self._bucket.acquire()
+                try:
+                    chunks = iter(open_stream())
+                    first = next(chunks, None)
+                    break
+                except Exception as e:
+                    error = e
+            self._handle_failure(error, attempt)
+        if first is None:
+            return
+        yield first
+        yield from chunks
+
+    def _handle_failure(self, error, attempt):
+        if not is_retryable(error):
+            raise error
+        if attempt == self.retries:
+            raise ModelBusyError(BUSY_MESSAGE) from error
+        time.sleep(backoff_delay(attempt, self.base_delay, self.max_delay))
+
+
+class CoalescingBackend:
+    """Wraps a model backend with single-flight sharing of identical prompts and a shared ModelGate."""
+
+    def __init__(self, backend, gate, flight=None):
+        self.backend = backend
+        self.gate = gate
+        self.flight = flight or SingleFlight()
+        self.model_name = backend.model_name
+
+    def generate(self, prompt):
+        return self.flight.do(
+            ("generate", self.model_name, prompt),
+            lambda: self.gate.call(lambda: self.backend.generate(prompt)),
+        )
+
+    def stream(self, prompt):
+        key = ("stream", self.model_name, prompt)
+        future, leader = self.flight.join(key)
+        if not leader:
+            # Followers get the finished text in one piece
+            yield future.result()
+            return
+        chunks = []
+        try:
+            for chunk in self.gate.stream(lambda: self.backend.stream(prompt)):
+                chunks.append(chunk)
+                yield chunk
+        except GeneratorExit:
+            self.flight.finish(key, error=RuntimeError("The shared model response was abandoned."))
+            raise
+        except BaseException as e:
+            self.flight.finish(key, error=e)
+            raise
+        self.flight.finish(key, "".join(chunks))
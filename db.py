@@ -1,33 +1,329 @@
+import re
 import sqlite3
-from datetime import datetime
+import threading
+import queue
+import time
+from contextlib import contextmanager
+
+import migrations
 
 DB_FILE = "queries.db"
 
-def init_db():
-    """Initialize the database and create a table if it doesn't exist."""
-    with sqlite3.connect(DB_FILE) as conn:
-        conn.execute("""
-        CREATE TABLE IF NOT EXISTS queries (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            query TEXT NOT NULL,
-            timestamp TEXT NOT NULL
+# Applied to every new connection.  WAL lets readers proceed while a writer
+# commits, and busy_timeout makes writers wait instead of failing with
+# "database is locked".  auto_vacuum only takes effect on a new file (see
+# maintenance.py for existing ones) and must come before journal_mode.
+PRAGMAS = (
+    "PRAGMA auto_vacuum = INCREMENTAL",
+    "PRAGMA journal_mode = WAL",
+    "PRAGMA synchronous = NORMAL",
+    "PRAGMA busy_timeout = 5000",
+    "PRAGMA temp_store = MEMORY",
+    "PRAGMA cache_size = -16000",
+    "PRAGMA foreign_keys = ON",
+)
+
+# Statements are kept as module constants so each pooled connection's
+# statement cache reuses the compiled (prepared) statement across calls.
+# Long query and explanation text is stored compressed: statements pack it
+# on the way in and unpack it on the way out (see migrations.pack_text).
+INSERT_QUERY = (
+    "INSERT INTO queries (description, query, explanation, timestamp, content_hash, last_used) "
+    "VALUES (?1, pack_text(?2), pack_text(?3), ?4, ?5, ?4)"
+)
+# Saving content that is already in the library counts as another use of it
+# and fills in a missing explanation, instead of adding a duplicate row.
+# A use count above one tells the caller the row already existed.
+UPSERT_QUERY = INSERT_QUERY + """
+ON CONFLICT (content_hash) DO UPDATE SET
+    use_count = use_count + 1,
+    last_used = excluded.last_used,
+    explanation = CASE WHEN explanation = '' THEN excluded.explanation ELSE explanation END
+RETURNING id, use_count > 1
+"""
+IMPORT_QUERY = INSERT_QUERY + " ON CONFLICT (content_hash) DO NOTHING"
+RECORD_USE = "UPDATE queries SET use_count = use_count + 1, last_used = ? WHERE id = ?"
+SELECT_COLUMNS = "id, description, unpack_text(query), unpack_text(explanation), timestamp"
+SELECT_QUERIES = f"SELECT {SELECT_COLUMNS} FROM queries"
+SELECT_BATCH = f"SELECT {SELECT_COLUMNS} FROM queries WHERE id > ? ORDER BY id LIMIT ?"
+SELECT_QUERY = f"SELECT {SELECT_COLUMNS} FROM queries WHERE id = ?"
+SELECT_DESCRIPTIONS = "SELECT id, description FROM queries"
+SELECT_PAGE = (
+    "SELECT id, description, unpack_text(query), timestamp FROM queries WHERE id < ? ORDER BY id DESC LIMIT ?"
+)
+SELECT_POPULAR_PAGE = """
+SELECT id, description, unpack_text(query), timestamp, use_count FROM queries
+WHERE (use_count, id) < (?, ?)
+ORDER BY use_count DESC, id DESC
+LIMIT ?
+"""
+SELECT_EXPLANATION = "SELECT unpack_text(explanation) FROM queries WHERE id = ?"
+SEARCH_QUERIES = """
+SELECT q.id, q.description, unpack_text(q.query), q.timestamp
+FROM queries_fts
+JOIN queries AS q ON q.id = queries_fts.rowid
+WHERE queries_fts MATCH ?
+ORDER BY bm25(queries_fts, 10.0, 5.0, 1.0), q.id DESC
+LIMIT ? OFFSET ?
+"""
+UPDATE_EXPLANATION = "UPDATE queries SET explanation = pack_text(?) WHERE id = ?"
+DELETE_QUERY = "DELETE FROM queries WHERE id = ?"
+SELECT_RETENTION = "SELECT max_age_days, max_rows FROM retention_policy WHERE id = 1"
+UPDATE_RETENTION = "UPDATE retention_policy SET max_age_days = ?, max_rows = ? WHERE id = 1"
+
+
+class ConnectionPool:
+    """Thread-safe pool of SQLite connections to a single database file."""
+
+    def __init__(self, path, size=8, timeout=10.0):
+        self.path = path
+        self.size = size
+        self.timeout = timeout
+        self._idle = queue.LifoQueue()
+        self._created = 0
+        self._lock = threading.Lock()
+
+    def _connect(self):
+        conn = sqlite3.connect(
+            self.path, timeout=self.timeout, check_same_thread=False, cached_statements=256
+        )
+        for pragma in PRAGMAS:
+            conn.execute(pragma)
+        migrations.register_functions(conn)
+        return conn
+
+    @contextmanager
+    def connection(self):
+        """Borrow a connection; the enclosed block runs as one transaction."""
+        try:
+            conn = self._idle.get_nowait()
+        except queue.Empty:
+            with self._lock:
+                create = self._created < self.size
+                if create:
+                    self._created += 1
+            if create:
+                try:
+                    conn = self._connect()
+                except Exception:
+                    with self._lock:
+                        self._created -= 1
+                    raise
+            else:
+                conn = self._idle.get(timeout=self.timeout)
+        try:
+            with conn:
+                yield conn
+        finally:
+            self._idle.put(conn)
+
+    def close(self):
+        """Close every idle connection."""
+        while True:
+            try:
+                conn = self._idle.get_nowait()
+            except queue.Empty:
+                break
+            conn.close()
+            with self._lock:
+                self._created -= 1
+
+
+_pools = {}
+_pools_lock = threading.Lock()
+
+
+def get_pool(path=DB_FILE):
+    """Return the process-wide connection pool for a database file."""
+    with _pools_lock:
+        pool = _pools.get(path)
+        if pool is None:
+            pool = _pools[path] = ConnectionPool(path)
+        return pool
+
+
+_migrated = set()
+_migrate_lock = threading.Lock()
+
+
+def init_db(path=DB_FILE):
+    """Bring the database schema up to date; runs the migrations once per process."""
+    if path in _migrated:
+        return
+    with _migrate_lock:
+        if path in _migrated:
+            return
+        with get_pool(path).connection() as conn:
+            migrations.migrate(conn)
+        _migrated.add(path)
+
+
+def save_query(description, query, explanation, path=DB_FILE):
+    """Save a query, its description, and explanation; return its row ID.
+
+    Content that is already saved keeps its ID and gets its use count bumped.
+    """
+    return upsert_query(description, query, explanation, path)[0]
+
+
+def upsert_query(description, query, explanation, path=DB_FILE):
+    """Save a query like save_query; return (row ID, whether the content was already saved).
+
+    An existing row may have had its missing explanation filled in.
+    """
+    with get_pool(path).connection() as conn:
+        query_id, existed = conn.execute(
+            UPSERT_QUERY,
+            (description, query, explanation, int(time.time()), migrations.content_hash(description, query))
+        ).fetchone()
+        return query_id, bool(existed)
+
+
+def save_queries(rows, path=DB_FILE):
+    """Save many (description, query, explanation) rows in one transaction."""
+    now = int(time.time())
+    with get_pool(path).connection() as conn:
+        conn.executemany(
+            UPSERT_QUERY,
+            [(description, query, explanation, now, migrations.content_hash(description, query))
+             for description, query, explanation in rows]
         )
-        """)
-        conn.commit()
 
-def save_query_to_db(query):
-    """Save a query to the database with a timestamp."""
-    with sqlite3.connect(DB_FILE) as conn:
-        conn.execute("INSERT INTO queries (query, timestamp) VALUES (?, ?)", (query, datetime.now()))
-        conn.commit()
 
-def get_saved_queries():
+def get_saved_queries(path=DB_FILE):
     """Retrieve all saved queries from the database."""
-    with sqlite3.connect(DB_FILE) as conn:
-        return conn.execute("SELECT id, query, timestamp FROM queries").fetchall()
-
-def delete_query(query_id):
-    """Delete a query from the database using its ID."""
-    with sqlite3.connect(DB_FILE) as conn:
-        conn.execute("DELETE FROM queries WHERE id = ?", (query_id,))
-        conn.commit()
+    with get_pool(path).connection() as conn:
+        return conn.execute(SELECT_QUERIES).fetchall()
+
+
+def iter_queries(path=DB_FILE, batch_size=1000):
+    """Yield every saved query in ID order, reading one keyset batch at a time.
+
+    Memory use is constant and no connection or read transaction is held
+    between batches, so exporting a large library does not block writers.
+    """
+    last_id = 0
+    while True:
+        with get_pool(path).connection() as conn:
+            rows = conn.execute(SELECT_BATCH, (last_id, batch_size)).fetchall()
+        if not rows:
+            return
+        yield from rows
+        last_id = rows[-1][0]
+
+
+def import_queries(rows, path=DB_FILE, batch_size=500):
+    """Insert (description, query, explanation, timestamp) rows, skipping content already saved.
+
+    Rows whose content hash is already in the library, or earlier in the
+    import, are skipped by the unique index.  Rows are written with
+    executemany, one transaction per batch.  A missing timestamp means now.
+    Returns (inserted, skipped).
+    """
+    inserted = skipped = 0
+    batch = []
+
+    def flush():
+        nonlocal inserted, skipped
+        with get_pool(path).connection() as conn:
+            written = conn.executemany(IMPORT_QUERY, batch).rowcount
+        inserted += written
+        skipped += len(batch) - written
+        batch.clear()
+
+    now = int(time.time())
+    for description, query, explanation, timestamp in rows:
+        batch.append((description, query, explanation, timestamp or now,
+                      migrations.content_hash(description, query)))
+        if len(batch) >= batch_size:
+            flush()
+    if batch:
+        flush()
+    return inserted, skipped
+
+
+def get_query(query_id, path=DB_FILE):
+    """Retrieve a single saved query by ID."""
+    with get_pool(path).connection() as conn:
+        return conn.execute(SELECT_QUERY, (query_id,)).fetchone()
+
+
+def list_queries(before_id=None, limit=20, path=DB_FILE):
+    """Return one page of saved queries, newest first, without explanations.
+
+    Pages are keyset-paginated: pass the smallest ID of the previous page as
+    before_id to get the next one.
+    """
+    if before_id is None:
+        before_id = 2 ** 63 - 1
+    with get_pool(path).connection() as conn:
+        return conn.execute(SELECT_PAGE, (before_id, limit)).fetchall()
+
+
+def list_popular_queries(cursor=None, limit=20, path=DB_FILE):
+    """Return one page of saved queries, most used first, as (id, description, query, timestamp, use_count).
+
+    Pages are keyset-paginated on (use_count, id): pass the last row's
+    (use_count, id) as cursor to get the next one.
+    """
+    use_count, before_id = cursor or (2 ** 63 - 1, 2 ** 63 - 1)
+    with get_pool(path).connection() as conn:
+        return conn.execute(SELECT_POPULAR_PAGE, (use_count, before_id, limit)).fetchall()
+
+
+def record_use(query_id, path=DB_FILE):
+    """Count a reuse of a saved query."""
+    with get_pool(path).connection() as conn:
+        conn.execute(RECORD_USE, (int(time.time()), query_id))
+
+
+def match_expression(text):
+    """Turn free text into an FTS5 query matching every word as a prefix."""
+    return " ".join(f'"{word}"*' for word in re.findall(r"\w+", text))
+
+
+def search_queries(text, limit=20, offset=0, path=DB_FILE):
+    """Full-text search over description, query and explanation, best matches first."""
+    expression = match_expression(text)
+    if not expression:
+        return []
+    with get_pool(path).connection() as conn:
+        return conn.execute(SEARCH_QUERIES, (expression, limit, offset)).fetchall()
+
+
+def get_explanation(query_id, path=DB_FILE):
+    """Retrieve the explanation of a saved query, or None if it does not exist."""
+    with get_pool(path).connection() as conn:
+        row = conn.execute(SELECT_EXPLANATION, (query_id,)).fetchone()
+        return row[0] if row else None
+
+
+def get_descriptions(path=DB_FILE):
+    """Retrieve (id, description) for every saved query."""
+    with get_pool(path).connection() as conn:
+        return conn.execute(SELECT_DESCRIPTIONS).fetchall()
+
+
+def update_explanation(query_id, explanation, path=DB_FILE):
+    """Fill in the explanation of an already saved query."""
+    with get_pool(path).connection() as conn:
+        conn.execute(UPDATE_EXPLANATION, (explanation, query_id))
+
+
+def delete_query(query_id, path=DB_FILE):
+    """Delete a query from the database using its ID; return whether it existed."""
+    with get_pool(path).connection() as conn:
+        return conn.execute(DELETE_QUERY, (query_id,)).rowcount > 0
+
+
+def get_retention_policy(path=DB_FILE):
+    """Return the stored (max_age_days, max_rows) retention policy; zero disables a rule."""
+    with get_pool(path).connection() as conn:
+        max_age_days, max_rows = conn.execute(SELECT_RETENTION).fetchone()
+        return max_age_days, max_rows
+
+
+def set_retention_policy(max_age_days=0, max_rows=0, path=DB_FILE):
+    """Store the retention policy applied by every later maintenance pass."""
+    with get_pool(path).connection() as conn:
+        conn.execute(UPDATE_RETENTION, (max_age_days, max_rows))
@@ -0,0 +1,104 @@
+"""Read-only execution of queries against a user's SQLite database.
+
+Rows are fetched in batches into a columnar buffer and capped, so a huge
+result set is never held in memory, and a progress handler aborts
+statements that run past a wall-clock timeout.
+"""
+import sqlite3
+import time
+
+MAX_ROWS = 1000
+TIMEOUT_SECONDS = 5.0
+FETCH_SIZE = 200
+# SQLite virtual machine instructions between timeout checks
+PROGRESS_STEPS = 10000
+
+
+class QueryResult:
+    """Columnar preview of a query result."""
+
+    def __init__(self, columns, data, row_count, truncated, elapsed):
+        self.columns = columns  # column names, in order
+        self.data = data  # column name -> list of values
+        self.row_count = row_count
+        self.truncated = truncated  # more rows existed beyond the cap
+        self.elapsed = elapsed  # seconds
+
+    def page(self, number, size):
+        """Rows [number * size, (number + 1) * size) as a column -> values dict."""
+        start = number * size
+        return {column: self.data[column][start:start + size] for column in self.columns}
+
+
+# The only actions a query may take; everything else (ATTACH, writes, DDL) is denied
+READ_ACTIONS = {sqlite3.SQLITE_SELECT, sqlite3.SQLITE_READ, sqlite3.SQLITE_FUNCTION, sqlite3.SQLITE_RECURSIVE}
+# Pragmas that only report; data_version is also read internally by full-text tables
+READ_PRAGMAS = {
+    "data_version", "table_info", "table_xinfo", "table_list", "index_list", "index_info", "index_xinfo",
+    "foreign_key_list",
+}
+
+
+def authorize_read(action, arg1, arg2, *_):
+    if action in READ_ACTIONS:
+        return sqlite3.SQLITE_OK
+    if action == sqlite3.SQLITE_PRAGMA and arg1.lower() in READ_PRAGMAS:
+        return sqlite3.SQLITE_OK
+    # Opening a virtual table (e.g. full-text) checks schema access; mode=ro still prevents any write
+    if action == sqlite3.SQLITE_UPDATE and arg1 == "sqlite_master":
+        return sqlite3.SQLITE_OK
+    return sqlite3.SQLITE_DENY
+
+
+def connect_read_only(path):
+    """Open a SQLite database so that no statement can modify it or reach another file."""
+    conn = sqlite3.connect(f"file:{path}?mode=ro", uri=True, check_same_thread=False)
+    conn.execute("PRAGMA query_only = ON")
+    # mode=ro and query_only still let ATTACH create and write other database files
+    conn.setlimit(sqlite3.SQLITE_LIMIT_ATTACHED, 0)
+    conn.set_authorizer(authorize_read)
+    return conn
+
+
+def run_query(path, sql, max_rows=MAX_ROWS, timeout=TIMEOUT_SECONDS, fetch_size=FETCH_SIZE):
+    """Execute one statement read-only and return a QueryResult of at most max_rows rows.
+
+    Raises TimeoutError when the statement runs longer than timeout seconds
+    and sqlite3.Error for anything SQLite rejects.
+    """
+    conn = connect_read_only(path)
+    started = time.perf_counter()
+    deadline = started + timeout
+    # A non-zero return value interrupts the running statement
+    conn.set_progress_handler(lambda: time.perf_counter() > deadline, PROGRESS_STEPS)
+    try:
+        cursor = conn.execute(sql)
+        columns = [_unique_name(d[0], i, cursor.description) for i, d in enumerate(cursor.description or ())]
+        data = {column: [] for column in columns}
+        row_count = 0
+        truncated = False
+        while columns:
+            rows = cursor.fetchmany(min(fetch_size, max_rows + 1 - row_count))
+            if not rows:
+                break
+            if row_count + len(rows) > max_rows:
+                rows = rows[:max_rows - row_count]
+                truncated = True
+            for column, values in zip(columns, zip(*rows)):
+                data[column].extend(values)
+            row_count += len(rows)
+            if truncated:
+                break
+    except sqlite3.OperationalError as e:
+        if str(e) == "interrupted":
+            raise TimeoutError(f"The query was stopped after {timeout:g} seconds.") from None
+        raise
+    finally:
+        conn.close()
+    return QueryResult(columns, data, row_count, truncated, time.perf_counter() - started)
+
+
+def _unique_name(name, index, description):
+    # Repeated column names (e.g. "id" from a join) would overwrite each other
+    earlier = [d[0] for d in description[:index]]
+    return f"{name} ({earlier.count(name) + 1})" if name in earlier else name
@@ -0,0 +1,284 @@
+import json
+import re
+import threading
+from collections import OrderedDict
+from concurrent.futures import Future, ThreadPoolExecutor
+
+from metrics import estimate_tokens
+
+# Bump when the prompt templates change so stale cached responses are not reused
+TEMPLATE_VERSION = "v4"
+
+# Tokens of user input (descriptions, queries) a prompt may carry; longer input is shortened
+PROMPT_TOKEN_BUDGET = 1000
+# Marks where shortened input was cut; free of quotes so templates stay well-formed
+TRUNCATION_MARKER = "\n[...]\n"
+# A shortened value keeps at least this many tokens, even when kept values use up the budget
+MIN_SHORTENED_TOKENS = 25
+
+# Queries are generated once in standard SQL and rewritten locally per dialect (see transpile.py)
+STANDARD_SQL = "Write standard SQL: LIMIT for row limits, || to join strings, CURRENT_DATE and INTERVAL for dates."
+
+# Templates carry no indentation or blank lines: every character is sent, and billed, on each call
+QUERY_TEMPLATE = (
+    "Write an SQL query for this description:\n'{description}'\n" + STANDARD_SQL + "\n"
+    "Reply with only the SQL query."
+)
+
+EXPLANATION_TEMPLATE = "Give a detailed explanation of an SQL query for this description:\n'{description}'"
+
+EXPLAIN_QUERY_TEMPLATE = "Give a detailed explanation of this SQL query:\n{query}"
+
+COMBINED_TEMPLATE = (
+    "Write an SQL query for this description:\n'{description}'\n" + STANDARD_SQL + "\n"
+    'Reply with one JSON object only: {{"query": "<the SQL query>", "explanation": "<a detailed explanation>"}}'
+)
+
+CANDIDATES_TEMPLATE = (
+    "Write {count} different SQL queries for this description:\n'{description}'\n" + STANDARD_SQL + "\n"
+    "Make them differ in how they reach the rows (joins, subqueries, filters) so the fastest can be picked. "
+    'Reply with one JSON object only: {{"queries": ["<SQL query>", ...]}}'
+)
+
+REPAIR_TEMPLATE = "This SQL query fails with the error: {error}\n{query}\nReply with only the corrected SQL query."
+
+EXPLANATION_MARKER = "---EXPLANATION---"
+
+STREAM_TEMPLATE = (
+    "Write an SQL query for this description:\n'{description}'\n" + STANDARD_SQL + "\n"
+    "Write only the SQL query, then a line containing exactly ---EXPLANATION--- and a detailed explanation."
+)
+
+SCHEMA_PREFIX = "Use only the tables and columns of this database schema:\n{schema}\n"
+
+FENCE_PATTERN = re.compile(r"^```[a-zA-Z]*\s*|\s*```$")
+FENCED_BLOCKS_PATTERN = re.compile(r"```[a-zA-Z]*[ \t]*\n(.*?)```", re.S)
+
+
+def parse_combined_response(text):
+    """Extract (query, explanation) from a JSON model response, or None if it does not parse."""
+    if not text:
+        return None
+    text = FENCE_PATTERN.sub("", text.strip())
+    start, end = text.find("{"), text.rfind("}")
+    if start == -1 or end <= start:
+        return None
+    try:
+        data = json.loads(text[start:end + 1], strict=False)
+    except ValueError:
+        return None
+    if not isinstance(data, dict):
+        return None
+    query, explanation = data.get("query"), data.get("explanation")
+    if not isinstance(query, str) or not isinstance(explanation, str):
+        return None
+    if not query.strip() or not explanation.strip():
+        return None
+    return query.strip(), explanation.strip()
+
+
+def parse_candidates(text):
+    """Distinct candidate queries of a response: its JSON "queries" list, else its fenced blocks, else the text."""
+    if not text:
+        return []
+    candidates = None
+    start, end = text.find("{"), text.rfind("}")
+    if start != -1 and end > start:
+        try:
+            data = json.loads(text[start:end + 1], strict=False)
+        except ValueError:
+            data = None
+        if isinstance(data, dict) and isinstance(data.get("queries"), list):
+            candidates = [query for query in data["queries"] if isinstance(query, str)]
+    if candidates is None:
+        candidates = FENCED_BLOCKS_PATTERN.findall(text) or [text]
+    distinct = {}
+    for query in candidates:
+        query = clean_query(query)
+        # Candidates differing only in whitespace are the same query
+        distinct.setdefault(" ".join(query.split()), query)
+    return [query for key, query in distinct.items() if key]
+
+
+def compact(text):
+    """Strip every line of text and drop blank ones; indentation costs tokens and tells the model nothing."""
+    return "\n".join(line.strip() for line in str(text).splitlines() if line.strip())
+
+
+def shorten(text, max_tokens):
+    """Fit text into about max_tokens tokens, keeping its beginning and end around a marker."""
+    if estimate_tokens(text) <= max_tokens:
+        return text
+    room = max(max_tokens * 4 - len(TRUNCATION_MARKER), 0)
+    head = room * 2 // 3
+    tail = text[len(text) - (room - head):] if room > head else ""
+    return text[:head].rstrip() + TRUNCATION_MARKER + tail.lstrip()
+
+
+def build_prompt(template, budget=PROMPT_TOKEN_BUDGET, keep=(), **values):
+    """Format a template with compacted values that together fit into budget tokens.
+
+    Short values are kept whole and the longest ones are shortened to share
+    what is left; a budget of None or 0 only compacts.  Values named in keep
+    are never shortened, and the others share what they leave of the budget.
+    """
+    values = {name: compact(value) for name, value in values.items()}
+    if budget:
+        remaining = budget - sum(estimate_tokens(values[name]) for name in keep)
+        by_length = sorted((name for name in values if name not in keep), key=lambda name: len(values[name]))
+        for position, name in enumerate(by_length):
+            share = max(remaining // (len(by_length) - position), MIN_SHORTENED_TOKENS)
+            values[name] = shorten(values[name], share)
+            remaining -= estimate_tokens(values[name])
+    return template.format(**values)
+
+
+def with_schema(prompt, schema):
+    """Prefix a prompt with a schema digest; prompts are unchanged without one."""
+    return SCHEMA_PREFIX.format(schema=schema) + prompt if schema else prompt
+
+
+def clean_query(text):
+    """Strip surrounding whitespace and markdown fences from a query."""
+    return FENCE_PATTERN.sub("", text.strip()).strip()
+
+
+def split_streamed_response(chunks):
+    """Read streamed chunks up to the explanation marker.
+
+    Returns the query and an iterator over the remaining explanation chunks,
+    so the query can be shown before the explanation has finished generating.
+    """
+    chunks = iter(chunks)
+    buffer = ""
+    for chunk in chunks:
+        buffer += chunk
+        if EXPLANATION_MARKER in buffer:
+            query, rest = buffer.split(EXPLANATION_MARKER, 1)
+            return clean_query(query), _explanation_chunks(rest.lstrip(), chunks)
+    return clean_query(buffer), iter(())
+
+
+def _explanation_chunks(first, chunks):
+    if first:
+        yield first
+    yield from chunks
+
+
+def stream_query_and_explanation(stream, description, schema="", budget=PROMPT_TOKEN_BUDGET):
+    """Stream a query and its explanation from one model call.
+
+    stream is any callable taking a prompt and returning an iterator of text
+    chunks.  Returns the query and an iterator over explanation chunks; if the
+    response carried no explanation, the explanation prompt is streamed instead.
+    """
+    prompt = with_schema(build_prompt(STREAM_TEMPLATE, budget, description=description), schema)
+    query, explanation = split_streamed_response(stream(prompt))
+    return query, _explanation_or_fallback(explanation, stream, description, schema, budget)
+
+
+def _explanation_or_fallback(explanation, stream, description, schema, budget):
+    produced = False
+    for chunk in explanation:
+        produced = produced or bool(chunk.strip())
+        yield chunk
+    if not produced:
+        yield from stream(with_schema(build_prompt(EXPLANATION_TEMPLATE, budget, description=description), schema))
+
+
+def generate_separately(generate, description, schema="", budget=PROMPT_TOKEN_BUDGET):
+    """Issue the query and explanation prompts concurrently and return both texts."""
+    with ThreadPoolExecutor(max_workers=2) as pool:
+        query = pool.submit(
+            generate, with_schema(build_prompt(QUERY_TEMPLATE, budget, description=description), schema)
+        )
+        explanation = pool.submit(
+            generate, with_schema(build_prompt(EXPLANATION_TEMPLATE, budget, description=description), schema)
+        )
+        return query.result(), explanation.result()
+
+
+def generate_query_and_explanation(generate, description, schema="", budget=PROMPT_TOKEN_BUDGET):
+    """Generate (query, explanation) for a description with one structured model call.
+
+    generate is any callable taking a prompt and returning the response text;
+    schema is an optional schema digest to ground the query in, and budget
+    caps the tokens of the description sent (see build_prompt).  When the
+    structured response cannot be parsed, the two plain prompts are issued
+    concurrently instead.
+    """
+    parsed = parse_combined_response(
+        generate(with_schema(build_prompt(COMBINED_TEMPLATE, budget, description=description), schema))
+    )
+    if parsed is not None:
+        return parsed
+    return generate_separately(generate, description, schema, budget)
+
+
+def generate_candidates(generate, description, count=3, schema="", budget=PROMPT_TOKEN_BUDGET):
+    """Ask for up to count alternative queries for a description in one model call; returns the distinct ones."""
+    prompt = build_prompt(CANDIDATES_TEMPLATE, budget, description=description, count=count)
+    return parse_candidates(generate(with_schema(prompt, schema)))
+
+
+class ExplanationPrefetcher:
+    """Memoized explanation generation on a bounded background thread pool.
+
+    generate is any callable taking a query (plus any extra arguments given to
+    submit) and returning its explanation.
+    Each query is explained at most once per process; later requests for the
+    same query reuse the finished (or still running) result.
+    """
+
+    def __init__(self, generate, max_workers=4, max_entries=1000):
+        self._generate = generate
+        self._pool = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="explain")
+        self._futures = OrderedDict()
+        self._max_entries = max_entries
+        self._lock = threading.Lock()
+
+    def submit(self, query, *args):
+        """Start explaining a query in the background and return its future."""
+        with self._lock:
+            future = self._futures.get(query)
+            if future is not None:
+                return future
+            future = self._pool.submit(self._generate, query, *args)
+            self._remember(query, future)
+        # Outside the lock: a future that has already failed runs the callback right here
+        future.add_done_callback(lambda done: self._forget_failure(query, done))
+        return future
+
+    def put(self, query, explanation):
+        """Record an explanation that was produced elsewhere, e.g. streamed on demand."""
+        future = Future()
+        future.set_result(explanation)
+        with self._lock:
+            self._remember(query, future)
+
+    def get(self, query):
+        """Return the explanation if it is already available, without blocking."""
+        with self._lock:
+            future = self._futures.get(query)
+        if future is None or not future.done() or future.exception() is not None:
+            return None
+        return future.result()
+
+    def pending(self, query):
+        """Whether an explanation for the query is currently being generated."""
+        with self._lock:
+            future = self._futures.get(query)
+        return future is not None and not future.done()
+
+    def _remember(self, query, future):
+        self._futures[query] = future
+        self._futures.move_to_end(query)
+        while len(self._futures) > self._max_entries:
+            self._futures.popitem(last=False)
+
+    def _forget_failure(self, query, future):
+        # Drop failed attempts so the explanation can be requested again
+        if future.exception() is not None:
+            with self._lock:
+                if self._futures.get(query) is future:
+                    del self._futures[query]
@@ -0,0 +1,103 @@
+"""Process-wide cache of Query Library reads with write-driven invalidation.
+
+Pages are cached by the arguments that produced them.  Each write drops only
+the entries it can change:
+
+- a new query (always the highest id) can only appear on the first list
+  page and in search results; saving content that is already in the
+  library, or reusing a saved query, changes the "most used" order;
+- a deleted query invalidates the cached pages that contain it and, for
+  searches, the later pages of the same search whose offsets shift;
+- an updated explanation invalidates that query's explanation only;
+- a deleted query also drops its cached dialect variants.
+
+Entries also expire after a short TTL so writes from other processes, such
+as the batch CLI, show up eventually.
+"""
+import threading
+import time
+from collections import OrderedDict
+
+
+class LibraryCache:
+    """LRU cache of library pages and explanations."""
+
+    def __init__(self, max_entries=256, ttl_seconds=60):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self._entries = OrderedDict()  # key -> (loaded_at, value)
+        self._lock = threading.Lock()
+
+    def _get(self, key, load):
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and now - entry[0] < self.ttl_seconds:
+                self._entries.move_to_end(key)
+                return entry[1]
+        value = load()
+        with self._lock:
+            self._entries[key] = (now, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+        return value
+
+    def list_page(self, before_id, limit, load):
+        """Rows of a keyset page, loaded with load() on a miss."""
+        return self._get(("list", before_id, limit), load)
+
+    def popular_page(self, cursor, limit, load):
+        """Rows of a "most used" keyset page, loaded with load() on a miss."""
+        return self._get(("popular", cursor, limit), load)
+
+    def search_page(self, text, limit, offset, load):
+        """Rows of a search results page, loaded with load() on a miss."""
+        return self._get(("search", text, limit, offset), load)
+
+    def explanation(self, query_id, load):
+        """Explanation of a saved query, loaded with load() on a miss."""
+        return self._get(("explanation", query_id), load)
+
+    def variant(self, query_id, dialect, load):
+        """A saved query rewritten for a SQL dialect, made with load() on a miss."""
+        return self._get(("variant", query_id, dialect), load)
+
+    def saved(self, query_id):
+        """Invalidate the entries a newly saved query can appear in."""
+        with self._lock:
+            for key in list(self._entries):
+                if key[0] in ("search", "popular") or key[:2] == ("list", None):
+                    del self._entries[key]
+
+    def used(self, query_id):
+        """Invalidate the "most used" pages after a saved query's use count changed."""
+        with self._lock:
+            for key in list(self._entries):
+                if key[0] == "popular":
+                    del self._entries[key]
+
+    def deleted(self, query_id):
+        """Invalidate the entries that contained a deleted query."""
+        with self._lock:
+            shifted = {}  # search text -> first offset that contained the query
+            for key, (_, value) in list(self._entries.items()):
+                if key[0] in ("explanation", "variant"):
+                    if key[1] == query_id:
+                        del self._entries[key]
+                elif any(row[0] == query_id for row in value):
+                    del self._entries[key]
+                    if key[0] == "search":
+                        shifted[key[1]] = min(key[3], shifted.get(key[1], key[3]))
+            for key in list(self._entries):
+                if key[0] == "search" and key[1] in shifted and key[3] >= shifted[key[1]]:
+                    del self._entries[key]
+
+    def explanation_updated(self, query_id):
+        """Invalidate the cached explanation of one query."""
+        with self._lock:
+            self._entries.pop(("explanation", query_id), None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
@@ -0,0 +1,168 @@
+"""Bulk export and import of the Query Library.
+
+Example:
+    python library_io.py export library.jsonl
+    python library_io.py import library.parquet --db other.db
+
+Formats are JSONL, CSV and Parquet (which needs pyarrow), picked from the
+file extension unless --format is given.  Both directions stream: export
+reads the database in keyset batches and import writes in batches, so
+memory use does not grow with the size of the library.  Imported queries
+whose normalized description and SQL are already saved are skipped.
+"""
+import argparse
+import csv
+import json
+import os
+import sys
+import time
+
+import db
+
+FIELDS = ("description", "query", "explanation", "timestamp")
+FORMATS = ("jsonl", "csv", "parquet")
+PARQUET_BATCH_SIZE = 10000
+
+
+def detect_format(path):
+    extension = os.path.splitext(path)[1].lower().lstrip(".")
+    if extension in ("jsonl", "ndjson"):
+        return "jsonl"
+    if extension in ("csv", "parquet"):
+        return extension
+    raise ValueError(f"Cannot tell the format of {path}; use --format.")
+
+
+def import_pyarrow():
+    try:
+        import pyarrow
+        import pyarrow.parquet
+    except ImportError:
+        raise ValueError("Parquet files need pyarrow: pip install pyarrow") from None
+    return pyarrow
+
+
+def write_jsonl(rows, f):
+    for row in rows:
+        f.write(json.dumps(dict(zip(FIELDS, row)), ensure_ascii=False) + "\n")
+
+
+def write_csv(rows, f):
+    writer = csv.writer(f)
+    writer.writerow(FIELDS)
+    writer.writerows(rows)
+
+
+def write_parquet(rows, path):
+    pa = import_pyarrow()
+    schema = pa.schema([
+        ("description", pa.string()), ("query", pa.string()),
+        ("explanation", pa.string()), ("timestamp", pa.int64()),
+    ])
+    with pa.parquet.ParquetWriter(path, schema, compression="zstd") as writer:
+        batch = []
+        for row in rows:
+            batch.append(row)
+            if len(batch) >= PARQUET_BATCH_SIZE:
+                writer.write_table(pa.Table.from_pylist([dict(zip(FIELDS, r)) for r in batch], schema))
+                batch.clear()
+        if batch:
+            writer.write_table(pa.Table.from_pylist([dict(zip(FIELDS, r)) for r in batch], schema))
+
+
+def export_library(path, fmt=None, db_path=db.DB_FILE):
+    """Write every saved query to path; returns the number of rows written."""
+    fmt = fmt or detect_format(path)
+    db.init_db(db_path)
+    count = 0
+
+    def rows():
+        nonlocal count
+        for _, description, query, explanation, timestamp in db.iter_queries(db_path):
+            count += 1
+            yield description, query, explanation, timestamp
+
+    if fmt == "parquet":
+        write_parquet(rows(), path)
+    else:
+        with open(path, "w", newline="", encoding="utf-8") as f:
+            (write_jsonl if fmt == "jsonl" else write_csv)(rows(), f)
+    return count
+
+
+def to_row(record):
+    """(description, query, explanation, timestamp) from a dict, or None when it has no query."""
+    query = record.get("query")
+    if not isinstance(query, str) or not query.strip():
+        return None
+    timestamp = record.get("timestamp")
+    try:
+        timestamp = int(timestamp) if timestamp not in (None, "") else None
+    except (TypeError, ValueError):
+        timestamp = None
+    return str(record.get("description") or ""), query, str(record.get("explanation") or ""), timestamp
+
+
+def read_records(path, fmt):
+    """Yield the records of an export file as dicts."""
+    if fmt == "parquet":
+        pa = import_pyarrow()
+        for batch in pa.parquet.ParquetFile(path).iter_batches(batch_size=PARQUET_BATCH_SIZE):
+            yield from batch.to_pylist()
+        return
+    with open(path, newline="", encoding="utf-8") as f:
+        if fmt == "csv":
+            # Explanations can be longer than the default 128 KB field limit
+            csv.field_size_limit(sys.maxsize)
+            yield from csv.DictReader(f)
+        else:
+            for line in f:
+                if line.strip():
+                    yield json.loads(line)
+
+
+def import_library(path, fmt=None, db_path=db.DB_FILE, batch_size=500):
+    """Add the queries in path to the library; returns {"read", "imported", "skipped", "invalid"}."""
+    fmt = fmt or detect_format(path)
+    stats = {"read": 0, "invalid": 0}
+
+    def rows():
+        for record in read_records(path, fmt):
+            stats["read"] += 1
+            row = to_row(record) if isinstance(record, dict) else None
+            if row is None:
+                stats["invalid"] += 1
+                continue
+            yield row
+
+    db.init_db(db_path)
+    stats["imported"], stats["skipped"] = db.import_queries(rows(), db_path, batch_size)
+    return stats
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Export or import the Query Library.")
+    parser.add_argument("action", choices=["export", "import"])
+    parser.add_argument("file", help="JSONL, CSV or Parquet file")
+    parser.add_argument("--format", choices=FORMATS, help="file format (default: from the extension)")
+    parser.add_argument("--db", default=db.DB_FILE, help="database to export from or import into")
+    parser.add_argument("--batch-size", type=int, default=500, help="rows per database insert")
+    args = parser.parse_args(argv)
+
+    started = time.perf_counter()
+    try:
+        if args.action == "export":
+            count = export_library(args.file, args.format, args.db)
+            print(f"Exported {count} queries in {time.perf_counter() - started:.1f}s")
+        else:
+            stats = import_library(args.file, args.format, args.db, args.batch_size)
+            print(f"Read {stats['read']} rows in {time.perf_counter() - started:.1f}s: "
+                  f"{stats['imported']} imported, {stats['skipped']} already saved, "
+                  f"{stats['invalid']} without a query")
+    except (OSError, ValueError) as e:
+        parser.error(str(e))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
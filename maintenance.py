@@ -0,0 +1,232 @@
+"""Retention and compaction of queries.db, run off the request path.
+
+Example:
+    python maintenance.py --max-age-days 180 --max-rows 50000
+
+A maintenance pass deletes saved queries that fall outside the retention
+policy (least recently used first), folds old metric spans into rollups,
+returns free pages to the file system with incremental vacuum and truncates
+the write-ahead log.  Deletes and vacuum steps run in small transactions so
+requests are never blocked for long.  The policy is stored in the database,
+so the one set in the app's Settings survives restarts and applies to CLI
+runs that do not override it.  The app runs passes on a background thread an
+hour after startup and then hourly; the CLI runs one pass, e.g. from cron.
+
+A file created before incremental vacuum is only rewritten with a one-off
+VACUUM when asked to (Compact Now, --convert) or once free pages make up
+CONVERT_FREE_FRACTION of it, since the rewrite blocks writers while it runs.
+"""
+import argparse
+import os
+import sys
+import threading
+import time
+
+import db
+import metrics
+
+DEFAULT_INTERVAL_SECONDS = 3600
+# The app's first pass waits a full interval so it does not compete with startup
+FIRST_RUN_DELAY_SECONDS = DEFAULT_INTERVAL_SECONDS
+# Free share of a file without incremental vacuum at which a pass rewrites it anyway
+CONVERT_FREE_FRACTION = 0.25
+DELETE_BATCH_SIZE = 500
+VACUUM_STEP_PAGES = 1000
+# Pause between steps so writers waiting on the lock get a turn
+STEP_PAUSE_SECONDS = 0.05
+
+SELECT_EXPIRED = "SELECT id FROM queries WHERE last_used < ? ORDER BY last_used LIMIT ?"
+SELECT_LEAST_USED = "SELECT id FROM queries ORDER BY last_used, id LIMIT ?"
+
+
+def storage_stats(path=db.DB_FILE):
+    """Size of the database file and how much of it is free pages."""
+    with db.get_pool(path).connection() as conn:
+        page_size = conn.execute("PRAGMA page_size").fetchone()[0]
+        pages = conn.execute("PRAGMA page_count").fetchone()[0]
+        free_pages = conn.execute("PRAGMA freelist_count").fetchone()[0]
+        auto_vacuum = conn.execute("PRAGMA auto_vacuum").fetchone()[0]
+    wal_path = f"{path}-wal"
+    return {
+        "file_bytes": pages * page_size,
+        "free_bytes": free_pages * page_size,
+        "wal_bytes": os.path.getsize(wal_path) if os.path.exists(wal_path) else 0,
+        "incremental_vacuum": auto_vacuum == 2,
+    }
+
+
+def prune_queries(path=db.DB_FILE, max_age_days=0, max_rows=0):
+    """Delete saved queries outside the retention policy; returns their IDs.
+
+    max_age_days drops queries not saved or reused for that long; max_rows
+    keeps only the most recently used ones.  Zero disables either rule.
+    """
+    deleted = []
+
+    def delete_batches(select_ids):
+        while True:
+            with db.get_pool(path).connection() as conn:
+                ids = select_ids(conn)
+                conn.executemany(db.DELETE_QUERY, [(query_id,) for query_id in ids])
+            deleted.extend(ids)
+            if len(ids) < DELETE_BATCH_SIZE:
+                return
+            time.sleep(STEP_PAUSE_SECONDS)
+
+    if max_age_days:
+        cutoff = int(time.time()) - int(max_age_days * 86400)
+        delete_batches(lambda conn: [
+            row[0] for row in conn.execute(SELECT_EXPIRED, (cutoff, DELETE_BATCH_SIZE))
+        ])
+    if max_rows:
+        def least_used(conn):
+            excess = conn.execute("SELECT COUNT(*) FROM queries").fetchone()[0] - max_rows
+            limit = min(max(excess, 0), DELETE_BATCH_SIZE)
+            return [row[0] for row in conn.execute(SELECT_LEAST_USED, (limit,))]
+        delete_batches(least_used)
+    return deleted
+
+
+def needs_conversion(stats):
+    """Whether a file without incremental vacuum has enough free pages to be worth rewriting."""
+    return (
+        not stats["incremental_vacuum"]
+        and stats["file_bytes"] > 0
+        and stats["free_bytes"] >= CONVERT_FREE_FRACTION * stats["file_bytes"]
+    )
+
+
+def enable_incremental_vacuum(path=db.DB_FILE):
+    """Switch a file created without auto_vacuum over; rewrites it once with VACUUM."""
+    with db.get_pool(path).connection() as conn:
+        if conn.execute("PRAGMA auto_vacuum").fetchone()[0] == 2:
+            return False
+        conn.execute("PRAGMA auto_vacuum = INCREMENTAL")
+        conn.commit()
+        conn.execute("VACUUM")
+        return True
+
+
+def vacuum(path=db.DB_FILE):
+    """Release free pages in small steps, then truncate the WAL; returns the pages released."""
+    released = 0
+    while True:
+        with db.get_pool(path).connection() as conn:
+            free_pages = conn.execute("PRAGMA freelist_count").fetchone()[0]
+            if not free_pages:
+                break
+            # execute() would step the pragma once, freeing a single page; executescript runs it to completion
+            conn.executescript(f"PRAGMA incremental_vacuum({VACUUM_STEP_PAGES})")
+            step = free_pages - conn.execute("PRAGMA freelist_count").fetchone()[0]
+        if step <= 0:
+            break
+        released += step
+        time.sleep(STEP_PAUSE_SECONDS)
+    with db.get_pool(path).connection() as conn:
+        conn.execute("PRAGMA wal_checkpoint(TRUNCATE)").fetchall()
+    return released
+
+
+def run_maintenance(path=db.DB_FILE, max_age_days=None, max_rows=None, convert=False):
+    """One full maintenance pass; returns what it did.
+
+    max_age_days and max_rows default to the stored retention policy.
+    convert rewrites a file without incremental vacuum even when little of
+    it is free.
+    """
+    started = time.perf_counter()
+    db.init_db(path)
+    if max_age_days is None or max_rows is None:
+        stored_days, stored_rows = db.get_retention_policy(path)
+        max_age_days = stored_days if max_age_days is None else max_age_days
+        max_rows = stored_rows if max_rows is None else max_rows
+    before = storage_stats(path)
+    deleted = prune_queries(path, max_age_days, max_rows)
+    metrics.get_recorder(path).rollup()
+    rewritten = (convert or needs_conversion(storage_stats(path))) and enable_incremental_vacuum(path)
+    released = vacuum(path)
+    after = storage_stats(path)
+    return {
+        "finished_at": int(time.time()),
+        "deleted": deleted,
+        "rewritten": rewritten,
+        "pages_released": released,
+        "bytes_before": before["file_bytes"] + before["wal_bytes"],
+        "bytes_after": after["file_bytes"] + after["wal_bytes"],
+        "elapsed": time.perf_counter() - started,
+    }
+
+
+class Maintainer:
+    """Runs maintenance passes on a daemon thread at a fixed interval or on request."""
+
+    def __init__(self, path=db.DB_FILE, interval_seconds=DEFAULT_INTERVAL_SECONDS,
+                 first_run_delay=FIRST_RUN_DELAY_SECONDS, on_delete=None):
+        self.path = path
+        self.interval_seconds = interval_seconds
+        self.first_run_delay = first_run_delay
+        self.on_delete = on_delete
+        self.last_report = None
+        self.last_error = None
+        self._wake = threading.Event()
+        self._convert = False
+        self._thread = None
+
+    def configure(self, max_age_days=0, max_rows=0):
+        """Store the retention policy used from the next pass on."""
+        db.set_retention_policy(max_age_days, max_rows, self.path)
+
+    def start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name="db-maintenance", daemon=True)
+            self._thread.start()
+        return self
+
+    def run_soon(self, convert=False):
+        """Start a pass now instead of waiting for the interval.
+
+        convert also rewrites a file that predates incremental vacuum.
+        """
+        self._convert = self._convert or convert
+        self._wake.set()
+
+    def _run(self):
+        delay = self.first_run_delay
+        while True:
+            self._wake.wait(delay)
+            self._wake.clear()
+            delay = self.interval_seconds
+            convert, self._convert = self._convert, False
+            try:
+                report = run_maintenance(self.path, convert=convert)
+            except Exception as e:
+                self.last_error = e
+                continue
+            self.last_report, self.last_error = report, None
+            if self.on_delete and report["deleted"]:
+                self.on_delete(report["deleted"])
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Apply the retention policy and compact the database.")
+    parser.add_argument("--db", default=db.DB_FILE, help="database to maintain")
+    parser.add_argument("--max-age-days", type=float, default=None,
+                        help="delete queries not saved or reused for this many days (0 keeps them; "
+                             "default: the policy saved in the app)")
+    parser.add_argument("--max-rows", type=int, default=None,
+                        help="keep only this many most recently used queries (0 keeps all; "
+                             "default: the policy saved in the app)")
+    parser.add_argument("--convert", action="store_true",
+                        help="rewrite a database created without incremental vacuum so later passes can shrink it")
+    args = parser.parse_args(argv)
+
+    report = run_maintenance(args.db, args.max_age_days, args.max_rows, args.convert)
+    print(f"Deleted {len(report['deleted'])} queries, released {report['pages_released']} pages"
+          f"{' after a one-off VACUUM' if report['rewritten'] else ''}: "
+          f"{report['bytes_before'] / 1e6:.1f} MB -> {report['bytes_after'] / 1e6:.1f} MB "
+          f"in {report['elapsed']:.1f}s")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
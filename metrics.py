@@ -0,0 +1,234 @@
+"""Timing spans for generation and library interactions, stored in queries.db.
+
+Spans are buffered in memory and written in batches to the metric_spans
+table.  Raw spans older than a day are folded into hourly rows in
+metric_rollups, so the tables stay small while keeping long-term trends.
+"""
+import threading
+import time
+from contextlib import contextmanager
+
+import db
+
+# Raw spans are kept this long before being folded into hourly rollups
+RAW_RETENTION_SECONDS = 24 * 3600
+ROLLUP_BUCKET_SECONDS = 3600
+
+INSERT_SPAN = (
+    "INSERT INTO metric_spans (ts, name, status, duration_ms, prompt_chars, response_chars, "
+    "prompt_tokens, response_tokens) VALUES (?, ?, ?, ?, ?, ?, ?, ?)"
+)
+
+
+def estimate_tokens(text):
+    """Rough local token count (about four characters per token)."""
+    return (len(text) + 3) // 4 if text else 0
+
+
+def percentile(ordered, fraction):
+    """Nearest-rank percentile of an already sorted list."""
+    if not ordered:
+        return 0.0
+    return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+
+class Span:
+    """A single timed operation; callers may attach the prompt, response and status."""
+
+    def __init__(self, name):
+        self.name = name
+        self.status = "ok"
+        self.prompt = None
+        self.response = None
+
+
+class MetricsRecorder:
+    """Buffers spans and writes them to the metrics tables in batches."""
+
+    def __init__(self, path=db.DB_FILE, flush_size=50, flush_interval=5.0):
+        self.path = path
+        self.flush_size = flush_size
+        self.flush_interval = flush_interval
+        self._buffer = []
+        self._last_flush = time.monotonic()
+        self._lock = threading.Lock()
+
+    def record(self, name, duration_ms, status="ok", prompt=None, response=None):
+        """Record one finished span."""
+        row = (
+            int(time.time()), name, status, duration_ms,
+            len(prompt) if prompt else None, len(response) if response else None,
+            estimate_tokens(prompt) if prompt else None, estimate_tokens(response) if response else None,
+        )
+        with self._lock:
+            self._buffer.append(row)
+            due = (len(self._buffer) >= self.flush_size
+                   or time.monotonic() - self._last_flush >= self.flush_interval)
+        if due:
+            self.flush()
+
+    @contextmanager
+    def span(self, name):
+        """Time the enclosed block; exceptions mark the span as an error and propagate."""
+        current = Span(name)
+        started = time.perf_counter()
+        try:
+            yield current
+        except Exception:
+            current.status = "error"
+            raise
+        finally:
+            self.record(name, (time.perf_counter() - started) * 1000, current.status,
+                        current.prompt, current.response)
+
+    def flush(self):
+        """Write buffered spans to the database."""
+        with self._lock:
+            rows, self._buffer = self._buffer, []
+            self._last_flush = time.monotonic()
+        if rows:
+            db.init_db(self.path)
+            with db.get_pool(self.path).connection() as conn:
+                conn.executemany(INSERT_SPAN, rows)
+
+    def rollup(self, raw_retention_seconds=RAW_RETENTION_SECONDS):
+        """Fold raw spans older than the retention window into hourly rollups."""
+        self.flush()
+        cutoff = int(time.time()) - raw_retention_seconds
+        cutoff -= cutoff % ROLLUP_BUCKET_SECONDS
+        with db.get_pool(self.path).connection() as conn:
+            groups = {}
+            for ts, name, status, duration_ms in conn.execute(
+                "SELECT ts, name, status, duration_ms FROM metric_spans WHERE ts < ?", (cutoff,)
+            ):
+                groups.setdefault((ts - ts % ROLLUP_BUCKET_SECONDS, name), []).append((status, duration_ms))
+            for (bucket, name), spans in groups.items():
+                durations = sorted(duration for _, duration in spans)
+                statuses = [status for status, _ in spans]
+                conn.execute(
+                    "INSERT INTO metric_rollups "
+                    "(bucket, name, count, errors, hits, total_ms, p50_ms, p95_ms, p99_ms) "
+                    "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?) "
+                    "ON CONFLICT (bucket, name) DO UPDATE SET count = count + excluded.count, "
+                    "errors = errors + excluded.errors, hits = hits + excluded.hits, "
+                    "total_ms = total_ms + excluded.total_ms, p50_ms = MAX(p50_ms, excluded.p50_ms), "
+                    "p95_ms = MAX(p95_ms, excluded.p95_ms), p99_ms = MAX(p99_ms, excluded.p99_ms)",
+                    (bucket, name, len(spans), statuses.count("error"), statuses.count("hit"),
+                     sum(durations), percentile(durations, 0.50), percentile(durations, 0.95),
+                     percentile(durations, 0.99))
+                )
+            conn.execute("DELETE FROM metric_spans WHERE ts < ?", (cutoff,))
+
+    def summary(self, since):
+        """Per span name: count, errors, cache hits and p50/p95/p99 latency since a Unix time.
+
+        Percentiles are exact over raw spans; for periods that were already
+        rolled up, the worst hourly percentile is used.
+        """
+        self.flush()
+        stats = {}
+        with db.get_pool(self.path).connection() as conn:
+            for name, status, duration_ms in conn.execute(
+                "SELECT name, status, duration_ms FROM metric_spans WHERE ts >= ?", (since,)
+            ):
+                entry = stats.setdefault(name, _summary_entry())
+                entry["durations"].append(duration_ms)
+                entry["count"] += 1
+                entry["errors"] += status == "error"
+                entry["hits"] += status == "hit"
+            for name, count, errors, hits, p50, p95, p99 in conn.execute(
+                "SELECT name, count, errors, hits, p50_ms, p95_ms, p99_ms FROM metric_rollups "
+                "WHERE bucket >= ?",
+                (since - since % ROLLUP_BUCKET_SECONDS,)
+            ):
+                entry = stats.setdefault(name, _summary_entry())
+                entry["count"] += count
+                entry["errors"] += errors
+                entry["hits"] += hits
+                for key, value in (("p50_ms", p50), ("p95_ms", p95), ("p99_ms", p99)):
+                    entry["rolled_up"][key] = max(entry["rolled_up"][key], value)
+
+        rows = []
+        for name, entry in sorted(stats.items()):
+            durations = sorted(entry["durations"])
+            rows.append({
+                "name": name,
+                "count": entry["count"],
+                "errors": entry["errors"],
+                "hits": entry["hits"],
+                "p50_ms": max(percentile(durations, 0.50), entry["rolled_up"]["p50_ms"]),
+                "p95_ms": max(percentile(durations, 0.95), entry["rolled_up"]["p95_ms"]),
+                "p99_ms": max(percentile(durations, 0.99), entry["rolled_up"]["p99_ms"]),
+            })
+        return rows
+
+    def timeseries(self, since):
+        """Hourly rows of (bucket, name, count, errors, hits, p95_ms) since a Unix time."""
+        self.flush()
+        buckets = {}
+        with db.get_pool(self.path).connection() as conn:
+            for ts, name, status, duration_ms in conn.execute(
+                "SELECT ts, name, status, duration_ms FROM metric_spans WHERE ts >= ?", (since,)
+            ):
+                entry = buckets.setdefault((ts - ts % ROLLUP_BUCKET_SECONDS, name), [0, 0, 0, []])
+                entry[0] += 1
+                entry[1] += status == "error"
+                entry[2] += status == "hit"
+                entry[3].append(duration_ms)
+            rolled = conn.execute(
+                "SELECT bucket, name, count, errors, hits, p95_ms FROM metric_rollups WHERE bucket >= ?",
+                (since - since % ROLLUP_BUCKET_SECONDS,)
+            ).fetchall()
+        rows = [(bucket, name, count, errors, hits, percentile(sorted(durations), 0.95))
+                for (bucket, name), (count, errors, hits, durations) in buckets.items()]
+        return sorted(rows + rolled)
+
+
+def _summary_entry():
+    return {"durations": [], "count": 0, "errors": 0, "hits": 0,
+            "rolled_up": {"p50_ms": 0.0, "p95_ms": 0.0, "p99_ms": 0.0}}
+
+
+class InstrumentedBackend:
+    """Wraps a model backend so every call is recorded as a span with sizes and token counts."""
+
+    def __init__(self, backend, recorder):
+        self.backend = backend
+        self.recorder = recorder
+        self.model_name = backend.model_name
+
+    def generate(self, prompt):
+        with self.recorder.span("model.generate") as current:
+            current.prompt = prompt
+            current.response = self.backend.generate(prompt)
+            return current.response
+
+    def stream(self, prompt):
+        started = time.perf_counter()
+        chunks = []
+        status = "ok"
+        try:
+            for chunk in self.backend.stream(prompt):
+                if not chunks:
+                    self.recorder.record("model.first_chunk", (time.perf_counter() - started) * 1000)
+                chunks.append(chunk)
+                yield chunk
+        except Exception:
+            status = "error"
+            raise
+        finally:
+            self.recorder.record("model.stream", (time.perf_counter() - started) * 1000, status,
+                                 prompt, "".join(chunks))
+
+
+_recorders = {}
+_recorders_lock = threading.Lock()
+
+
+def get_recorder(path=db.DB_FILE):
+    """Return the process-wide metrics recorder for a database file."""
+    with _recorders_lock:
+        recorder = _recorders.get(path)
+        if recorder is None:
+            recorder = _recorders[path] = MetricsRecorder(path)
+        return recorder
@@ -0,0 +1,329 @@
+"""Versioned schema migrations for queries.db.
+
+Each migration runs once, in order, inside its own transaction, and is
+recorded in the schema_version table so existing database files are
+upgraded in place.
+"""
+import hashlib
+import re
+import zlib
+
+# Query and explanation text at least this long is stored zlib-compressed
+COMPRESS_MIN_CHARS = 256
+# Compressed values are BLOBs starting with this format tag; plain text stays TEXT
+COMPRESSED_TAG = b"z"
+
+# String literals and quoted identifiers, whose case and spacing are part of a query's meaning
+SQL_QUOTED = re.compile(r"""('(?:[^']|'')*'|"(?:[^"]|"")*"|`[^`]*`|\[[^\]]*\])""")
+
+
+def normalize_text(text):
+    """Lowercase and collapse whitespace so trivially different copies hash alike."""
+    return " ".join(text.lower().split())
+
+
+def normalize_sql(query):
+    """Lowercase and collapse whitespace outside quoted strings and names, and drop a trailing semicolon.
+
+    WHERE status = 'Active' and WHERE status = 'active' are different queries.
+    """
+    parts = SQL_QUOTED.split(query)
+    # split() puts the quoted parts at the odd positions
+    text = "".join(part if i % 2 else re.sub(r"\s+", " ", part.lower()) for i, part in enumerate(parts))
+    return text.strip().rstrip(";").rstrip()
+
+
+def content_hash(description, query):
+    """Identity of a saved query: hash of its normalized description and SQL."""
+    raw = f"{normalize_text(description)}\x1f{normalize_sql(query)}"
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+
+def pack_text(text):
+    """Compress long text for storage; short or incompressible text is kept as is."""
+    if not isinstance(text, str) or len(text) < COMPRESS_MIN_CHARS:
+        return text
+    packed = COMPRESSED_TAG + zlib.compress(text.encode("utf-8"), 6)
+    return packed if len(packed) < len(text) else text
+
+
+def unpack_text(value):
+    """Inverse of pack_text: the original text of a stored value."""
+    if isinstance(value, bytes) and value[:1] == COMPRESSED_TAG:
+        return zlib.decompress(value[1:]).decode("utf-8")
+    return value
+
+
+def register_functions(conn):
+    """SQL functions the statements and triggers on queries rely on."""
+    conn.create_function("pack_text", 1, pack_text, deterministic=True)
+    conn.create_function("unpack_text", 1, unpack_text, deterministic=True)
+
+
+def create_queries_table(conn):
+    conn.execute("""
+    CREATE TABLE IF NOT EXISTS queries (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        description TEXT NOT NULL,
+        query TEXT NOT NULL,
+        explanation TEXT NOT NULL,
+        timestamp TEXT NOT NULL
+    )
+    """)
+
+
+def add_missing_columns(conn):
+    # Files created by the old db.py schema only had id, query and timestamp
+    columns = {row[1] for row in conn.execute("PRAGMA table_info(queries)")}
+    for column in ("description", "explanation"):
+        if column not in columns:
+            conn.execute(f"ALTER TABLE queries ADD COLUMN {column} TEXT NOT NULL DEFAULT ''")
+
+
+def epoch_timestamps(conn):
+    # Rebuild the table with timestamps as indexed integer epochs
+    sequence = conn.execute("SELECT seq FROM sqlite_sequence WHERE name = 'queries'").fetchone()
+    conn.execute("""
+    CREATE TABLE queries_new (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        description TEXT NOT NULL,
+        query TEXT NOT NULL,
+        explanation TEXT NOT NULL,
+        timestamp INTEGER NOT NULL
+    )
+    """)
+    conn.execute("""
+    INSERT INTO queries_new (id, description, query, explanation, timestamp)
+    SELECT id, description, query, explanation,
+           COALESCE(CAST(strftime('%s', timestamp, 'utc') AS INTEGER), CAST(strftime('%s', 'now') AS INTEGER))
+    FROM queries
+    """)
+    conn.execute("DROP TABLE queries")
+    conn.execute("ALTER TABLE queries_new RENAME TO queries")
+    if sequence:
+        conn.execute(
+            "UPDATE sqlite_sequence SET seq = MAX(seq, ?) WHERE name = 'queries'", (sequence[0],)
+        )
+    conn.execute("CREATE INDEX idx_queries_timestamp ON queries (timestamp)")
+
+
+def full_text_index(conn):
+    # External-content FTS5 index kept in sync with queries by triggers
+    conn.execute("""
+    CREATE VIRTUAL TABLE queries_fts USING fts5(
+        description, query, explanation, content='queries', content_rowid='id'
+    )
+    """)
+    conn.execute("""
+    CREATE TRIGGER queries_fts_insert AFTER INSERT ON queries BEGIN
+        INSERT INTO queries_fts (rowid, description, query, explanation)
+        VALUES (new.id, new.description, new.query, new.explanation);
+    END
+    """)
+    conn.execute("""
+    CREATE TRIGGER queries_fts_delete AFTER DELETE ON queries BEGIN
+        INSERT INTO queries_fts (queries_fts, rowid, description, query, explanation)
+        VALUES ('delete', old.id, old.description, old.query, old.explanation);
+    END
+    """)
+    conn.execute("""
+    CREATE TRIGGER queries_fts_update AFTER UPDATE ON queries BEGIN
+        INSERT INTO queries_fts (queries_fts, rowid, description, query, explanation)
+        VALUES ('delete', old.id, old.description, old.query, old.explanation);
+        INSERT INTO queries_fts (rowid, description, query, explanation)
+        VALUES (new.id, new.description, new.query, new.explanation);
+    END
+    """)
+    conn.execute("INSERT INTO queries_fts (queries_fts) VALUES ('rebuild')")
+
+
+def metrics_tables(conn):
+    conn.execute("""
+    CREATE TABLE metric_spans (
+        id INTEGER PRIMARY KEY,
+        ts INTEGER NOT NULL,
+        name TEXT NOT NULL,
+        status TEXT NOT NULL,
+        duration_ms REAL NOT NULL,
+        prompt_chars INTEGER,
+        response_chars INTEGER,
+        prompt_tokens INTEGER,
+        response_tokens INTEGER
+    )
+    """)
+    conn.execute("CREATE INDEX idx_metric_spans_ts ON metric_spans (ts)")
+    conn.execute("""
+    CREATE TABLE metric_rollups (
+        bucket INTEGER NOT NULL,
+        name TEXT NOT NULL,
+        count INTEGER NOT NULL,
+        errors INTEGER NOT NULL,
+        hits INTEGER NOT NULL,
+        total_ms REAL NOT NULL,
+        p50_ms REAL NOT NULL,
+        p95_ms REAL NOT NULL,
+        p99_ms REAL NOT NULL,
+        PRIMARY KEY (bucket, name)
+    ) WITHOUT ROWID
+    """)
+
+
+def content_hash_column(conn):
+    # Only edits to indexed text need to touch the full-text index
+    conn.execute("DROP TRIGGER queries_fts_update")
+    conn.execute("""
+    CREATE TRIGGER queries_fts_update AFTER UPDATE OF description, query, explanation ON queries BEGIN
+        INSERT INTO queries_fts (queries_fts, rowid, description, query, explanation)
+        VALUES ('delete', old.id, old.description, old.query, old.explanation);
+        INSERT INTO queries_fts (rowid, description, query, explanation)
+        VALUES (new.id, new.description, new.query, new.explanation);
+    END
+    """)
+    conn.execute("ALTER TABLE queries ADD COLUMN content_hash TEXT")
+    conn.create_function("query_content_hash", 2, content_hash, deterministic=True)
+    conn.execute("UPDATE queries SET content_hash = query_content_hash(description, query)")
+    conn.execute("CREATE INDEX idx_queries_content_hash ON queries (content_hash)")
+
+
+def unique_content_hash(conn):
+    # Collapse duplicates into their oldest row, which keeps the use count
+    conn.execute("ALTER TABLE queries ADD COLUMN use_count INTEGER NOT NULL DEFAULT 1")
+    conn.execute("ALTER TABLE queries ADD COLUMN last_used INTEGER")
+    conn.execute("""
+    CREATE TEMP TABLE duplicate_groups AS
+    SELECT content_hash, MIN(id) AS keep_id, COUNT(*) AS uses, MAX(timestamp) AS last_used,
+           MAX(CASE WHEN explanation != '' THEN id END) AS explained_id
+    FROM queries
+    GROUP BY content_hash
+    HAVING COUNT(*) > 1
+    """)
+    conn.execute("""
+    UPDATE queries
+    SET explanation = (SELECT e.explanation FROM queries AS e WHERE e.id = g.explained_id)
+    FROM duplicate_groups AS g
+    WHERE queries.id = g.keep_id AND queries.explanation = '' AND g.explained_id IS NOT NULL
+    """)
+    conn.execute("""
+    UPDATE queries SET use_count = g.uses, last_used = g.last_used
+    FROM duplicate_groups AS g
+    WHERE queries.id = g.keep_id
+    """)
+    conn.execute("""
+    DELETE FROM queries
+    WHERE content_hash IN (SELECT content_hash FROM duplicate_groups)
+      AND id NOT IN (SELECT keep_id FROM duplicate_groups)
+    """)
+    conn.execute("DROP TABLE duplicate_groups")
+    conn.execute("UPDATE queries SET last_used = timestamp WHERE last_used IS NULL")
+    conn.execute("DROP INDEX idx_queries_content_hash")
+    conn.execute("CREATE UNIQUE INDEX idx_queries_content_hash ON queries (content_hash)")
+    # Serves the "most used" library order without sorting the table
+    conn.execute("CREATE INDEX idx_queries_popularity ON queries (use_count, id)")
+
+
+def compressed_text(conn):
+    # The full-text index keeps indexing the plain text: its triggers unpack
+    # what they pass on.  FTS commands that read the content table directly
+    # ('rebuild', 'integrity-check') would see the compressed bytes, so none
+    # are run from here on.
+    register_functions(conn)
+    for trigger in ("queries_fts_insert", "queries_fts_delete", "queries_fts_update"):
+        conn.execute(f"DROP TRIGGER {trigger}")
+    conn.execute("UPDATE queries SET query = pack_text(query), explanation = pack_text(explanation)")
+    conn.execute("""
+    CREATE TRIGGER queries_fts_insert AFTER INSERT ON queries BEGIN
+        INSERT INTO queries_fts (rowid, description, query, explanation)
+        VALUES (new.id, new.description, unpack_text(new.query), unpack_text(new.explanation));
+    END
+    """)
+    conn.execute("""
+    CREATE TRIGGER queries_fts_delete AFTER DELETE ON queries BEGIN
+        INSERT INTO queries_fts (queries_fts, rowid, description, query, explanation)
+        VALUES ('delete', old.id, old.description, unpack_text(old.query), unpack_text(old.explanation));
+    END
+    """)
+    conn.execute("""
+    CREATE TRIGGER queries_fts_update AFTER UPDATE OF description, query, explanation ON queries BEGIN
+        INSERT INTO queries_fts (queries_fts, rowid, description, query, explanation)
+        VALUES ('delete', old.id, old.description, unpack_text(old.query), unpack_text(old.explanation));
+        INSERT INTO queries_fts (rowid, description, query, explanation)
+        VALUES (new.id, new.description, unpack_text(new.query), unpack_text(new.explanation));
+    END
+    """)
+    # Retention deletes the least recently used queries first
+    conn.execute("CREATE INDEX idx_queries_last_used ON queries (last_used)")
+
+
+def literal_sensitive_content_hash(conn):
+    # Hashes used to lowercase string literals too, so queries differing only
+    # in a literal's case collided.  The new hashes only tell more rows apart,
+    # so the unique index stays satisfied.
+    register_functions(conn)
+    conn.create_function("query_content_hash", 2, content_hash, deterministic=True)
+    conn.execute("UPDATE queries SET content_hash = query_content_hash(description, unpack_text(query))")
+
+
+def retention_policy_table(conn):
+    # A single row, so the policy set in the app survives restarts and the CLI can read it
+    conn.execute("""
+    CREATE TABLE retention_policy (
+        id INTEGER PRIMARY KEY CHECK (id = 1),
+        max_age_days REAL NOT NULL DEFAULT 0,
+        max_rows INTEGER NOT NULL DEFAULT 0
+    )
+    """)
+    conn.execute("INSERT INTO retention_policy (id) VALUES (1)")
+
+
+MIGRATIONS = [
+    (1, create_queries_table),
+    (2, add_missing_columns),
+    (3, epoch_timestamps),
+    (4, full_text_index),
+    (5, metrics_tables),
+    (6, content_hash_column),
+    (7, unique_content_hash),
+    (8, compressed_text),
+    (9, retention_policy_table),
+    (10, literal_sensitive_content_hash),
+]
+
+LATEST_VERSION = MIGRATIONS[-1][0]
+
+
+def get_version(conn):
+    """Return the schema version recorded in the database (0 when none)."""
+    conn.execute("""
+    CREATE TABLE IF NOT EXISTS schema_version (
+        version INTEGER PRIMARY KEY,
+        name TEXT NOT NULL,
+        applied_at INTEGER NOT NULL
+    )
+    """)
+    return conn.execute("SELECT COALESCE(MAX(version), 0) FROM schema_version").fetchone()[0]
+
+
+def migrate(conn):
+    """Apply every pending migration; return the resulting schema version."""
+    conn.commit()
+    # Table rebuilds must not trip foreign keys that reference queries
+    conn.execute("PRAGMA foreign_keys = OFF")
+    try:
+        for version, migration in MIGRATIONS:
+            # BEGIN IMMEDIATE serializes processes migrating the same file
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                if get_version(conn) < version:
+                    migration(conn)
+                    conn.execute(
+                        "INSERT INTO schema_version (version, name, applied_at) "
+                        "VALUES (?, ?, CAST(strftime('%s', 'now') AS INTEGER))",
+                        (version, migration.__name__)
+                    )
+                conn.commit()
+            except Exception:
+                conn.rollback()
+                raise
+    finally:
+        conn.execute("PRAGMA foreign_keys = ON")
+    return get_version(conn)
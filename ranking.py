@@ -0,0 +1,106 @@
+"""Ranking of candidate queries by their SQLite query plans.
+
+Each candidate is validated and planned with EXPLAIN QUERY PLAN against the
+in-memory clone of the loaded schema (see validation.py), so nothing runs
+and no data is needed.  Without table statistics SQLite reports no row
+counts, so the cost is estimated from the shape of the plan: every loop
+multiplies the rows flowing through it by an assumed fan-out (a full scan
+reads ASSUMED_TABLE_ROWS rows, an index lookup only a few) and temporary
+sorts add the rows they sort.  The best candidate is valid, has the fewest
+full table scans and the lowest estimated cost.
+"""
+import sqlite3
+
+from validation import validate_sql, query_plans
+
+# Rows assumed per table, and per outer row for each way a loop reaches its rows
+ASSUMED_TABLE_ROWS = 1000
+ASSUMED_RANGE_ROWS = 100
+ASSUMED_EQUALITY_ROWS = 10
+# Reading an index that covers the query skips the table lookups
+COVERING_SCAN_WEIGHT = 0.5
+
+
+def loop_step(detail, derived):
+    """(rows per outer row, cost per row, full table scan) of one loop of a plan, or None."""
+    if detail.startswith("SCAN "):
+        target = detail[len("SCAN "):].split(" USING ", 1)[0]
+        if target == "CONSTANT ROW":
+            return 1, 1, False
+        if target in derived:
+            # Rows of a subquery or CTE, whose own cost is counted where it is built
+            return ASSUMED_RANGE_ROWS, 1, False
+        if "COVERING INDEX" in detail:
+            return ASSUMED_TABLE_ROWS, COVERING_SCAN_WEIGHT, False
+        return ASSUMED_TABLE_ROWS, 1, True
+    if detail.startswith("SEARCH "):
+        constraint = detail[detail.rfind("(") + 1:-1] if detail.endswith(")") else ""
+        if "AUTOMATIC" in detail:
+            # SQLite builds a throwaway index by reading the whole table first
+            return ASSUMED_EQUALITY_ROWS, 1, True
+        if not constraint or "<" in constraint or ">" in constraint:
+            return ASSUMED_RANGE_ROWS, 1, False
+        if "PRIMARY KEY" in detail:
+            return 1, 1, False
+        return ASSUMED_EQUALITY_ROWS, 1, False
+    return None
+
+
+def plan_cost(plan):
+    """(full table scans, estimated cost) of one statement's EXPLAIN QUERY PLAN rows."""
+    children = {}
+    for node_id, parent, detail in plan:
+        children.setdefault(parent, []).append((node_id, detail))
+    derived = {
+        detail.split(" ", 1)[1] for _, _, detail in plan
+        if detail.startswith(("CO-ROUTINE ", "MATERIALIZE "))
+    }
+
+    def walk(parent, outer_rows):
+        scans, cost, rows = 0, 0.0, outer_rows
+        for node_id, detail in children.get(parent, ()):
+            step = loop_step(detail, derived)
+            if step is not None:
+                fanout, weight, full_scan = step
+                if full_scan and "AUTOMATIC" in detail:
+                    cost += ASSUMED_TABLE_ROWS
+                rows *= fanout
+                cost += rows * weight
+                scans += full_scan
+            elif detail.startswith("USE TEMP B-TREE"):
+                cost += rows
+            else:
+                # Subqueries run once, or once per outer row when correlated
+                sub_scans, sub_cost = walk(node_id, rows if detail.startswith("CORRELATED ") else 1)
+                scans += sub_scans
+                cost += sub_cost
+        return scans, cost
+
+    return walk(0, 1)
+
+
+def rank_queries(queries, digest=None):
+    """Rank candidate queries best first.
+
+    Returns one dict per candidate with the query, its validation error (or
+    None), the number of full table scans, the estimated cost and the plan
+    lines.  Scans and cost are None when the query could not be planned,
+    e.g. without a schema to plan against; such candidates rank after the
+    planned ones.
+    """
+    ranked = []
+    for position, query in enumerate(queries):
+        entry = {"query": query, "error": validate_sql(query, digest), "full_scans": None, "cost": None, "plan": []}
+        if entry["error"] is None:
+            try:
+                plans = query_plans(query, digest)
+            except (sqlite3.Error, sqlite3.Warning):
+                plans = None
+            if plans is not None:
+                costs = [plan_cost(plan) for plan in plans]
+                entry["full_scans"] = sum(scans for scans, _ in costs)
+                entry["cost"] = round(sum(cost for _, cost in costs))
+                entry["plan"] = [detail for plan in plans for _, _, detail in plan]
+        key = (entry["error"] is not None, entry["cost"] is None, entry["full_scans"] or 0, entry["cost"] or 0)
+        ranked.append((key, position, entry))
+    return [entry for _, _, entry in sorted(ranked, key=lambda item: item[:2])]
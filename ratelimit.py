@@ -0,0 +1,84 @@
+import random
+import threading
+import time
+
+
+class TokenBucket:
+    """Thread-safe token bucket allowing `rate` calls per second with bursts up to `capacity`."""
+
+    def __init__(self, rate, capacity=None):
+        self.rate = rate
+        self.capacity = capacity if capacity is not None else max(1.0, rate)
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _refill(self):
+        now = time.monotonic()
+        self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def try_acquire(self, tokens=1):
+        """Take tokens if available right now; return whether it succeeded."""
+        with self._lock:
+            self._refill()
+            if self._tokens >= tokens:
+                self._tokens -= tokens
+                return True
+            return False
+
+    def acquire(self, tokens=1):
+        """Block until tokens are available, then take them."""
+        while True:
+            with self._lock:
+                self._refill()
+                if self._tokens >= tokens:
+                    self._tokens -= tokens
+                    return
+                wait = (tokens - self._tokens) / self.rate
+            time.sleep(wait)
+
+
+# HTTP statuses worth retrying: rate limiting and transient server errors
+RETRYABLE_STATUSES = {429, 500, 502, 503, 504}
+# google.api_core and requests exception names for the same conditions
+RETRYABLE_ERRORS = {
+    "ResourceExhausted", "TooManyRequests", "ServiceUnavailable", "InternalServerError",
+    "BadGateway", "GatewayTimeout", "DeadlineExceeded", "ConnectionError", "ConnectTimeout", "ReadTimeout",
+}
+
+
+def status_code(exc):
+    """HTTP status carried by an SDK or requests exception, or None."""
+    response = getattr(exc, "response", None)
+    status = getattr(response, "status_code", None) or getattr(exc, "code", None)
+    return status if isinstance(status, int) else None
+
+
+def is_retryable(exc):
+    """Whether an exception is a rate limit, a transient server error or a dropped connection."""
+    return (
+        status_code(exc) in RETRYABLE_STATUSES
+        or type(exc).__name__ in RETRYABLE_ERRORS
+        or isinstance(exc, (ConnectionError, TimeoutError))
+    )
+
+
+def backoff_delay(attempt, base_delay=1.0, max_delay=30.0):
+    """Jittered exponential delay before retry number attempt + 1."""
+    delay = min(max_delay, base_delay * 2 ** attempt)
+    return random.uniform(delay / 2, delay)
+
+
+def retry_with_backoff(func, retries=3, base_delay=1.0, max_delay=30.0, retry_on=None):
+    """Call func(), retrying failures with jittered exponential backoff.
+
+    retry_on optionally limits retries to exceptions it returns True for.
+    """
+    for attempt in range(retries + 1):
+        try:
+            return func()
+        except Exception as e:
+            if attempt == retries or (retry_on is not None and not retry_on(e)):
+                raise
+            time.sleep(backoff_delay(attempt, base_delay, max_delay))
@@ -0,0 +1,307 @@
+"""Compact schema digests that ground query generation in a real database.
+
+A schema is read from a SQLite database file or from DDL text, reduced to one
+line per table and cached by the hash of its DDL:
+
+    customers(id integer pk, name text, region_id integer -> regions.id)
+
+For large schemas only the tables relevant to a description (and the tables
+they reference) are put in the prompt.
+"""
+import hashlib
+import os
+import re
+import sqlite3
+import tempfile
+import threading
+from collections import OrderedDict
+
+from similarity import tokenize
+
+SQLITE_HEADER = b"SQLite format 3\x00"
+
+# Schemas with more tables than this are trimmed to the relevant ones per prompt
+MAX_PROMPT_TABLES = 15
+
+SELECT_TABLES = (
+    "SELECT name, sql FROM sqlite_master "
+    "WHERE type = 'table' AND name NOT LIKE 'sqlite_%' AND sql IS NOT NULL ORDER BY name"
+)
+SELECT_INDEXES = "SELECT tbl_name, sql FROM sqlite_master WHERE type = 'index' AND sql IS NOT NULL ORDER BY name"
+
+CREATE_TABLE_PATTERN = re.compile(
+    r"CREATE\s+(?:TEMP(?:ORARY)?\s+)?TABLE\s+(?:IF\s+NOT\s+EXISTS\s+)?([`\"\[]?[\w.]+[`\"\]]?)\s*\(",
+    re.IGNORECASE,
+)
+CREATE_INDEX_PATTERN = re.compile(
+    r"CREATE\s+(UNIQUE\s+)?INDEX\s+(?:IF\s+NOT\s+EXISTS\s+)?[`\"\[]?[\w.]+[`\"\]]?\s+"
+    r"ON\s+([`\"\[]?[\w.]+[`\"\]]?)\s*\(([^)]*)\)",
+    re.IGNORECASE,
+)
+REFERENCES_PATTERN = re.compile(r"references\s+([\w`\"\[\].]+)\s*\(([^)]*)\)", re.IGNORECASE)
+CONSTRAINT_WORDS = ("constraint", "primary", "foreign", "unique", "check", "key", "index")
+COLUMN_WORDS = ("not", "null", "primary", "default", "references")
+
+# What uploaded DDL may do: define tables and indexes, which SQLite records by writing sqlite_master
+# (a new index is also built, which is authorized as a reindex)
+DDL_ACTIONS = {
+    sqlite3.SQLITE_CREATE_TABLE, sqlite3.SQLITE_CREATE_INDEX, sqlite3.SQLITE_REINDEX,
+    sqlite3.SQLITE_READ, sqlite3.SQLITE_SELECT, sqlite3.SQLITE_FUNCTION,
+}
+SCHEMA_WRITES = {sqlite3.SQLITE_INSERT, sqlite3.SQLITE_UPDATE}
+
+
+class Table:
+    """One table of a schema: its columns, primary key, foreign keys and indexes."""
+
+    def __init__(self, name, columns, primary_key=(), foreign_keys=None, indexes=()):
+        self.name = name
+        self.columns = columns  # list of (name, type)
+        self.primary_key = set(primary_key)
+        self.foreign_keys = foreign_keys or {}  # column -> "table.column"
+        # Indexes are not rendered into prompts; they make query plans of the schema clone realistic
+        self.indexes = list(indexes)  # list of (column names, unique)
+        self.terms = tokenize(" ".join([name] + [column for column, _ in columns]))
+
+    def render(self):
+        parts = []
+        for column, column_type in self.columns:
+            part = f"{column} {column_type.lower()}".strip()
+            if column in self.primary_key:
+                part += " pk"
+            if column in self.foreign_keys:
+                part += f" -> {self.foreign_keys[column]}"
+            parts.append(part)
+        return f"{self.name}({', '.join(parts)})"
+
+
+class SchemaDigest:
+    """Token-minimal text form of a schema, with per-description table selection."""
+
+    def __init__(self, schema_hash, tables):
+        self.schema_hash = schema_hash
+        self.tables = {table.name: table for table in tables}
+        self._lines = {table.name: table.render() for table in tables}
+
+    def __len__(self):
+        return len(self.tables)
+
+    def render(self, description=None, max_tables=MAX_PROMPT_TABLES):
+        """Digest text; large schemas keep only the tables relevant to the description."""
+        names = list(self.tables)
+        if description is not None and len(names) > max_tables:
+            names = self.relevant_tables(description, max_tables)
+        return "\n".join(self._lines[name] for name in names)
+
+    def relevant_tables(self, description, max_tables=MAX_PROMPT_TABLES):
+        """Tables sharing the most terms with a description, plus the tables they reference."""
+        terms = tokenize(description)
+        scored = sorted(
+            ((len(terms & table.terms), name) for name, table in self.tables.items()),
+            key=lambda item: (-item[0], item[1]),
+        )
+        selected = [name for score, name in scored[:max_tables] if score]
+        for name in list(selected):
+            for target in self.tables[name].foreign_keys.values():
+                referenced = target.split(".", 1)[0]
+                if referenced in self.tables and referenced not in selected and len(selected) < max_tables:
+                    selected.append(referenced)
+        # Nothing matched: fall back to the first tables rather than an empty schema
+        return selected or [name for _, name in scored[:max_tables]]
+
+
+def schema_hash(ddl):
+    """Stable hash of schema DDL, ignoring whitespace and case differences."""
+    return hashlib.sha256(" ".join(ddl.lower().split()).encode("utf-8")).hexdigest()
+
+
+def read_sqlite_ddl(path):
+    """Return the CREATE TABLE and CREATE INDEX statements of a SQLite database file, opened read-only."""
+    conn = sqlite3.connect(f"file:{path}?mode=ro", uri=True)
+    try:
+        rows = conn.execute(SELECT_TABLES).fetchall()
+        indexes = conn.execute(SELECT_INDEXES).fetchall()
+    finally:
+        conn.close()
+    # Virtual tables (e.g. full-text indexes) and their shadow tables are not queried directly
+    virtual = [name for name, sql in rows if sql.upper().startswith("CREATE VIRTUAL")]
+    kept = [
+        (name, sql) for name, sql in rows
+        if name not in virtual and not any(name.startswith(f"{v}_") for v in virtual)
+    ]
+    names = {name for name, _ in kept}
+    return ";\n".join([sql for _, sql in kept] + [sql for table, sql in indexes if table in names]) + ";"
+
+
+def authorize_ddl(action, arg1, *_):
+    if action in DDL_ACTIONS or (action in SCHEMA_WRITES and arg1 == "sqlite_master"):
+        return sqlite3.SQLITE_OK
+    return sqlite3.SQLITE_DENY
+
+
+def introspect(ddl):
+    """Parse DDL into tables, through SQLite when it accepts the DDL and by pattern otherwise.
+
+    The DDL may come from an upload, so SQLite only runs it when it does no
+    more than create tables and indexes in memory: ATTACH, which would create
+    or write files on the server, and every other statement are refused.
+    """
+    conn = sqlite3.connect(":memory:")
+    conn.setlimit(sqlite3.SQLITE_LIMIT_ATTACHED, 0)
+    conn.set_authorizer(authorize_ddl)
+    try:
+        conn.executescript(ddl)
+    except sqlite3.Error:
+        conn.close()
+        return parse_ddl(ddl)
+    # Reading the schema back needs pragmas the DDL itself may not run
+    conn.set_authorizer(None)
+    try:
+        tables = []
+        for name, _ in conn.execute(SELECT_TABLES).fetchall():
+            info = conn.execute(f'PRAGMA table_info("{name}")').fetchall()
+            foreign_keys = {
+                column: f"{target}.{target_column or 'rowid'}"
+                for _, _, target, column, target_column, *_
+                in conn.execute(f'PRAGMA foreign_key_list("{name}")')
+            }
+            tables.append(Table(
+                name,
+                [(column, column_type) for _, column, column_type, *_ in info],
+                [row[1] for row in info if row[5]],
+                foreign_keys,
+                _sqlite_indexes(conn, name),
+            ))
+        return tables
+    finally:
+        conn.close()
+
+
+def parse_ddl(ddl):
+    """Best-effort parse of CREATE TABLE statements SQLite cannot run (e.g. other dialects)."""
+    tables = []
+    for match in CREATE_TABLE_PATTERN.finditer(ddl):
+        body = _parenthesized(ddl, match.end())
+        columns, primary_key, foreign_keys = [], [], {}
+        for item in _split_top_level(body):
+            words = item.split()
+            if not words:
+                continue
+            reference = REFERENCES_PATTERN.search(item)
+            target = f"{_unquote(reference.group(1))}.{_unquote(reference.group(2))}" if reference else None
+            if words[0].lower() in CONSTRAINT_WORDS:
+                key_columns = re.search(r"key\s*\(([^)]*)\)", item, re.IGNORECASE)
+                key_columns = [_unquote(c) for c in key_columns.group(1).split(",")] if key_columns else []
+                if re.match(r"(constraint\s+\S+\s+)?primary", item, re.IGNORECASE):
+                    primary_key += key_columns
+                elif target and len(key_columns) == 1:
+                    foreign_keys[key_columns[0]] = target
+                continue
+            column = _unquote(words[0])
+            column_type = words[1] if len(words) > 1 and words[1].lower() not in COLUMN_WORDS else ""
+            columns.append((column, re.sub(r"\(.*", "", column_type)))
+            if re.search(r"primary\s+key", item, re.IGNORECASE):
+                primary_key.append(column)
+            if target:
+                foreign_keys[column] = target
+        tables.append(Table(_unquote(match.group(1)), columns, primary_key, foreign_keys))
+    by_name = {table.name.lower(): table for table in tables}
+    for match in CREATE_INDEX_PATTERN.finditer(ddl):
+        table = by_name.get(_unquote(match.group(2)).lower())
+        columns = [_unquote(column.split()[0]) for column in match.group(3).split(",") if column.strip()]
+        if table is not None and columns:
+            table.indexes.append((columns, bool(match.group(1))))
+    return tables
+
+
+def _sqlite_indexes(conn, table):
+    """(columns, unique) of a table's indexes, leaving out the primary key and expression or partial indexes."""
+    indexes = []
+    for _, name, unique, origin, partial in conn.execute(f'PRAGMA index_list("{table}")').fetchall():
+        if origin == "pk" or partial:
+            continue
+        columns = [column for _, _, column in conn.execute(f'PRAGMA index_info("{name}")').fetchall()]
+        if columns and None not in columns:
+            indexes.append((columns, bool(unique)))
+    return indexes
+
+
+def _parenthesized(text, start):
+    """Text from start up to the parenthesis closing the one just before start."""
+    depth = 1
+    for position in range(start, len(text)):
+        if text[position] == "(":
+            depth += 1
+        elif text[position] == ")":
+            depth -= 1
+            if depth == 0:
+                return text[start:position]
+    return text[start:]
+
+
+def _split_top_level(body):
+    items, depth, current = [], 0, []
+    for char in body:
+        if char == "," and depth == 0:
+            items.append("".join(current).strip())
+            current = []
+            continue
+        depth += char == "("
+        depth -= char == ")"
+        current.append(char)
+    items.append("".join(current).strip())
+    return items
+
+
+def _unquote(name):
+    return name.strip().strip("`\"[]")
+
+
+_digests = OrderedDict()
+_digests_lock = threading.Lock()
+_DIGEST_CACHE_SIZE = 32
+
+
+def digest_from_ddl(ddl):
+    """Return the (cached) digest of DDL text; raises ValueError if it defines no tables."""
+    key = schema_hash(ddl)
+    with _digests_lock:
+        digest = _digests.get(key)
+        if digest is not None:
+            _digests.move_to_end(key)
+            return digest
+    tables = introspect(ddl)
+    if not tables:
+        raise ValueError("No CREATE TABLE statements found in the schema.")
+    digest = SchemaDigest(key, tables)
+    with _digests_lock:
+        _digests[key] = digest
+        while len(_digests) > _DIGEST_CACHE_SIZE:
+            _digests.popitem(last=False)
+    return digest
+
+
+def digest_from_sqlite(path):
+    """Return the (cached) digest of a SQLite database file's schema."""
+    return digest_from_ddl(read_sqlite_ddl(path))
+
+
+def digest_from_bytes(data):
+    """Digest of uploaded schema bytes: a SQLite database file or UTF-8 DDL text."""
+    if not data.startswith(SQLITE_HEADER):
+        return digest_from_ddl(data.decode("utf-8"))
+    with tempfile.TemporaryDirectory() as workdir:
+        path = os.path.join(workdir, "schema.db")
+        with open(path, "wb") as f:
+            f.write(data)
+        return digest_from_sqlite(path)
+
+
+def load_digest(path):
+    """Digest of a schema file: a SQLite database, or DDL text for any other file."""
+    with open(path, "rb") as f:
+        is_sqlite = f.read(len(SQLITE_HEADER)) == SQLITE_HEADER
+    if is_sqlite:
+        return digest_from_sqlite(path)
+    with open(path, encoding="utf-8") as f:
+        return digest_from_ddl(f.read())
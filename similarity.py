@@ -0,0 +1,173 @@
+import itertools
+import math
+import re
+import threading
+from collections import defaultdict
+
+STOPWORDS = {
+    "a", "an", "the", "of", "for", "in", "on", "by", "with", "to", "from", "and", "or",
+    "all", "me", "show", "get", "find", "list", "give", "select", "return", "query",
+    "sql", "that", "which", "who", "whose", "is", "are", "be", "their", "its", "each",
+}
+
+# Words that paraphrases commonly swap for one another
+SYNONYMS = {
+    "high": "top", "large": "top", "big": "top", "most": "top", "max": "top", "maximum": "top",
+    "low": "bottom", "small": "bottom", "least": "bottom", "min": "bottom", "minimum": "bottom",
+    "client": "customer", "user": "customer", "buyer": "customer",
+    "spend": "spend", "spent": "spend", "purchase": "spend", "amount": "spend",
+    "employe": "employee", "staff": "employee", "worker": "employee",
+    "count": "number", "many": "number",
+}
+
+TOKEN_PATTERN = re.compile(r"[a-z0-9]+")
+
+# Words that flip or bound a description's meaning; matches must agree on these and on every number
+QUALIFIERS = (
+    "above below over under more less greater fewer not no without except excluding only before after "
+    "between equal top bottom first last newest oldest earliest latest ascending descending asc desc "
+    "increase decrease"
+)
+
+
+def stem(word):
+    """Strip the most common English suffixes."""
+    for suffix, replacement in (("ies", "y"), ("ing", ""), ("est", ""), ("ed", ""), ("er", ""), ("s", "")):
+        if word.endswith(suffix) and len(word) - len(suffix) >= 3:
+            return word[: -len(suffix)] + replacement
+    return word
+
+
+def tokenize(text):
+    """Split a description into normalized, stemmed terms."""
+    terms = set()
+    for word in TOKEN_PATTERN.findall(text.lower()):
+        if word in STOPWORDS:
+            continue
+        word = stem(word)
+        terms.add(SYNONYMS.get(word, word))
+    return terms
+
+
+QUALIFIER_TERMS = tokenize(QUALIFIERS)
+
+
+def qualifiers(terms):
+    """The numbers and meaning-flipping terms among a description's terms."""
+    return {term for term in terms if term in QUALIFIER_TERMS or any(c.isdigit() for c in term)}
+
+
+class SimilarityIndex:
+    """Incrementally updated TF-IDF index over saved query descriptions.
+
+    Descriptions are short, so each one is treated as a set of terms and scored
+    with IDF-weighted cosine similarity through an inverted index.  Only the
+    postings of the query's own terms are visited, and very common terms are
+    skipped when rarer ones are available, so lookups stay cheap on large
+    libraries.  A match must have exactly the query's numbers and qualifiers
+    (above/below, before/after, not, ...), which cosine similarity alone
+    would outvote: "salary below 50000" never matches "salary above 50000".
+    """
+
+    def __init__(self, max_posting_fraction=0.1, max_candidates=50):
+        self.max_posting_fraction = max_posting_fraction
+        self.max_candidates = max_candidates
+        self._postings = defaultdict(set)
+        self._docs = {}
+        self._qualifiers = {}  # doc_id -> qualifiers(terms), which every lookup compares
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._docs)
+
+    def add(self, doc_id, description):
+        """Index (or re-index) a description under doc_id."""
+        terms = tokenize(description)
+        with self._lock:
+            self._remove_locked(doc_id)
+            self._docs[doc_id] = terms
+            self._qualifiers[doc_id] = qualifiers(terms)
+            for term in terms:
+                self._postings[term].add(doc_id)
+
+    def remove(self, doc_id):
+        """Drop doc_id from the index if present."""
+        with self._lock:
+            self._remove_locked(doc_id)
+
+    def _remove_locked(self, doc_id):
+        self._qualifiers.pop(doc_id, None)
+        for term in self._docs.pop(doc_id, ()):
+            posting = self._postings[term]
+            posting.discard(doc_id)
+            if not posting:
+                del self._postings[term]
+
+    def _idf(self, term):
+        return math.log((1 + len(self._docs)) / (1 + len(self._postings.get(term, ())))) + 1
+
+    def lookup(self, description, threshold=0.0):
+        """Return (doc_id, score) of the most similar description, or None below threshold."""
+        terms = tokenize(description)
+        if not terms:
+            return None
+        with self._lock:
+            known = [term for term in terms if term in self._postings]
+            if not known:
+                return None
+            limit = max(1, int(len(self._docs) * self.max_posting_fraction))
+            selective = [term for term in known if len(self._postings[term]) <= limit]
+
+            weights = {term: self._idf(term) ** 2 for term in terms}
+            required = qualifiers(terms)
+            partial = defaultdict(float)
+            if selective:
+                for term in selective:
+                    weight = weights[term]
+                    for doc_id in self._postings[term]:
+                        partial[doc_id] += weight
+            else:
+                # Only common terms: narrow to documents sharing as many of them as possible
+                postings = sorted((self._postings[term] for term in known), key=len)
+                shared_docs = postings[0]
+                for posting in postings[1:]:
+                    narrowed = shared_docs & posting
+                    if not narrowed:
+                        break
+                    shared_docs = narrowed
+                # The documents left share as many of the common terms as any can, so scoring a sample of
+                # those with the right qualifiers keeps lookups fast on large libraries
+                matching = (doc_id for doc_id in shared_docs if self._qualifiers[doc_id] == required)
+                for doc_id in itertools.islice(matching, self.max_candidates):
+                    partial[doc_id] = sum(weights[term] for term in self._docs[doc_id] & terms)
+
+            if len(partial) > self.max_candidates:
+                candidates = sorted(partial, key=partial.get, reverse=True)[: self.max_candidates]
+            else:
+                candidates = list(partial)
+
+            query_norm = math.sqrt(sum(weights.values()))
+            best = None
+            for doc_id in candidates:
+                doc_terms = self._docs[doc_id]
+                if self._qualifiers[doc_id] != required:
+                    continue
+                for term in doc_terms:
+                    if term not in weights:
+                        weights[term] = self._idf(term) ** 2
+                shared = sum(weights[term] for term in terms & doc_terms)
+                score = shared / (query_norm * math.sqrt(sum(weights[term] for term in doc_terms)))
+                if best is None or score > best[1]:
+                    best = (doc_id, score)
+
+        if best is None or best[1] < threshold:
+            return None
+        return best
+
+
+def build_index(rows):
+    """Build an index from (id, description) rows."""
+    index = SimilarityIndex()
+    for doc_id, description in rows:
+        index.add(doc_id, description)
+    return index
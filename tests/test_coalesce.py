@@ -0,0 +1,84 @@
+import threading
+
+import pytest
+
+from coalesce import ModelBusyError, ModelGate
+
+
+class RateLimited(Exception):
+    code = 429
+
+
+def gate(**options):
+    return ModelGate(rate=1000, base_delay=0.001, max_delay=0.001, **options)
+
+
+def run_with_timeout(func, timeout=2.0):
+    result = []
+    thread = threading.Thread(target=lambda: result.append(func()), daemon=True)
+    thread.start()
+    thread.join(timeout)
+    assert result, "the call did not return"
+    return result[0]
+
+
+def test_paused_streams_do_not_hold_slots():
+    model_gate = gate(max_concurrent=2)
+    streams = [model_gate.stream(lambda: iter(["SELECT 1;", " explanation"])) for _ in range(2)]
+    # Each caller reads the query, then pauses its stream to repair it
+    assert [next(stream) for stream in streams] == ["SELECT 1;", "SELECT 1;"]
+    assert run_with_timeout(lambda: model_gate.call(lambda: "repaired")) == "repaired"
+    assert [list(stream) for stream in streams] == [[" explanation"], [" explanation"]]
+
+
+def test_stream_retries_before_the_first_chunk():
+    attempts = []
+
+    def open_stream():
+        attempts.append(1)
+        if len(attempts) < 3:
+            raise RateLimited()
+        return iter(["a", "b"])
+
+    assert list(gate().stream(open_stream)) == ["a", "b"]
+    assert len(attempts) == 3
+
+
+def test_stream_errors_after_the_first_chunk_are_not_retried():
+    attempts = []
+
+    def open_stream():
+        attempts.append(1)
+        yield "a"
+        raise RateLimited()
+
+    stream = gate().stream(open_stream)
+    assert next(stream) == "a"
+    with pytest.raises(RateLimited):
+        next(stream)
+    assert len(attempts) == 1
+
+
+def test_call_retries_only_transient_errors():
+    with pytest.raises(ValueError):
+        gate().call(lambda: (_ for _ in ()).throw(ValueError("bad request")))
+    with pytest.raises(ModelBusyError):
+        gate(retries=2).call(lambda: (_ for _ in ()).throw(RateLimited()))
+
+
+def test_backoff_releases_the_slot():
+    model_gate = ModelGate(rate=1000, max_concurrent=1, retries=1, base_delay=1.0, max_delay=1.0)
+    failed = threading.Event()
+
+    def rate_limited():
+        failed.set()
+        raise RateLimited()
+
+    failing = threading.Thread(
+        target=lambda: pytest.raises(ModelBusyError, model_gate.call, rate_limited), daemon=True
+    )
+    failing.start()
+    assert failed.wait(1.0)
+    # While the first call sleeps before its retry, another one gets the only slot
+    assert run_with_timeout(lambda: model_gate.call(lambda: "ok"), timeout=0.5) == "ok"
+    failing.join()
@@ -0,0 +1,43 @@
+import pytest
+
+import db
+import migrations
+
+
+@pytest.fixture
+def path(tmp_path):
+    path = str(tmp_path / "queries.db")
+    db.init_db(path)
+    return path
+
+
+def test_resaving_counts_a_use(path):
+    query_id, existed = db.upsert_query("Active users", "SELECT * FROM users WHERE status = 'Active';", "", path)
+    assert not existed
+    # Case and spacing outside quotes, and the trailing semicolon, do not matter
+    again = db.upsert_query("active  users", "select *\nFROM users WHERE status = 'Active'", "Explained.", path)
+    assert again == (query_id, True)
+    assert db.get_explanation(query_id, path) == "Explained."
+
+
+@pytest.mark.parametrize("other", [
+    "SELECT * FROM users WHERE status = 'active'",
+    "SELECT * FROM users WHERE status = 'Active  '",
+    'SELECT * FROM users WHERE "Status" = \'Active\'',
+])
+def test_quoted_text_tells_queries_apart(path, other):
+    first, _ = db.upsert_query("Active users", "SELECT * FROM users WHERE status = 'Active'", "", path)
+    second, existed = db.upsert_query("Active users", other, "", path)
+    assert not existed
+    assert second != first
+    assert db.get_query(second, path)[2] == other
+
+
+def test_migration_rehashes_saved_queries(path):
+    query = "SELECT * FROM users WHERE status = 'Active'"
+    query_id = db.save_query("Active users", query, "", path)
+    with db.get_pool(path).connection() as conn:
+        conn.execute("UPDATE queries SET content_hash = 'old' WHERE id = ?", (query_id,))
+        migrations.literal_sensitive_content_hash(conn)
+        stored = conn.execute("SELECT content_hash FROM queries WHERE id = ?", (query_id,)).fetchone()[0]
+    assert stored == migrations.content_hash("Active users", query)
@@ -0,0 +1,50 @@
+import threading
+from concurrent.futures import Future
+
+from generator import ExplanationPrefetcher
+
+
+class InlinePool:
+    def submit(self, func, *args):
+        future = Future()
+        try:
+            future.set_result(func(*args))
+        except Exception as e:
+            future.set_exception(e)
+        return future
+
+
+def run_with_timeout(func, timeout=2.0):
+    result = []
+    thread = threading.Thread(target=lambda: result.append(func()), daemon=True)
+    thread.start()
+    thread.join(timeout)
+    assert result, "the call did not return"
+    return result[0]
+
+
+def test_explanations_are_generated_once():
+    calls = []
+    prefetcher = ExplanationPrefetcher(lambda query: calls.append(query) or f"explains {query}")
+    assert prefetcher.submit("SELECT 1").result() == "explains SELECT 1"
+    assert prefetcher.submit("SELECT 1").result() == "explains SELECT 1"
+    assert prefetcher.get("SELECT 1") == "explains SELECT 1"
+    assert calls == ["SELECT 1"]
+
+
+def test_failure_that_finishes_before_submit_returns():
+    attempts = []
+
+    def fail(query):
+        attempts.append(query)
+        raise RuntimeError("model unavailable")
+
+    prefetcher = ExplanationPrefetcher(fail)
+    # A pool that runs tasks right away, so they have failed before the callback is added
+    prefetcher._pool = InlinePool()
+    future = run_with_timeout(lambda: prefetcher.submit("SELECT 1"))
+    assert isinstance(future.exception(), RuntimeError)
+    # The failed attempt is forgotten, so the explanation can be requested again
+    assert prefetcher.get("SELECT 1") is None
+    run_with_timeout(lambda: prefetcher.submit("SELECT 1").exception())
+    assert attempts == ["SELECT 1", "SELECT 1"]
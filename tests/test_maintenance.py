@@ -0,0 +1,106 @@
+import sqlite3
+import time
+
+import pytest
+
+import db
+import maintenance
+
+
+@pytest.fixture
+def path(tmp_path):
+    path = str(tmp_path / "queries.db")
+    db.init_db(path)
+    return path
+
+
+def save(path, count, prefix="query"):
+    return [db.save_query(f"{prefix} {n}", f"SELECT {n};", "", path=path) for n in range(count)]
+
+
+def age(path, query_ids, days):
+    with db.get_pool(path).connection() as conn:
+        conn.executemany(
+            "UPDATE queries SET last_used = ? WHERE id = ?",
+            [(int(time.time()) - days * 86400, query_id) for query_id in query_ids],
+        )
+
+
+def remaining(path):
+    return {row[0] for row in db.get_saved_queries(path)}
+
+
+def test_prune_by_age(path):
+    ids = save(path, 4)
+    age(path, ids[:2], 30)
+    assert sorted(maintenance.prune_queries(path, max_age_days=7)) == ids[:2]
+    assert remaining(path) == set(ids[2:])
+
+
+def test_prune_keeps_most_recently_used(path, monkeypatch):
+    monkeypatch.setattr(maintenance, "DELETE_BATCH_SIZE", 2)
+    ids = save(path, 5)
+    for days, query_id in enumerate(reversed(ids)):
+        age(path, [query_id], days)
+    assert sorted(maintenance.prune_queries(path, max_rows=2)) == ids[:3]
+    assert remaining(path) == set(ids[3:])
+
+
+def test_zero_policy_keeps_everything(path):
+    ids = save(path, 3)
+    age(path, ids, 3650)
+    assert maintenance.prune_queries(path) == []
+
+
+def test_pass_uses_the_stored_policy(path):
+    ids = save(path, 3)
+    age(path, ids[:1], 30)
+    maintenance.Maintainer(path).configure(max_age_days=7)
+    assert db.get_retention_policy(path) == (7, 0)
+    assert maintenance.run_maintenance(path)["deleted"] == ids[:1]
+    # Arguments override the stored policy for one pass
+    assert maintenance.run_maintenance(path, max_age_days=0, max_rows=1)["deleted"] == ids[1:2]
+
+
+def test_vacuum_releases_free_pages(path):
+    db.save_queries([(f"long {n}", f"SELECT '{n}{'x' * 4000}';", "") for n in range(200)], path=path)
+    maintenance.prune_queries(path, max_rows=1)
+    assert maintenance.storage_stats(path)["free_bytes"] > 0
+    assert maintenance.vacuum(path) > 0
+    stats = maintenance.storage_stats(path)
+    assert stats["incremental_vacuum"]
+    assert stats["free_bytes"] == 0
+    assert stats["wal_bytes"] == 0
+
+
+def create_without_auto_vacuum(path):
+    conn = sqlite3.connect(path)
+    conn.execute("PRAGMA auto_vacuum = NONE")
+    conn.execute("CREATE TABLE placeholder (id INTEGER)")
+    conn.close()
+    db.init_db(path)
+
+
+def test_old_file_is_not_rewritten_without_need(tmp_path):
+    path = str(tmp_path / "old.db")
+    create_without_auto_vacuum(path)
+    save(path, 3)
+    report = maintenance.run_maintenance(path)
+    assert not report["rewritten"]
+    assert not maintenance.storage_stats(path)["incremental_vacuum"]
+
+
+def test_old_file_is_rewritten_on_request(tmp_path):
+    path = str(tmp_path / "old.db")
+    create_without_auto_vacuum(path)
+    save(path, 3)
+    assert maintenance.run_maintenance(path, convert=True)["rewritten"]
+    assert maintenance.storage_stats(path)["incremental_vacuum"]
+    assert not maintenance.run_maintenance(path, convert=True)["rewritten"]
+
+
+def test_needs_conversion():
+    stats = {"incremental_vacuum": False, "file_bytes": 1000, "free_bytes": 100}
+    assert not maintenance.needs_conversion(stats)
+    assert maintenance.needs_conversion({**stats, "free_bytes": 400})
+    assert not maintenance.needs_conversion({**stats, "free_bytes": 400, "incremental_vacuum": True})
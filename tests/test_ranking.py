@@ -0,0 +1,64 @@
+import pytest
+
+from ranking import ASSUMED_TABLE_ROWS, plan_cost, rank_queries
+from schema_digest import digest_from_ddl
+
+SCHEMA = """
+CREATE TABLE customers (id INTEGER PRIMARY KEY, name TEXT, region TEXT);
+CREATE INDEX customers_region ON customers (region);
+CREATE TABLE orders (id INTEGER PRIMARY KEY, customer_id INTEGER REFERENCES customers (id), total REAL);
+"""
+
+
+@pytest.fixture
+def digest():
+    return digest_from_ddl(SCHEMA)
+
+
+def test_fewest_scans_and_lowest_cost_first(digest):
+    ranking = rank_queries([
+        "SELECT name FROM customers",
+        "SELECT name FROM customers WHERE region = 'north'",
+        "SELECT name FROM customers WHERE id = 1",
+    ], digest)
+    assert [entry["query"] for entry in ranking] == [
+        "SELECT name FROM customers WHERE id = 1",
+        "SELECT name FROM customers WHERE region = 'north'",
+        "SELECT name FROM customers",
+    ]
+    assert [entry["full_scans"] for entry in ranking] == [0, 0, 1]
+    assert ranking[-1]["cost"] == ASSUMED_TABLE_ROWS
+
+
+def test_invalid_candidates_rank_last_in_their_order(digest):
+    ranking = rank_queries(["SELECT * FROM missing", "SELECT name FROM customers", "SELEC name"], digest)
+    assert ranking[0]["query"] == "SELECT name FROM customers"
+    assert [entry["query"] for entry in ranking[1:]] == ["SELECT * FROM missing", "SELEC name"]
+    for entry in ranking[1:]:
+        assert entry["error"]
+        assert entry["full_scans"] is None and entry["cost"] is None and entry["plan"] == []
+
+
+def test_all_invalid_keeps_every_candidate(digest):
+    queries = ["SELECT nope FROM customers", "DROP TABLE"]
+    ranking = rank_queries(queries, digest)
+    assert [entry["query"] for entry in ranking] == queries
+    assert all(entry["error"] for entry in ranking)
+
+
+def test_unplanned_candidates_rank_after_planned_ones():
+    # Without a schema only queries that touch no table can be planned
+    ranking = rank_queries(["SELECT * FROM customers", "SELECT 1"], None)
+    assert [entry["query"] for entry in ranking] == ["SELECT 1", "SELECT * FROM customers"]
+    assert ranking[1]["error"] is None and ranking[1]["cost"] is None
+
+
+def test_correlated_subquery_costs_per_outer_row():
+    plan = [
+        (2, 0, "SCAN customers"),
+        (5, 0, "CORRELATED SCALAR SUBQUERY 1"),
+        (9, 5, "SEARCH orders USING INDEX orders_index_1 (customer_id=?)"),
+    ]
+    scans, cost = plan_cost(plan)
+    assert scans == 1
+    assert cost > ASSUMED_TABLE_ROWS * 2
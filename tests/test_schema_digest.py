@@ -0,0 +1,48 @@
+import sqlite3
+
+from schema_digest import digest_from_ddl, introspect
+
+SCHEMA = """
+CREATE TABLE regions (id INTEGER PRIMARY KEY, name TEXT);
+CREATE TABLE customers (id INTEGER PRIMARY KEY, name TEXT NOT NULL, region_id INTEGER REFERENCES regions (id));
+CREATE UNIQUE INDEX customers_name ON customers (name);
+"""
+
+
+def test_digest_lines():
+    digest = digest_from_ddl(SCHEMA)
+    assert digest.render() == (
+        "customers(id integer pk, name text, region_id integer -> regions.id)\n"
+        "regions(id integer pk, name text)"
+    )
+    assert digest.tables["customers"].indexes == [(["name"], True)]
+
+
+def test_uploaded_ddl_cannot_attach_files(tmp_path):
+    target = tmp_path / "attached.db"
+    victim = tmp_path / "queries.db"
+    conn = sqlite3.connect(victim)
+    conn.execute("CREATE TABLE queries (id INTEGER PRIMARY KEY)")
+    conn.execute("INSERT INTO queries VALUES (1)")
+    conn.commit()
+    conn.close()
+
+    tables = introspect(SCHEMA + f"""
+    ATTACH DATABASE '{target}' AS x;
+    CREATE TABLE x.t (a);
+    INSERT INTO x.t VALUES (1);
+    ATTACH DATABASE '{victim}' AS q;
+    DELETE FROM q.queries;
+    """)
+
+    assert not target.exists()
+    conn = sqlite3.connect(victim)
+    assert conn.execute("SELECT COUNT(*) FROM queries").fetchone()[0] == 1
+    conn.close()
+    # Refused DDL still yields the tables it defines, parsed by pattern
+    assert {"regions", "customers"} <= {table.name for table in tables}
+
+
+def test_uploaded_ddl_runs_no_other_statements():
+    tables = introspect(SCHEMA + "INSERT INTO regions VALUES (1, 'north'); DROP TABLE customers;")
+    assert {table.name for table in tables} == {"regions", "customers"}
@@ -0,0 +1,68 @@
+import pytest
+
+from similarity import build_index
+
+# The app reuses a saved query at this score (app1.SIMILARITY_THRESHOLD)
+THRESHOLD = 0.8
+
+
+@pytest.fixture
+def index():
+    return build_index([
+        (1, "Employees with salary above 50000"),
+        (2, "Top 5 customers by total purchase amount"),
+        (3, "Orders placed before 2020"),
+        (4, "List products in stock"),
+    ])
+
+
+@pytest.mark.parametrize("description, expected", [
+    ("employees whose salary is above 50000", 1),
+    ("top 5 clients by total spend", 2),
+    ("show orders placed before 2020", 3),
+])
+def test_paraphrases_match(index, description, expected):
+    doc_id, score = index.lookup(description, threshold=THRESHOLD)
+    assert doc_id == expected
+    assert score >= THRESHOLD
+
+
+@pytest.mark.parametrize("description", [
+    "employees with salary below 50000",
+    "employees with salary above 60000",
+    "top 10 customers by total purchase amount",
+    "orders placed after 2020",
+    "employees with salary not above 50000",
+])
+def test_different_numbers_or_qualifiers_never_match(index, description):
+    assert index.lookup(description) is None
+
+
+def test_threshold(index):
+    doc_id, score = index.lookup("products out of stock")
+    assert doc_id == 4
+    assert score < THRESHOLD
+    assert index.lookup("products out of stock", threshold=THRESHOLD) is None
+    assert index.lookup("products out of stock", threshold=score) == (doc_id, score)
+
+
+def test_unknown_terms(index):
+    assert index.lookup("completely unrelated words") is None
+    assert index.lookup("") is None
+
+
+def test_removed_descriptions_are_not_matched(index):
+    index.remove(1)
+    assert len(index) == 3
+    assert index.lookup("employees with salary above 50000") is None
+    index.add(1, "Employees with salary above 50000")
+    assert index.lookup("employees with salary above 50000", threshold=THRESHOLD)[0] == 1
+
+
+def test_common_terms_only_still_respect_qualifiers():
+    # Every term is in every description, so lookups take the common-terms path
+    rows = [(n, f"orders by region in {2000 + n % 4}") for n in range(400)]
+    index = build_index(rows)
+    doc_id, score = index.lookup("orders by region in 2002")
+    assert rows[doc_id][1].endswith("2002")
+    assert score == pytest.approx(1.0)
@@ -0,0 +1,68 @@
+import pytest
+
+from transpile import DIALECTS, TranspileError, transpile
+
+MONTH_AGO = "SELECT * FROM orders WHERE created_at >= CURRENT_DATE - INTERVAL '1' MONTH"
+
+
+@pytest.mark.parametrize("dialect, expected", [
+    ("SQLite", "SELECT id FROM users LIMIT 5"),
+    ("PostgreSQL", "SELECT id FROM users LIMIT 5"),
+    ("MySQL", "SELECT id FROM users LIMIT 5"),
+    ("SQL Server", "SELECT TOP 5 id FROM users"),
+])
+def test_limit(dialect, expected):
+    assert transpile("SELECT id FROM users LIMIT 5", dialect) == expected
+
+
+def test_parameter_limit_is_parenthesized_for_sql_server():
+    assert transpile("SELECT id FROM users LIMIT ?", "SQL Server") == "SELECT TOP (?) id FROM users"
+
+
+def test_limit_with_offset_for_sql_server():
+    assert transpile("SELECT id FROM users LIMIT 5 OFFSET 10", "SQL Server") == (
+        "SELECT id FROM users ORDER BY (SELECT NULL) OFFSET 10 ROWS FETCH NEXT 5 ROWS ONLY"
+    )
+
+
+@pytest.mark.parametrize("sql", [
+    "DELETE FROM logs ORDER BY ts LIMIT 100",
+    "UPDATE logs SET seen = 1 LIMIT 3",
+])
+def test_limited_delete_and_update(sql):
+    for dialect in ("SQLite", "PostgreSQL", "MySQL"):
+        assert transpile(sql, dialect) == sql
+    with pytest.raises(TranspileError, match="other than SELECT"):
+        transpile(sql, "SQL Server")
+
+
+@pytest.mark.parametrize("dialect, expected", [
+    ("SQLite", "SELECT * FROM orders WHERE created_at >= date('now', '-1 months')"),
+    ("PostgreSQL", "SELECT * FROM orders WHERE created_at >= CURRENT_DATE - INTERVAL '1 month'"),
+    ("MySQL", "SELECT * FROM orders WHERE created_at >= CURRENT_DATE - INTERVAL 1 MONTH"),
+    ("SQL Server", "SELECT * FROM orders WHERE created_at >= DATEADD(month, -1, CAST(GETDATE() AS DATE))"),
+])
+def test_ansi_interval(dialect, expected):
+    assert transpile(MONTH_AGO, dialect) == expected
+
+
+@pytest.mark.parametrize("dialect", DIALECTS)
+def test_interval_forms_agree(dialect):
+    assert transpile("SELECT CURRENT_DATE - INTERVAL '7' DAY", dialect) == (
+        transpile("SELECT CURRENT_DATE - INTERVAL '7 days'", dialect)
+    )
+
+
+@pytest.mark.parametrize("dialect, expected", [
+    ("SQLite", "SELECT first || ' ' || last FROM users"),
+    ("PostgreSQL", "SELECT first || ' ' || last FROM users"),
+    ("MySQL", "SELECT CONCAT(first, ' ', last) FROM users"),
+    ("SQL Server", "SELECT CONCAT(first, ' ', last) FROM users"),
+])
+def test_string_concatenation(dialect, expected):
+    assert transpile("SELECT first || ' ' || last FROM users", dialect) == expected
+
+
+def test_text_in_literals_and_comments_is_left_alone():
+    sql = "SELECT * FROM t WHERE msg = 'LIMIT 5 || TRUE' -- LIMIT 2"
+    assert transpile(sql, "SQL Server") == sql
@@ -0,0 +1,699 @@
+"""Rule-based rewriting of generated SQL between dialects.
+
+Queries are generated once, in standard SQL, and rewritten locally for the
+dialect a user picks instead of asking the model again.  The rewrite works
+on tokens, so string literals, comments and quoted names are never changed
+by accident.  It runs in two steps: constructs specific to one dialect are
+first brought to a canonical form, which is then rendered for the target.
+
+Covered: row limits (LIMIT, TOP, OFFSET/FETCH), identifier quoting, the
+current date and time, date parts, date arithmetic with intervals, string
+concatenation, booleans, ILIKE and PostgreSQL's `::` casts.  Anything else
+is passed through unchanged; constructs the target cannot express raise
+TranspileError.
+"""
+import re
+from functools import lru_cache
+
+DIALECTS = ("SQLite", "PostgreSQL", "MySQL", "SQL Server")
+
+TOKEN_PATTERN = re.compile(r"""
+    (?P<space>\s+)
+  | (?P<comment>--[^\n]*|/\*.*?(?:\*/|$))
+  | (?P<string>'(?:[^']|'')*'?)
+  | (?P<name>"(?:[^"]|"")*"?|`(?:[^`]|``)*`?|\[[^\]]*\]?)
+  | (?P<number>\d+(?:\.\d*)?|\.\d+)
+  | (?P<word>[A-Za-z_][\w$]*)
+  | (?P<op>\|\||<=|>=|<>|!=|::|.)
+""", re.S | re.X)
+
+# Words that can precede "(" without being a function call
+NON_FUNCTIONS = {
+    "AND", "AS", "BY", "ELSE", "EXISTS", "FROM", "HAVING", "IN", "JOIN", "NOT", "ON", "OR",
+    "OVER", "SELECT", "THEN", "USING", "VALUES", "WHEN", "WHERE", "WITH",
+}
+
+DATE_UNITS = {"YEAR", "MONTH", "WEEK", "DAY", "HOUR", "MINUTE", "SECOND"}
+# SQL Server DATEPART / DATEADD abbreviations
+UNIT_ABBREVIATIONS = {
+    "YY": "YEAR", "YYYY": "YEAR", "MM": "MONTH", "M": "MONTH", "WK": "WEEK", "WW": "WEEK",
+    "DD": "DAY", "D": "DAY", "HH": "HOUR", "MI": "MINUTE", "N": "MINUTE", "SS": "SECOND", "S": "SECOND",
+}
+STRFTIME_FORMATS = {"%Y": "YEAR", "%m": "MONTH", "%d": "DAY", "%H": "HOUR", "%M": "MINUTE", "%S": "SECOND"}
+
+# 'now' modifiers of SQLite date functions, e.g. '-7 days'
+DATE_MODIFIER = re.compile(r"^'\s*([+-]?)\s*(\d+(?:\.\d+)?)\s+([a-z]+)\s*'$", re.I)
+# Interval arguments of MySQL DATE_ADD / DATE_SUB, e.g. INTERVAL 7 DAY
+INTERVAL_ARGUMENT = re.compile(r"^INTERVAL\s+'?\s*(-?\d+(?:\.\d+)?)\s*'?\s+([a-z]+)$", re.I)
+# Canonical interval literals, e.g. INTERVAL '7 day'
+INTERVAL_LITERAL = re.compile(r"^'\s*(\d+(?:\.\d+)?)\s+([a-z]+)\s*'$", re.I)
+# Standard SQL puts the unit after the quoted amount: INTERVAL '7' DAY
+INTERVAL_AMOUNT = re.compile(r"^'\s*(\d+(?:\.\d+)?)\s*'$")
+EXTRACT_ARGUMENT = re.compile(r"^(\w+)\s+FROM\s+(.+)$", re.I | re.S)
+# Markdown code blocks, as in some saved model responses: only their contents are SQL
+CODE_BLOCK = re.compile(r"(```[A-Za-z]*[ \t]*\n)(.*?)(```)", re.S)
+CAST_ARGUMENT = re.compile(r"^(.+?)\s+AS\s+(\w+(?:\s*\([^)]*\))?)$", re.I | re.S)
+
+# MySQL only casts to a few type names
+MYSQL_CAST_TYPES = {
+    "INTEGER": "SIGNED", "INT": "SIGNED", "BIGINT": "SIGNED", "SMALLINT": "SIGNED",
+    "TEXT": "CHAR", "VARCHAR": "CHAR", "REAL": "DOUBLE", "FLOAT": "DOUBLE", "NUMERIC": "DECIMAL",
+    "TIMESTAMP": "DATETIME",
+}
+# OFFSET needs a LIMIT in SQLite and MySQL; these mean "no limit"
+UNLIMITED = {"SQLite": "-1", "MySQL": "18446744073709551615"}
+
+
+class TranspileError(ValueError):
+    """A query uses something the target dialect cannot express."""
+
+
+def tokenize(sql):
+    return [[match.lastgroup, match.group()] for match in TOKEN_PATTERN.finditer(sql)]
+
+
+def render(tokens):
+    return "".join(text for _, text in tokens)
+
+
+def is_word(token, *names):
+    return token[0] == "word" and token[1].upper() in names
+
+
+def is_op(token, *texts):
+    return token[0] == "op" and token[1] in texts
+
+
+def next_sig(tokens, i):
+    """Index of the first token after i that is not whitespace or a comment."""
+    for j in range(i + 1, len(tokens)):
+        if tokens[j][0] not in ("space", "comment"):
+            return j
+    return None
+
+
+def prev_sig(tokens, i):
+    for j in range(i - 1, -1, -1):
+        if tokens[j][0] not in ("space", "comment"):
+            return j
+    return None
+
+
+def depths(tokens):
+    """Parenthesis depth of every token; the parentheses themselves count as the outer level."""
+    result, depth = [], 0
+    for token in tokens:
+        if is_op(token, ")"):
+            depth -= 1
+        result.append(depth)
+        if is_op(token, "("):
+            depth += 1
+    return result
+
+
+def closing(tokens, i):
+    """Index of the parenthesis matching the "(" at i."""
+    depth = 0
+    for j in range(i, len(tokens)):
+        if is_op(tokens[j], "("):
+            depth += 1
+        elif is_op(tokens[j], ")"):
+            depth -= 1
+            if depth == 0:
+                return j
+    return len(tokens) - 1
+
+
+def opening(tokens, i):
+    """Index of the parenthesis matching the ")" at i."""
+    depth = 0
+    for j in range(i, -1, -1):
+        if is_op(tokens[j], ")"):
+            depth += 1
+        elif is_op(tokens[j], "("):
+            depth -= 1
+            if depth == 0:
+                return j
+    return 0
+
+
+def primary_before(tokens, end):
+    """Start index of the operand that ends at token end (a name, literal, call or group)."""
+    token = tokens[end]
+    if is_op(token, ")"):
+        start = opening(tokens, end)
+        before = prev_sig(tokens, start)
+        if before is not None and tokens[before][0] in ("word", "name") and tokens[before][1].upper() not in NON_FUNCTIONS:
+            start = before
+    elif is_word(token, "END"):
+        depth, start = 0, end
+        for j in range(end, -1, -1):
+            if is_word(tokens[j], "END"):
+                depth += 1
+            elif is_word(tokens[j], "CASE"):
+                depth -= 1
+                if depth == 0:
+                    start = j
+                    break
+    else:
+        start = end
+    # Qualified names: table.column
+    while True:
+        dot = prev_sig(tokens, start)
+        if dot is None or not is_op(tokens[dot], "."):
+            return start
+        owner = prev_sig(tokens, dot)
+        if owner is None or tokens[owner][0] not in ("word", "name"):
+            return start
+        start = owner
+
+
+def primary_after(tokens, start):
+    """End index of the operand that starts at token start."""
+    token = tokens[start]
+    if is_op(token, "("):
+        return closing(tokens, start)
+    if is_word(token, "CASE"):
+        depth = 0
+        for j in range(start, len(tokens)):
+            if is_word(tokens[j], "CASE"):
+                depth += 1
+            elif is_word(tokens[j], "END"):
+                depth -= 1
+                if depth == 0:
+                    return j
+        return len(tokens) - 1
+    end = start
+    while True:
+        following = next_sig(tokens, end)
+        if following is None:
+            return end
+        if is_op(tokens[following], "(") and tokens[end][0] in ("word", "name") \
+                and tokens[end][1].upper() not in NON_FUNCTIONS:
+            return closing(tokens, following)
+        if is_op(tokens[following], "."):
+            member = next_sig(tokens, following)
+            if member is not None and tokens[member][0] in ("word", "name"):
+                end = member
+                continue
+        return end
+
+
+def operand(text):
+    """text, parenthesized unless it already is a single operand."""
+    tokens = tokenize(text.strip())
+    first, last = next_sig(tokens, -1), prev_sig(tokens, len(tokens))
+    if first is None or primary_after(tokens, first) == last:
+        return text.strip()
+    return f"({text.strip()})"
+
+
+def call_args(tokens, open_i, close_i):
+    """Argument texts of the call whose parentheses are at open_i and close_i."""
+    args, depth, start = [], 0, open_i + 1
+    for j in range(open_i + 1, close_i):
+        if is_op(tokens[j], "("):
+            depth += 1
+        elif is_op(tokens[j], ")"):
+            depth -= 1
+        elif is_op(tokens[j], ",") and depth == 0:
+            args.append(render(tokens[start:j]).strip())
+            start = j + 1
+    last = render(tokens[start:close_i]).strip()
+    if args or last:
+        args.append(last)
+    return args
+
+
+def rewrite_calls(tokens, rules):
+    """Replace function calls using rules: name -> rule(args) returning new text or None."""
+    i = 0
+    while i < len(tokens):
+        token = tokens[i]
+        rule = rules.get(token[1].upper()) if token[0] == "word" else None
+        if rule is None:
+            i += 1
+            continue
+        open_i, before = next_sig(tokens, i), prev_sig(tokens, i)
+        if open_i is not None and is_op(tokens[open_i], "(") and not (before is not None and is_op(tokens[before], ".")):
+            close_i = closing(tokens, open_i)
+            replacement = rule(call_args(tokens, open_i, close_i))
+            if replacement is not None:
+                tokens[i:close_i + 1] = tokenize(replacement)
+        i += 1
+
+
+def match_sequence(tokens, i, *pattern):
+    """Indices of the significant tokens from i matching pattern, or None.
+
+    Items are a set of words, "#" for a number or parameter, or the exact text
+    of an operator.
+    """
+    matched, j = [], i
+    for item in pattern:
+        if j is None:
+            return None
+        token = tokens[j]
+        if isinstance(item, (set, frozenset)):
+            ok = is_word(token, *item)
+        elif item == "#":
+            ok = token[0] == "number" or is_op(token, "?")
+        else:
+            ok = is_op(token, item)
+        if not ok:
+            return None
+        matched.append(j)
+        j = next_sig(tokens, j)
+    return matched
+
+
+def date_unit(text):
+    unit = text.strip().strip("'").upper()
+    unit = UNIT_ABBREVIATIONS.get(unit, unit)
+    if unit.endswith("S") and unit[:-1] in DATE_UNITS:
+        unit = unit[:-1]
+    return unit if unit in DATE_UNITS else None
+
+
+def interval(base, sign, amount, unit):
+    """Canonical date arithmetic: base +/- INTERVAL 'n unit'."""
+    if amount.startswith("-"):
+        sign, amount = ("+" if sign == "-" else "-"), amount[1:]
+    return f"{operand(base)} {sign} INTERVAL '{amount} {unit.lower()}'"
+
+
+# Canonical form
+
+def sqlite_now(base):
+    def rule(args):
+        if not args or args[0].lower() != "'now'":
+            return None
+        if len(args) == 1:
+            return base
+        match = DATE_MODIFIER.match(args[1]) if len(args) == 2 else None
+        unit = match and date_unit(match.group(3))
+        if not unit:
+            return None
+        return interval(base, "-" if match.group(1) == "-" else "+", match.group(2), unit)
+    return rule
+
+
+def date_part(unit):
+    return lambda args: f"EXTRACT({unit} FROM {args[0]})" if len(args) == 1 else None
+
+
+def datepart(args):
+    unit = date_unit(args[0]) if len(args) == 2 else None
+    return f"EXTRACT({unit} FROM {args[1]})" if unit else None
+
+
+def strftime_part(args):
+    unit = STRFTIME_FORMATS.get(args[0].strip("'")) if len(args) == 2 else None
+    return f"EXTRACT({unit} FROM {args[1]})" if unit else None
+
+
+def no_args(text):
+    return lambda args: text if not args else None
+
+
+def canonical_cast(args):
+    match = CAST_ARGUMENT.match(args[0]) if len(args) == 1 else None
+    if not match:
+        return None
+    value, type_name = match.group(1).strip(), match.group(2).upper()
+    if value.upper() == "CURRENT_TIMESTAMP" and type_name == "DATE":
+        return "CURRENT_DATE"
+    if value.upper().startswith("EXTRACT(") and type_name in ("INTEGER", "INT", "SIGNED"):
+        return value
+    return None
+
+
+def concat(args):
+    if len(args) < 2:
+        return None
+    return "(" + " || ".join(operand(arg) for arg in args) + ")"
+
+
+def mysql_date_arithmetic(sign):
+    def rule(args):
+        if len(args) != 2:
+            return None
+        if re.fullmatch(r"-?\d+", args[1]):
+            return interval(args[0], sign, args[1], "DAY")
+        match = INTERVAL_ARGUMENT.match(args[1])
+        unit = match and date_unit(match.group(2))
+        return interval(args[0], sign, match.group(1), unit) if unit else None
+    return rule
+
+
+def dateadd(args):
+    unit = date_unit(args[0]) if len(args) == 3 else None
+    if not unit or not re.fullmatch(r"-?\d+", args[1]):
+        return None
+    return interval(args[2], "+", args[1], unit)
+
+
+# Calls whose arguments are plain values; rewritten first so the rules below see the results
+CANONICAL_LEAF_CALLS = {
+    "NOW": no_args("CURRENT_TIMESTAMP"),
+    "GETDATE": no_args("CURRENT_TIMESTAMP"),
+    "SYSDATE": no_args("CURRENT_TIMESTAMP"),
+    "SYSDATETIME": no_args("CURRENT_TIMESTAMP"),
+    "CURRENT_TIMESTAMP": no_args("CURRENT_TIMESTAMP"),
+    "CURDATE": no_args("CURRENT_DATE"),
+    "CURRENT_DATE": no_args("CURRENT_DATE"),
+    "DATE": sqlite_now("CURRENT_DATE"),
+    "DATETIME": sqlite_now("CURRENT_TIMESTAMP"),
+    "YEAR": date_part("YEAR"),
+    "MONTH": date_part("MONTH"),
+    "DAY": date_part("DAY"),
+    "DATEPART": datepart,
+    "STRFTIME": strftime_part,
+}
+CANONICAL_CALLS = {
+    "CAST": canonical_cast,
+    "CONCAT": concat,
+    "DATE_ADD": mysql_date_arithmetic("+"),
+    "ADDDATE": mysql_date_arithmetic("+"),
+    "DATE_SUB": mysql_date_arithmetic("-"),
+    "SUBDATE": mysql_date_arithmetic("-"),
+    "DATEADD": dateadd,
+}
+
+
+def scope(tokens, levels, i):
+    """(start, end) of the statement or subquery around token i, at its parenthesis depth."""
+    depth = levels[i]
+
+    def outside(j):
+        return levels[j] < depth or (levels[j] == depth and is_op(tokens[j], ";"))
+
+    start = i
+    while start > 0 and not outside(start - 1):
+        start -= 1
+    end = i
+    while end < len(tokens) - 1 and not outside(end + 1):
+        end += 1
+    while end > start and tokens[end][0] in ("space", "comment"):
+        end -= 1
+    return start, end
+
+
+def canonical_limits(tokens):
+    """TOP, OFFSET ... FETCH and MySQL's LIMIT offset, count become LIMIT count OFFSET offset."""
+    i = 0
+    while i < len(tokens):
+        token = tokens[i]
+        if token[0] != "word":
+            pass
+        elif is_word(token, "LIMIT"):
+            matched = match_sequence(tokens, i, {"LIMIT"}, "#", ",", "#")
+            if matched:
+                offset, count = tokens[matched[1]][1], tokens[matched[3]][1]
+                tokens[i:matched[3] + 1] = tokenize(f"LIMIT {count} OFFSET {offset}")
+        elif is_word(token, "OFFSET"):
+            matched = match_sequence(tokens, i, {"OFFSET"}, "#", {"ROW", "ROWS"})
+            if matched:
+                fetch = match_sequence(tokens, next_sig(tokens, matched[2]) or len(tokens) - 1,
+                                       {"FETCH"}, {"NEXT", "FIRST"}, "#", {"ROW", "ROWS"}, {"ONLY"})
+                offset = tokens[matched[1]][1]
+                if fetch:
+                    tokens[i:fetch[4] + 1] = tokenize(f"LIMIT {tokens[fetch[2]][1]} OFFSET {offset}")
+                else:
+                    tokens[i:matched[2] + 1] = tokenize(f"OFFSET {offset}")
+        elif is_word(token, "FETCH"):
+            matched = match_sequence(tokens, i, {"FETCH"}, {"NEXT", "FIRST"}, "#", {"ROW", "ROWS"}, {"ONLY"})
+            if matched:
+                tokens[i:matched[4] + 1] = tokenize(f"LIMIT {tokens[matched[2]][1]}")
+        elif is_word(token, "SELECT"):
+            top = next_sig(tokens, i)
+            if top is not None and is_word(tokens[top], "DISTINCT", "ALL"):
+                top = next_sig(tokens, top)
+            matched = top is not None and (match_sequence(tokens, top, {"TOP"}, "#")
+                                           or match_sequence(tokens, top, {"TOP"}, "(", "#", ")"))
+            after = matched and next_sig(tokens, matched[-1])
+            if matched and not (after is not None and is_word(tokens[after], "PERCENT", "WITH")):
+                count = tokens[matched[-2] if len(matched) == 4 else matched[1]][1]
+                end = matched[-1] + 1
+                while end < len(tokens) and tokens[end][0] == "space":
+                    end += 1
+                del tokens[top:end]
+                _, last = scope(tokens, depths(tokens), i)
+                tokens[last + 1:last + 1] = tokenize(f" LIMIT {count}")
+        i += 1
+
+
+def canonical_intervals(tokens):
+    """INTERVAL 7 DAY (MySQL), INTERVAL '7' DAY (standard) and '7 days' (PostgreSQL) become INTERVAL '7 day'."""
+    for i, token in enumerate(tokens):
+        if not is_word(token, "INTERVAL"):
+            continue
+        value = next_sig(tokens, i)
+        if value is None:
+            continue
+        amount = INTERVAL_AMOUNT.match(tokens[value][1]) if tokens[value][0] == "string" else None
+        if tokens[value][0] == "number" or amount:
+            unit_i = next_sig(tokens, value)
+            unit = unit_i is not None and tokens[unit_i][0] == "word" and date_unit(tokens[unit_i][1])
+            if unit:
+                number = amount.group(1) if amount else tokens[value][1]
+                tokens[value:unit_i + 1] = [["string", f"'{number} {unit.lower()}'"]]
+        elif tokens[value][0] == "string":
+            match = INTERVAL_LITERAL.match(tokens[value][1])
+            unit = match and date_unit(match.group(2))
+            if unit:
+                tokens[value] = ["string", f"'{match.group(1)} {unit.lower()}'"]
+
+
+def canonicalize(tokens):
+    canonical_limits(tokens)
+    rewrite_calls(tokens, CANONICAL_LEAF_CALLS)
+    rewrite_calls(tokens, CANONICAL_CALLS)
+    canonical_intervals(tokens)
+
+
+# Rendering for a dialect
+
+def render_casts(tokens):
+    """PostgreSQL's value::type becomes CAST(value AS type)."""
+    i = 0
+    while i < len(tokens):
+        if is_op(tokens[i], "::"):
+            left, right = prev_sig(tokens, i), next_sig(tokens, i)
+            if left is not None and right is not None and tokens[right][0] == "word":
+                start = primary_before(tokens, left)
+                end = right
+                following = next_sig(tokens, right)
+                if following is not None and is_op(tokens[following], "("):
+                    end = closing(tokens, following)
+                value, type_name = render(tokens[start:left + 1]), render(tokens[right:end + 1])
+                tokens[start:end + 1] = tokenize(f"CAST({value} AS {type_name})")
+                i = start
+        i += 1
+
+
+def render_intervals(tokens, dialect):
+    """base +/- INTERVAL 'n unit' in the dialect's date arithmetic."""
+    i = 0
+    while i < len(tokens):
+        if is_word(tokens[i], "INTERVAL"):
+            literal, sign_i = next_sig(tokens, i), prev_sig(tokens, i)
+            match = literal is not None and tokens[literal][0] == "string" and INTERVAL_LITERAL.match(tokens[literal][1])
+            base_end = prev_sig(tokens, sign_i) if sign_i is not None and is_op(tokens[sign_i], "+", "-") else None
+            if match and base_end is not None:
+                start = primary_before(tokens, base_end)
+                base, sign = render(tokens[start:base_end + 1]), tokens[sign_i][1]
+                amount, unit = match.group(1), match.group(2).upper()
+                if dialect == "SQLite":
+                    if unit == "WEEK":
+                        amount, unit = str(int(float(amount) * 7)), "DAY"
+                    modifier = f"'{sign}{amount} {unit.lower()}s'"
+                    if base.upper() == "CURRENT_DATE":
+                        text = f"date('now', {modifier})"
+                    elif base.upper() == "CURRENT_TIMESTAMP":
+                        text = f"datetime('now', {modifier})"
+                    else:
+                        text = f"datetime({base}, {modifier})"
+                elif dialect == "MySQL":
+                    text = f"{base} {sign} INTERVAL {amount} {unit}"
+                else:
+                    text = f"DATEADD({unit.lower()}, {'-' if sign == '-' else ''}{amount}, {base})"
+                tokens[start:literal + 1] = tokenize(text)
+                i = start
+        i += 1
+
+
+def render_concatenation(tokens):
+    """a || b || c becomes CONCAT(a, b, c)."""
+    i = 0
+    while i < len(tokens):
+        if is_op(tokens[i], "||"):
+            left = prev_sig(tokens, i)
+            if left is None:
+                i += 1
+                continue
+            start = primary_before(tokens, left)
+            parts = [render(tokens[start:left + 1])]
+            end, bar = left, i
+            while bar is not None and is_op(tokens[bar], "||"):
+                first = next_sig(tokens, bar)
+                if first is None:
+                    break
+                end = primary_after(tokens, first)
+                parts.append(render(tokens[first:end + 1]))
+                bar = next_sig(tokens, end)
+            # Parentheses that only grouped the chain are no longer needed
+            before, after = prev_sig(tokens, start), next_sig(tokens, end)
+            if before is not None and after is not None and is_op(tokens[before], "(") \
+                    and closing(tokens, before) == after:
+                owner = prev_sig(tokens, before)
+                if owner is None or tokens[owner][0] not in ("word", "name") or tokens[owner][1].upper() in NON_FUNCTIONS:
+                    start, end = before, after
+            tokens[start:end + 1] = tokenize(f"CONCAT({', '.join(parts)})")
+            i = start
+        i += 1
+
+
+def render_sql_server_limits(tokens):
+    """LIMIT n becomes TOP n; with an offset or a compound query, OFFSET ... FETCH NEXT."""
+    i = 0
+    while i < len(tokens):
+        if is_word(tokens[i], "LIMIT") or (is_word(tokens[i], "OFFSET") and match_sequence(tokens, i, {"OFFSET"}, "#")):
+            levels = depths(tokens)
+            start, end = scope(tokens, levels, i)
+            limit = match_sequence(tokens, i, {"LIMIT"}, "#")
+            offset_at = next_sig(tokens, limit[1]) if limit else i
+            offset = offset_at is not None and match_sequence(tokens, offset_at, {"OFFSET"}, "#")
+            clause_end = offset[1] if offset else limit[1] if limit else i
+            words = {tokens[j][1].upper() for j in range(start, end + 1)
+                     if levels[j] == levels[i] and tokens[j][0] == "word"}
+            count = tokens[limit[1]][1] if limit else None
+            clause_start = i
+            while clause_start > start and tokens[clause_start - 1][0] == "space":
+                clause_start -= 1
+            select = next((j for j in range(start, clause_start)
+                           if levels[j] == levels[i] and is_word(tokens[j], "SELECT")), None)
+            if select is None:
+                # DELETE/UPDATE TOP ignores ORDER BY, so it would change which rows are hit
+                raise TranspileError("SQL Server cannot limit the rows of a statement other than SELECT.")
+            if count is not None and not offset and not words & {"UNION", "INTERSECT", "EXCEPT"}:
+                del tokens[clause_start:clause_end + 1]
+                after = next_sig(tokens, select)
+                if after is not None and is_word(tokens[after], "DISTINCT", "ALL"):
+                    select = after
+                # TOP takes a bare number, but a parameter only in parentheses
+                tokens[select + 1:select + 1] = tokenize(f" TOP {count}" if count != "?" else " TOP (?)")
+            else:
+                text = f"OFFSET {tokens[offset[1]][1] if offset else 0} ROWS"
+                if count is not None:
+                    text += f" FETCH NEXT {count} ROWS ONLY"
+                if "ORDER" not in words:
+                    text = "ORDER BY (SELECT NULL) " + text
+                new_tokens = tokenize(f" {text}")
+                tokens[clause_start:clause_end + 1] = new_tokens
+                i = clause_start + len(new_tokens) - 1
+        i += 1
+
+
+def render_offsets(tokens, dialect):
+    """OFFSET without LIMIT, which SQLite and MySQL reject."""
+    i = 0
+    while i < len(tokens):
+        if is_word(tokens[i], "OFFSET") and match_sequence(tokens, i, {"OFFSET"}, "#"):
+            before = prev_sig(tokens, i)
+            if before is None or not match_sequence(tokens, prev_sig(tokens, before) or 0, {"LIMIT"}, "#"):
+                new_tokens = tokenize(f"LIMIT {UNLIMITED[dialect]} OFFSET")
+                tokens[i:i + 1] = new_tokens
+                i += len(new_tokens) - 1
+        i += 1
+
+
+def extract_for(dialect):
+    def rule(args):
+        match = EXTRACT_ARGUMENT.match(args[0]) if len(args) == 1 else None
+        unit = match and date_unit(match.group(1))
+        if not unit:
+            return None
+        if dialect == "SQL Server":
+            return f"DATEPART({unit.lower()}, {match.group(2)})"
+        formats = {part: code for code, part in STRFTIME_FORMATS.items()}
+        if unit not in formats:
+            return None
+        return f"CAST(strftime('{formats[unit]}', {match.group(2)}) AS INTEGER)"
+    return rule
+
+
+def mysql_cast(args):
+    match = CAST_ARGUMENT.match(args[0]) if len(args) == 1 else None
+    type_name = match and MYSQL_CAST_TYPES.get(re.sub(r"\s*\(.*", "", match.group(2)).upper())
+    return f"CAST({match.group(1)} AS {type_name})" if type_name else None
+
+
+def render_keywords(tokens, dialect):
+    replacements = {}
+    if dialect != "PostgreSQL":
+        replacements["ILIKE"] = "LIKE"
+    if dialect == "SQL Server":
+        replacements.update({
+            "TRUE": "1", "FALSE": "0", "CURRENT_TIMESTAMP": "GETDATE()", "CURRENT_DATE": "CAST(GETDATE() AS DATE)",
+        })
+    i = 0
+    while i < len(tokens):
+        token = tokens[i]
+        replacement = replacements.get(token[1].upper()) if token[0] == "word" else None
+        before = prev_sig(tokens, i) if replacement else None
+        if replacement and not (before is not None and is_op(tokens[before], ".")):
+            new_tokens = tokenize(replacement)
+            tokens[i:i + 1] = new_tokens
+            i += len(new_tokens) - 1
+        i += 1
+
+
+def quote(name, dialect):
+    if dialect == "MySQL":
+        return "`" + name.replace("`", "``") + "`"
+    if dialect == "SQL Server":
+        return "[" + name.replace("]", "]]") + "]"
+    return '"' + name.replace('"', '""') + '"'
+
+
+def unquote(text):
+    if text.startswith("["):
+        return text[1:].rstrip("]")
+    mark = text[0]
+    return text[1:-1].replace(mark * 2, mark) if len(text) > 1 and text.endswith(mark) else text[1:]
+
+
+def render_for(tokens, dialect):
+    if dialect != "PostgreSQL":
+        render_casts(tokens)
+        render_intervals(tokens, dialect)
+        rules = {"EXTRACT": extract_for(dialect)} if dialect in ("SQLite", "SQL Server") else {}
+        if dialect == "MySQL":
+            rules["CAST"] = mysql_cast
+        rewrite_calls(tokens, rules)
+    if dialect in ("MySQL", "SQL Server"):
+        render_concatenation(tokens)
+    if dialect == "SQL Server":
+        render_sql_server_limits(tokens)
+    elif dialect in UNLIMITED:
+        render_offsets(tokens, dialect)
+    render_keywords(tokens, dialect)
+    for token in tokens:
+        if token[0] == "name":
+            token[1] = quote(unquote(token[1]), dialect)
+
+
+@lru_cache(maxsize=1024)
+def transpile(sql, dialect):
+    """Rewrite a query for one of DIALECTS."""
+    if dialect not in DIALECTS:
+        raise ValueError(f"Unknown SQL dialect: {dialect}")
+    if "```" in sql:
+        return CODE_BLOCK.sub(
+            lambda block: block.group(1) + transpile(block.group(2), dialect) + block.group(3), sql
+        )
+    tokens = tokenize(sql)
+    canonicalize(tokens)
+    render_for(tokens, dialect)
+    return render(tokens)
@@ -0,0 +1,180 @@
+"""Local validation of generated SQL, with a single targeted repair attempt.
+
+Queries are dry-run with EXPLAIN against an in-memory SQLite clone of the
+loaded schema, so nothing is executed and no data is needed.  Prompts ask
+for standard SQL, so queries are first rewritten for SQLite (transpile.py);
+INTERVAL arithmetic and EXTRACT would otherwise fail as syntax errors.  Without a
+schema only syntax is checked: unknown tables, columns and functions are
+accepted.  Results are cached by a hash of the schema and the SQL.
+"""
+import hashlib
+import re
+import sqlite3
+import threading
+from collections import OrderedDict
+
+import transpile
+from generator import build_prompt, REPAIR_TEMPLATE, FENCE_PATTERN, PROMPT_TOKEN_BUDGET, with_schema
+
+FENCED_BLOCK_PATTERN = re.compile(r"```[a-zA-Z]*\s*\n?(.*?)```", re.S)
+
+# Errors that only mean the schema is unknown, not that the SQL is malformed
+SCHEMA_ERRORS = ("no such table", "no such column", "no such function", "no such module")
+
+_CACHE_SIZE = 1000
+_CLONE_CACHE_SIZE = 8
+
+
+def extract_sql(text):
+    """Pull the SQL out of a model response: the first fenced block if any, else the whole text."""
+    if not text:
+        return ""
+    block = FENCED_BLOCK_PATTERN.search(text)
+    sql = block.group(1) if block else FENCE_PATTERN.sub("", text.strip())
+    return sql.strip()
+
+
+def split_statements(sql):
+    """Split SQL text into complete statements."""
+    statements, current = [], ""
+    # A semicolon ends a statement unless it sits inside a string, identifier or comment
+    for part in sql.split(";"):
+        current += part + ";"
+        if sqlite3.complete_statement(current):
+            statements.append(current.strip())
+            current = ""
+    if current[:-1].strip():
+        statements.append(current[:-1].strip())
+    return [statement for statement in statements if statement.strip(" \n\t;")]
+
+
+def sqlite_statements(sql):
+    """Statements of SQL as SQLite would run them; text the rewrite cannot handle is kept as is."""
+    try:
+        sql = transpile.transpile(sql, "SQLite")
+    except ValueError:
+        pass
+    return split_statements(sql)
+
+
+def clone_ddl(digest):
+    """Statements rebuilding a schema digest's tables, primary keys and indexes in SQLite."""
+    statements = []
+    for table in digest.tables.values():
+        columns = [f'"{column}" {column_type}'.strip() for column, column_type in table.columns]
+        primary_key = [column for column, _ in table.columns if column in table.primary_key]
+        if primary_key:
+            columns.append(f"PRIMARY KEY ({quoted_list(primary_key)})")
+        statements.append(f'CREATE TABLE "{table.name}" ({", ".join(columns)});')
+        known = {column for column, _ in table.columns}
+        for number, (index_columns, unique) in enumerate(table.indexes, 1):
+            # Indexes parsed from other dialects' DDL may name columns the clone does not have
+            if not known.issuperset(index_columns):
+                continue
+            statements.append(
+                f'CREATE {"UNIQUE " if unique else ""}INDEX "{table.name}_index_{number}" '
+                f'ON "{table.name}" ({quoted_list(index_columns)});'
+            )
+    return "\n".join(statements)
+
+
+def quoted_list(names):
+    return ", ".join(f'"{name}"' for name in names)
+
+
+class Validator:
+    """Dry-runs SQL against in-memory schema clones and memoizes the outcome."""
+
+    def __init__(self):
+        self._results = OrderedDict()
+        self._clones = OrderedDict()
+        self._lock = threading.Lock()
+
+    def validate(self, sql, digest=None):
+        """Return the error message for invalid SQL, or None when it is valid."""
+        key = hashlib.sha256(
+            f"{digest.schema_hash if digest else ''}\x1f{sql}".encode("utf-8")
+        ).hexdigest()
+        with self._lock:
+            if key in self._results:
+                self._results.move_to_end(key)
+                return self._results[key]
+            error = self._check(sql, digest)
+            self._results[key] = error
+            while len(self._results) > _CACHE_SIZE:
+                self._results.popitem(last=False)
+            return error
+
+    def plans(self, sql, digest=None):
+        """EXPLAIN QUERY PLAN rows (id, parent, detail) of each statement; raises sqlite3.Error."""
+        with self._lock:
+            conn = self._clone(digest)
+            return [
+                [(node_id, parent, detail) for node_id, parent, _, detail
+                 in conn.execute(f"EXPLAIN QUERY PLAN {statement}").fetchall()]
+                for statement in sqlite_statements(sql)
+            ]
+
+    def _check(self, sql, digest):
+        statements = sqlite_statements(sql)
+        if not statements:
+            return "The response contains no SQL statement."
+        conn = self._clone(digest)
+        for statement in statements:
+            if not sqlite3.complete_statement(statement):
+                statement += ";"
+            try:
+                conn.execute(f"EXPLAIN {statement}")
+            except (sqlite3.Error, sqlite3.Warning) as e:
+                message = str(e)
+                if digest is None and message.startswith(SCHEMA_ERRORS):
+                    continue
+                return message
+        return None
+
+    def _clone(self, digest):
+        key = digest.schema_hash if digest else ""
+        conn = self._clones.get(key)
+        if conn is None:
+            conn = sqlite3.connect(":memory:", check_same_thread=False)
+            if digest is not None:
+                conn.executescript(clone_ddl(digest))
+            self._clones[key] = conn
+            while len(self._clones) > _CLONE_CACHE_SIZE:
+                self._clones.popitem(last=False)[1].close()
+        self._clones.move_to_end(key)
+        return conn
+
+
+_validator = Validator()
+
+
+def validate_sql(sql, digest=None):
+    """Validate SQL with the process-wide validator; return the error message or None."""
+    return _validator.validate(sql, digest)
+
+
+def query_plans(sql, digest=None):
+    """Query plans of SQL on the process-wide validator's schema clone (see Validator.plans)."""
+    return _validator.plans(sql, digest)
+
+
+def repair_query(text, generate, digest=None, description=None, budget=PROMPT_TOKEN_BUDGET):
+    """Extract and validate a generated query, asking the model once to fix it if it fails.
+
+    generate is any callable taking a prompt and returning the response text.
+    Returns (query, error): the repaired query when the repair validates,
+    otherwise the original query and its validation error.  The query is
+    sent whole, since a shortened one cannot be fixed; the error message
+    gets whatever the query leaves of budget tokens.
+    """
+    query = extract_sql(text)
+    error = validate_sql(query, digest)
+    if error is None or generate is None:
+        return query, error
+    schema = digest.render(description) if digest is not None else ""
+    prompt = build_prompt(REPAIR_TEMPLATE, budget, keep=("query",), query=query, error=error)
+    repaired = extract_sql(generate(with_schema(prompt, schema)))
+    if repaired and validate_sql(repaired, digest) is None:
+        return repaired, None
+    return query, error